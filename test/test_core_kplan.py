@@ -0,0 +1,134 @@
+import unittest
+import vnmrjpy as vj
+import numpy as np
+import shutil
+import tempfile
+import os
+from test.util import make_fid_dir, PROCPAR_PARS
+
+vj.config['verbose']=False
+
+class Test_core_kplan(unittest.TestCase):
+
+    def setUp(self):
+
+        self.pars = dict(PROCPAR_PARS)
+        self.pars.update({'seqcon':'nccnn','ne':3})
+        # rcvrs*nv blocks, ns*ne traces, np points
+        self.data = np.random.rand(2*4,2*3,16).astype('float32')
+        self.fiddir = make_fid_dir(self.data, pars=self.pars)
+        self.addCleanup(shutil.rmtree, self.fiddir)
+
+    def test_kspace_plan(self):
+
+        varr = vj.read_fid(self.fiddir)
+        fid = vj.core.read.to_complex(varr.data)
+        plan = vj.core.kplan.get_kspace_plan(varr.pd, 1, fid.shape)
+        self.assertEqual(plan.dtype,np.dtype('int32'))
+        self.assertEqual(plan.shape,(4,8,2,3,2))
+        self.assertIs(vj.core.kplan.get_kspace_plan(varr.pd, 1, fid.shape),\
+                        plan)
+        kspace = vj.core.kplan.apply_kspace_plan(fid, plan)
+        # [rcvr, phase, slice, echo, read] -> [phase, read, slice, echo, rcvr]
+        ref = np.transpose(fid.reshape(2,4,2,3,8),(1,4,2,3,0))
+        self.assertTrue(np.array_equal(kspace,ref))
+
+    def test_kspace_plan_cache_limit(self):
+
+        self.addCleanup(vj.config.update,\
+            kspace_plan_cache_limit=vj.config['kspace_plan_cache_limit'])
+        vj.core.kplan._KSPACE_PLANS.clear()
+        fid_shape = (8,48)
+        # room for one plan of 1536 bytes
+        vj.config['kspace_plan_cache_limit'] = 2000/1024**2
+        plan = vj.core.kplan.get_kspace_plan(self.pars, 1, fid_shape)
+        self.assertEqual(plan.nbytes,1536)
+        self.assertIs(vj.core.kplan.get_kspace_plan(self.pars,1,fid_shape),\
+                        plan)
+        pars = dict(self.pars, seqcon='ncsnn')
+        vj.core.kplan.get_kspace_plan(pars, 1, fid_shape)
+        self.assertEqual(len(vj.core.kplan._KSPACE_PLANS),1)
+        self.assertIsNot(vj.core.kplan.get_kspace_plan(self.pars,1,fid_shape),\
+                        plan)
+        vj.config['kspace_plan_cache_limit'] = 0
+        vj.core.kplan._KSPACE_PLANS.clear()
+        vj.core.kplan.get_kspace_plan(self.pars, 1, fid_shape)
+        self.assertEqual(len(vj.core.kplan._KSPACE_PLANS),0)
+
+    def test_kspace_plan_interleaved(self):
+
+        self.pars['sliceorder'] = 1
+        self.pars['ns'] = 3
+        data = np.random.rand(2*4,3*3,16).astype('float32')
+        self.fiddir = make_fid_dir(data, pars=self.pars)
+        self.addCleanup(shutil.rmtree, self.fiddir)
+        varr = vj.read_fid(self.fiddir)
+        fid = vj.core.read.to_complex(varr.data)
+        plan = vj.core.kplan.get_kspace_plan(varr.pd, 1, fid.shape)
+        kspace = vj.core.kplan.apply_kspace_plan(fid, plan)
+        ref = np.transpose(fid.reshape(2,4,3,3,8),(1,4,2,3,0))
+        # acquired slice order 0,2,1
+        self.assertTrue(np.array_equal(kspace,ref[:,:,[0,2,1],...]))
+
+    def test_kspace_plan_workers(self):
+
+        varr = vj.read_fid(self.fiddir)
+        fid = vj.core.read.to_complex(varr.data)
+        plan = vj.core.kplan.get_kspace_plan(varr.pd, 1, fid.shape)
+        ref = vj.core.kplan.apply_kspace_plan(fid, plan, workers=1)
+        kspace = vj.core.kplan.apply_kspace_plan(fid, plan, workers=3)
+        self.assertTrue(np.array_equal(kspace,ref))
+
+    def test_kspace_plan_petab(self):
+
+        tablib = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tablib)
+        self.addCleanup(vj.config.update, tablib_dir=vj.config['tablib_dir'])
+        vj.config['tablib_dir'] = tablib
+        with open(tablib+'/fse4','w') as f:
+            f.write('t1 =\n'+''.join('{}\t\n'.format(i) for i in [0,-1,1,2]))
+        pd = dict(self.pars, apptype='im2Dfse', etl=2, images=1,\
+                    petable='fse4')
+        plan = vj.core.kplan.get_kspace_plan(pd, 1, (8,16))
+        self.assertIs(vj.core.kplan.get_kspace_plan(pd, 1, (8,16)),plan)
+        # the table is read when a plan is made, hits only stat the file
+        with open(tablib+'/fse4','w') as f:
+            f.write('t1 =\n'+''.join('{}\t\n'.format(i) for i in [2,1,-1,0]))
+        os.utime(tablib+'/fse4',ns=(0,0))
+        new = vj.core.kplan.get_kspace_plan(pd, 1, (8,16))
+        self.assertIsNot(new,plan)
+        # phase lines are placed by the table, shifted to positive
+        self.assertTrue(np.array_equal(new[[3,2,0,1]],plan[[1,0,2,3]]))
+
+    def test_run_parallel(self):
+
+        res = vj.core.utils.run_parallel(lambda x : x**2, range(10), workers=4)
+        self.assertEqual(res,[i**2 for i in range(10)])
+
+    def test_slice_permutation(self):
+
+        # acquired order of 5 interleaved slices is 0,2,4,1,3
+        perm = vj.core.kplan._slice_permutation(5)
+        self.assertEqual(list(np.array([0,2,4,1,3])[perm]),[0,1,2,3,4])
+        perm = vj.core.kplan._slice_permutation(4)
+        self.assertEqual(list(np.array([0,2,1,3])[perm]),[0,1,2,3])
+        self.assertEqual(list(vj.core.kplan._slice_permutation(3,False)),\
+                        [0,1,2])
+
+    def test_correct_ilepi(self):
+
+        pd = vj.core.procpar.Procpar({'sliceorder':1})
+        # [read, phase, slice, time, rcvrs], odd number of slices
+        kspace = np.arange(5)[None,None,:,None,None]*np.ones((2,2,5,1,1))
+        kspace = vj.core.epitools._correct_ilepi(kspace[:,:,[0,2,4,1,3]],pd)
+        self.assertEqual(list(kspace[0,0,:,0,0]),[0,1,2,3,4])
+
+    def test_combine_segments(self):
+
+        # [rcvrs, time, slices, nseg, pe, read]
+        kspace = np.random.rand(1,2,2,3,4,5)
+        comb = vj.core.epitools._combine_segments(kspace,'linear')
+        # segment i, line m goes to phase encode m*nseg+i
+        for (i, m) in [(0,0),(1,0),(2,3),(1,2)]:
+            self.assertTrue(np.array_equal(comb[:,:,:,m*3+i,:],\
+                                            kspace[:,:,:,i,m,:]))
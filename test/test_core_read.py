@@ -0,0 +1,298 @@
+import unittest
+import vnmrjpy as vj
+import numpy as np
+import tempfile
+import shutil
+import os
+import copy
+import threading
+import time
+from test.util import make_fid_dir, PROCPAR_PARS, EPI_PARS
+
+vj.config['verbose']=False
+
+# procpar excerpt in the format written by VnmrJ
+PROCPAR_TEXT = """sfrq 1 1 1000000000 0 0 2 1 11 1 64
+1 300.135 
+0 
+seqfil 2 2 64 0 0 2 1 0 1 64
+1 "gems"
+0 
+comment 2 2 256 0 0 2 1 0 1 64
+1 "rat brain, axial"
+0 
+tn 2 2 6 0 0 2 1 9 1 64
+1 "H1"
+3 "H1" "C13" "P31"
+te 1 1 9.999 0 1e-07 2 1 9 1 64
+3 0.005 0.01 0.02 
+0 
+filenames 2 2 256 0 0 2 1 0 1 64
+3 "a.fid"
+"b.fid"
+"c.fid"
+0 
+"""
+
+class Test_core_read(unittest.TestCase):
+
+    def setUp(self):
+
+        self.data = np.arange(8*4*16).reshape(8,4,16).astype('float32')
+        self.fiddir = self._make_fid_dir(self.data)
+
+    def _make_fid_dir(self, data, **kwargs):
+
+        fiddir = make_fid_dir(data, **kwargs)
+        self.addCleanup(shutil.rmtree, fiddir)
+        return fiddir
+
+    def test_read_fid(self):
+
+        varr = vj.read_fid(self.fiddir)
+        self.assertEqual(varr.fid_header['nblocks'],8)
+        self.assertEqual(varr.fid_header['ntraces'],4)
+        self.assertEqual(varr.pd['seqcon'],'ncsnn')
+        self.assertEqual(varr.data.dtype,np.dtype('float64'))
+        self.assertTrue(np.array_equal(varr.data,self.data.reshape(8,-1)))
+
+    def test_read_fid_mmap(self):
+
+        varr = vj.read_fid(self.fiddir, mmap=True)
+        ref = vj.read_fid(self.fiddir)
+        self.assertTrue(isinstance(varr.data.base, np.memmap))
+        self.assertFalse(varr.data.flags.writeable)
+        self.assertTrue(np.array_equal(varr.data,ref.data))
+
+    def test_read_fid_int16(self):
+
+        self.fiddir = self._make_fid_dir(self.data, ebytes=2, status=0x11)
+        varr = vj.read_fid(self.fiddir+'/fid')
+        self.assertTrue(np.array_equal(varr.data,self.data.reshape(8,-1)))
+
+    def test_read_fid_truncated(self):
+
+        self.fiddir = self._make_fid_dir(self.data[:5], nblocks=8)
+        varr = vj.read_fid(self.fiddir, mmap=True)
+        self.assertEqual(varr.data.shape,(5,4*16))
+
+    def test_read_fid_select(self):
+
+        pars = dict(PROCPAR_PARS)
+        pars['te'] = [0.005,0.01]
+        pars['rcvrs'] = 'yny'
+        self.fiddir = self._make_fid_dir(self.data, pars=pars)
+        # 2 array elements of 4 blocks, 2 receivers
+        varr = vj.read_fid(self.fiddir, array_index=1, receivers=[0])
+        self.assertTrue(np.array_equal(varr.data,\
+                        self.data[[4,6]].reshape(2,-1)))
+        self.assertEqual(varr.pd['te'],'0.01')
+        self.assertEqual(varr.pd['rcvrs'],'ynn')
+        self.assertEqual(varr.arrayed_params[0],('te',1))
+        self.assertEqual(varr.fid_header['nblocks'],2)
+        varr = vj.read_fid(self.fiddir, mmap=True, blocks=slice(2,6),\
+                            traces=[1,2])
+        self.assertTrue(isinstance(varr.data.base, np.memmap))
+        self.assertTrue(np.array_equal(varr.data,\
+                        self.data[2:6,1:3].reshape(4,-1)))
+        self.assertEqual(varr.fid_header['ntraces'],2)
+
+    def test_read_fid_select_epi(self):
+
+        # time*rcvrs*nseg blocks, slices traces, npe*read*2 points
+        data = np.arange(5*2*2*2*80).reshape(20,2,80).astype('float32')
+        self.fiddir = self._make_fid_dir(data, pars=EPI_PARS)
+        varr = vj.read_fid(self.fiddir, receivers=[1])
+        # segments are inside the receiver loop
+        blocks = [b for b in range(20) if (b//2) % 2 == 1]
+        self.assertTrue(np.array_equal(varr.data,\
+                        data[blocks].reshape(10,-1)))
+        self.assertEqual(varr.pd['rcvrs'],'ny')
+        # segments in traces, receivers are the innermost block loop
+        self.fiddir = self._make_fid_dir(data.reshape(10,4,80), pars=EPI_PARS)
+        self.assertEqual(vj.read_fid(self.fiddir, receivers=[0]).data.shape,\
+                            (5,4*80))
+        # blocks spanning receivers cannot be selected
+        self.fiddir = self._make_fid_dir(data.reshape(5,8,80), pars=EPI_PARS)
+        self.assertRaises(Exception,vj.read_fid,self.fiddir,receivers=[0])
+        pars = dict(PROCPAR_PARS, apptype='im2Dcsi')
+        self.fiddir = self._make_fid_dir(self.data, pars=pars)
+        self.assertRaises(Exception,vj.read_fid,self.fiddir,receivers=[0])
+
+    def test_read_fid_header_only(self):
+
+        varr = vj.read_fid(self.fiddir, load_data=False)
+        self.assertEqual(varr.data,None)
+        self.assertEqual(varr.fid_header['np'],16)
+
+    def test_to_complex(self):
+
+        ref = self.data[...,0::2] + 1j*self.data[...,1::2]
+        for dt in ['>f4','>i2','>i4','<f8']:
+            out = vj.core.read.to_complex(self.data.astype(dt))
+            self.assertEqual(out.dtype,np.dtype('complex64'))
+            self.assertTrue(np.array_equal(out,ref))
+        out = vj.core.read.to_complex(self.data[...,0::2],self.data[...,1::2])
+        self.assertTrue(np.array_equal(out,ref))
+
+    def test_read_fid_to_kspace(self):
+
+        # blocks are rcvrs*nv, traces are slices
+        data = np.arange(8*2*16).reshape(8,2,16)
+        self.fiddir = self._make_fid_dir(data)
+        ref = vj.read_fid(self.fiddir).to_kspace()
+        varr = vj.read_fid(self.fiddir, mmap=True).to_kspace()
+        self.assertEqual(varr.data.dtype,np.dtype('complex64'))
+        self.assertEqual(varr.data.shape,(4,8,2,1,2))
+        self.assertTrue(np.array_equal(varr.data,ref.data))
+        points = data[...,0::2] + 1j*data[...,1::2]
+        self.assertTrue(np.array_equal(np.sort(varr.data.flatten()),\
+                                        np.sort(points.flatten())))
+
+    def test_read_fid_blockheads(self):
+
+        varr = vj.read_fid(self.fiddir)
+        bh = varr.fid_blockheads
+        self.assertEqual(bh.shape,(8,))
+        self.assertTrue(np.array_equal(bh['index'],np.arange(1,9)))
+        self.assertTrue(np.array_equal(bh['ctcount'],np.arange(1,9)))
+        self.assertEqual(bh['status'][0],0x19)
+        self.assertIn('rpval',bh.dtype.names)
+        varr = vj.read_fid(self.fiddir, mmap=True, ctnorm=True, receivers=[1])
+        ref = self.data[1::2] / np.array([2,4,6,8])[:,None,None]
+        self.assertEqual(varr.data.dtype,np.dtype('float32'))
+        self.assertTrue(np.allclose(varr.data,ref.reshape(4,-1)))
+        self.assertTrue(np.array_equal(varr.fid_blockheads['index'],\
+                                        [2,4,6,8]))
+
+    def test_fidreader_blockheads(self):
+
+        reader = vj.io.FidReader(self.fiddir)
+        data, header = reader.read()
+        self.assertTrue(np.array_equal(data,self.data.reshape(8,-1)))
+        self.assertTrue(np.array_equal(reader.blockheads['index'],\
+                                        np.arange(1,9)))
+        self.assertEqual(reader.blockhead_dict['ctcount'],8)
+
+    def test_iter_fid_blocks(self):
+
+        ref = vj.core.read.to_complex(self.data.reshape(8,-1))
+        chunks = list(vj.core.read.iter_fid_blocks(self.fiddir, nblocks=3))
+        self.assertEqual([c[1].shape[0] for c in chunks],[3,3,2])
+        data = np.concatenate([c[1] for c in chunks])
+        self.assertTrue(np.array_equal(data,ref))
+        self.assertEqual(chunks[2][0]['index'][-1],8)
+
+    def test_iter_fid_blocks_follow(self):
+
+        # write the first 3 blocks, append the rest during iteration
+        fid = self.fiddir+'/fid'
+        with open(fid,'rb') as f:
+            full = f.read()
+        bbytes = (len(full)-32)//8
+        with open(fid,'wb') as f:
+            f.write(full[:32+3*bbytes])
+        def _append():
+            time.sleep(0.2)
+            with open(fid,'ab') as f:
+                f.write(full[32+3*bbytes:])
+        t = threading.Thread(target=_append)
+        t.start()
+        chunks = list(vj.core.read.iter_fid_blocks(self.fiddir, nblocks=4,\
+                        follow=True, poll=0.05, timeout=5))
+        t.join()
+        self.assertEqual([c[1].shape[0] for c in chunks],[4,4])
+        ref = vj.core.read.to_complex(self.data.reshape(8,-1))
+        self.assertTrue(np.array_equal(np.concatenate([c[1] for c in chunks]),\
+                                        ref))
+
+    def test_iter_fid(self):
+
+        pars = dict(PROCPAR_PARS)
+        pars['te'] = [0.005,0.01]
+        data = np.arange(16*2*16).reshape(16,2,16)
+        self.fiddir = self._make_fid_dir(data, pars=pars)
+        ref = vj.read_fid(self.fiddir).to_kspace()
+        elems = list(vj.core.read.iter_fid(self.fiddir))
+        self.assertEqual(len(elems),2)
+        self.assertEqual(elems[1].pd['te'],'0.01')
+        kspace = [e.to_kspace().data for e in elems]
+        self.assertTrue(np.array_equal(np.concatenate(kspace,axis=3),\
+                                        ref.data))
+        # two arrayed parameters are read as one element
+        pars['tr'] = [0.1,0.2]
+        data = np.arange(32*2*16).reshape(32,2,16)
+        self.fiddir = self._make_fid_dir(data, pars=pars)
+        elems = list(vj.core.read.iter_fid(self.fiddir))
+        self.assertEqual(len(elems),1)
+        self.assertEqual(elems[0].pd['te'],['0.005','0.01'])
+        ref = vj.core.read.to_complex(vj.read_fid(self.fiddir).data)
+        self.assertTrue(np.array_equal(elems[0].data,ref))
+
+class Test_core_read_procpar(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.procpar = self.tmpdir+'/procpar'
+        with open(self.procpar,'w') as f:
+            f.write(PROCPAR_TEXT)
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmpdir)
+        vj.config['procpar_sidecar'] = False
+
+    def test_read_procpar(self):
+
+        pd = vj.read_procpar(self.procpar)
+        self.assertEqual(pd['sfrq'],'300.135')
+        self.assertEqual(pd['seqfil'],'gems')
+        self.assertEqual(pd['comment'],'rat brain, axial')
+        self.assertEqual(pd['tn'],'H1')
+        self.assertEqual(pd['te'],['0.005','0.01','0.02'])
+        self.assertEqual(pd['filenames'],['a.fid','b.fid','c.fid'])
+        self.assertEqual(vj.io.ProcparReader(self.procpar).read(),pd)
+
+    def test_read_procpar_cache(self):
+
+        pd = vj.read_procpar(self.procpar)
+        pd['te'].append('1')
+        pd['seqfil'] = 'sems'
+        pd2 = vj.read_procpar(self.procpar)
+        self.assertEqual(pd2['te'],['0.005','0.01','0.02'])
+        self.assertEqual(pd2['seqfil'],'gems')
+        # changed file is parsed again
+        with open(self.procpar,'a') as f:
+            f.write('ns 1 1 512 1 1 2 1 0 1 64\n1 5 \n0 \n')
+        self.assertEqual(vj.read_procpar(self.procpar)['ns'],'5')
+
+    def test_read_procpar_sidecar(self):
+
+        vj.config['procpar_sidecar'] = True
+        pd = vj.read_procpar(self.procpar)
+        sidecar = self.tmpdir+'/.procpar.pickle'
+        self.assertTrue(os.path.isfile(sidecar))
+        vj.core.read._PROCPAR_CACHE.clear()
+        self.assertEqual(vj.read_procpar(self.procpar),pd)
+
+    def test_procpar_typed(self):
+
+        pd = vj.read_procpar(self.procpar)
+        self.assertTrue(isinstance(pd, vj.core.Procpar))
+        self.assertEqual(pd.getfloat('sfrq'),300.135)
+        self.assertEqual(pd.meta['te'][1],1)
+        self.assertEqual(pd.meta['te'][2],9.999)
+        te = pd.getarray('te')
+        self.assertTrue(np.allclose(te,[0.005,0.01,0.02]))
+        self.assertIs(pd.getarray('te'),te)
+        self.assertRaises(Exception, pd.getfloat, 'te')
+        pd['te'] = '0.002'
+        self.assertEqual(pd.getfloat('te'),0.002)
+        pd['nv'] = '128'
+        self.assertEqual(pd.getint('nv'),128)
+        varr = vj.varray(pd={'nv':'64'})
+        self.assertEqual(varr.pd.getint('nv'),64)
+        pd2 = copy.deepcopy(pd)
+        self.assertEqual(pd2.getint('nv'),128)
+        self.assertEqual(pd2.meta,pd.meta)
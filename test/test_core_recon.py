@@ -0,0 +1,281 @@
+import unittest
+import vnmrjpy as vj
+import numpy as np
+import shutil
+import tempfile
+from test.util import make_fid_dir, make_epi_dir
+
+vj.config['verbose']=False
+
+def _shifted_ifft(data, dims):
+    """Reference centered inverse fft with explicit shifts"""
+    data = np.fft.fftshift(data,axes=dims)
+    data = np.fft.ifftn(data,axes=dims,norm='ortho')
+    return np.fft.ifftshift(data,axes=dims)
+
+class Test_core_recon(unittest.TestCase):
+
+    def setUp(self):
+
+        self.backend = vj.config['fft_backend']
+        self.limit = vj.config['fft_memory_limit']
+        self.out_of_core = vj.config['out_of_core']
+        self.scratch_dir = vj.config['scratch_dir']
+        self.workers = vj.config['fft_workers']
+        self.epiref = vj.config['epiref']
+        shape = (8,6,5,2,2)
+        self.data = (np.random.rand(*shape)+1j*np.random.rand(*shape))\
+                    .astype('complex64')
+
+    def tearDown(self):
+
+        vj.config['fft_backend'] = self.backend
+        vj.config['fft_memory_limit'] = self.limit
+        vj.config['out_of_core'] = self.out_of_core
+        vj.config['scratch_dir'] = self.scratch_dir
+        vj.config['fft_workers'] = self.workers
+        vj.config['epiref'] = self.epiref
+
+    def test_ifft(self):
+
+        for backend in ['numpy','scipy']:
+            vj.config['fft_backend'] = backend
+            for dims in [(0,1),(1,0),(0,1,2)]:
+                ref = _shifted_ifft(self.data, dims)
+                out = vj.core.recon._ifft(self.data, dims)
+                self.assertEqual(out.dtype,np.dtype('complex64'))
+                self.assertTrue(np.allclose(out,ref,atol=1e-5))
+
+    def test_fft_inverse(self):
+
+        for dims in [(0,1),(0,1,2)]:
+            kspace = vj.core.recon._fft(self.data, dims)
+            out = vj.core.recon._ifft(kspace, dims)
+            self.assertTrue(np.allclose(out,self.data,atol=1e-5))
+
+    def test_ifft_overwrite(self):
+
+        orig = self.data.copy()
+        ref = vj.core.recon._ifft(self.data, (0,1))
+        self.assertTrue(np.array_equal(self.data,orig))
+        out = vj.core.recon._ifft(self.data, (0,1), overwrite=True)
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+
+    def test_ifft_chunked(self):
+
+        ref = vj.core.recon._ifft(self.data, (0,1))
+        # one block is 8*6*8 bytes, limit allows 3 of them
+        vj.config['fft_memory_limit'] = 3*8*6*8/1024**2
+        chunks = vj.core.recon._fft_chunks(self.data.shape,(0,1),8,3*8*6*8)
+        self.assertEqual(len(chunks),10)
+        out = vj.core.recon._ifft(self.data, (0,1))
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+        out = vj.core.recon._ifft(self.data.copy(), (0,1,2), overwrite=True)
+        self.assertTrue(np.allclose(out,_shifted_ifft(self.data,(0,1,2)),\
+                                    atol=1e-5))
+        kspace = vj.core.recon._fft(out, (0,1,2), overwrite=True)
+        self.assertIs(kspace,out)
+        self.assertTrue(np.allclose(kspace,self.data,atol=1e-5))
+
+    def test_ifft_readout_first(self):
+
+        # limit is below one volume, readout is transformed first
+        vj.config['fft_memory_limit'] = 1000/1024**2
+        ref = _shifted_ifft(self.data,(1,0,2))
+        out = vj.core.recon._ifft(self.data, (1,0,2))
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+        out = vj.core.recon._ifft(self.data.copy(), (1,0,2), overwrite=True)
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+
+    def test_ifft_parallel_blocks(self):
+
+        vj.config['fft_memory_limit'] = 1000/1024**2
+        vj.config['fft_workers'] = 3
+        ref = _shifted_ifft(self.data,(0,1))
+        out = vj.core.recon._ifft(self.data, (0,1))
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+
+    def test_hybridspace(self):
+
+        data = np.random.rand(8,2,16).astype('float32')
+        fiddir = make_fid_dir(data)
+        self.addCleanup(shutil.rmtree, fiddir)
+        kspace = vj.read_fid(fiddir).to_kspace()
+        ref = vj.read_fid(fiddir).to_kspace().to_imagespace()
+        varr = vj.read_fid(fiddir).to_hybridspace()
+        self.assertEqual(varr.vdtype,'hybridspace')
+        ro = varr.sdims.index('read')
+        hybrid = _shifted_ifft(kspace.data,(ro,))
+        self.assertTrue(np.allclose(varr.data,hybrid,atol=1e-5))
+        slabs = list(varr.iter_slabs('read'))
+        self.assertEqual(len(slabs),varr.data.shape[ro])
+        (index, slab) = slabs[1]
+        self.assertTrue(np.shares_memory(slab,varr.data))
+        self.assertTrue(np.array_equal(slab,varr.data[index]))
+        varr.to_imagespace()
+        self.assertTrue(np.allclose(varr.data,ref.data,atol=1e-5))
+        varr.to_hybridspace()
+        self.assertTrue(np.allclose(varr.data,hybrid,atol=1e-5))
+        varr.to_kspace()
+        self.assertEqual(varr.vdtype,'kspace')
+        self.assertTrue(np.allclose(varr.data,kspace.data,atol=1e-5))
+
+    def test_hybridspace_dims(self):
+
+        data = np.random.rand(8,2,16).astype('float32')
+        fiddir = make_fid_dir(data)
+        self.addCleanup(shutil.rmtree, fiddir)
+        kspace = vj.read_fid(fiddir).to_kspace()
+        ref = vj.read_fid(fiddir).to_kspace().to_imagespace()
+        (ro, pe) = (kspace.sdims.index('read'),kspace.sdims.index('phase'))
+        varr = vj.read_fid(fiddir).to_kspace().to_hybridspace(['phase'])
+        self.assertEqual(varr.hybrid_dims,['phase'])
+        hybrid = _shifted_ifft(kspace.data,(pe,))
+        self.assertTrue(np.allclose(varr.data,hybrid,atol=1e-5))
+        # only the readout is transformed further
+        varr.to_hybridspace(['read','phase'])
+        self.assertEqual(varr.vdtype,'hybridspace')
+        self.assertTrue(np.allclose(varr.data,ref.data,atol=1e-5))
+        varr.to_hybridspace(['read'])
+        hybrid = _shifted_ifft(kspace.data,(ro,))
+        self.assertTrue(np.allclose(varr.data,hybrid,atol=1e-5))
+        varr.to_imagespace()
+        self.assertIsNone(varr.hybrid_dims)
+        self.assertTrue(np.allclose(varr.data,ref.data,atol=1e-5))
+        self.assertRaises(Exception,varr.to_hybridspace,['time'])
+
+    def test_epi_navigator_hybrid(self):
+
+        # [rcvrs, time, slice, seg, phase, read] in (x, ky) space
+        shape = (2,1,2,2,5,16)
+        hybrid = (np.random.rand(*shape)+1j*np.random.rand(*shape))\
+                    .astype('complex64')
+        corr = vj.core.epitools._navigator_echo_correct(hybrid.copy(),8,4,\
+                                                        method='single')
+        self.assertEqual(corr.shape,shape)
+        # navigator echos are in phase and equal in magnitude between segments
+        nav = corr[...,:1,:]
+        self.assertTrue(np.allclose(np.angle(nav),0,atol=1e-4))
+        self.assertTrue(np.allclose(np.absolute(nav[:,:,:,:1,...]),\
+                                    np.absolute(nav[:,:,:,1:,...]),atol=1e-5))
+
+    def test_epiref_filters(self):
+
+        # [rcvrs, time, slice, seg, phase, read] in (x, ky) space
+        shape = (1,4,2,2,5,16)
+        hybrid = (np.random.rand(*shape)+1j*np.random.rand(*shape))\
+                    .astype('complex64')
+        p = {'image':['0','-2','-1','1']}
+        (stdfilt, revfilt) = vj.core.epitools.get_epiref_filters(hybrid, p)
+        self.assertEqual(stdfilt.shape,(1,1,2,2,5,16))
+        self.assertEqual(stdfilt.dtype,np.dtype('complex64'))
+        corr = vj.core.epitools._navigator_scan_correct(hybrid.copy(),p,\
+                                method='triple',filters=(stdfilt,revfilt))
+        self.assertTrue(np.allclose(corr[:,3:],hybrid[:,3:]*stdfilt))
+        self.assertTrue(np.allclose(corr[:,2:3],hybrid[:,2:3]*revfilt))
+        # even lines of the navigators are phase corrected
+        self.assertTrue(np.allclose(np.angle(corr[:,:2,...,0::2,:]),0,\
+                                    atol=1e-4))
+        # cached by key and geometry, reused for a new run
+        filters = vj.core.epitools.get_epiref_filters(hybrid, p, key='run')
+        new_run = np.random.rand(*shape).astype('complex64')
+        self.assertIs(vj.core.epitools.get_epiref_filters(new_run, p,\
+                                                    key='run'),filters)
+        self.assertIsNot(vj.core.epitools.get_epiref_filters(\
+                                    new_run[...,:8], p, key='run'),filters)
+
+    def test_iter_epi(self):
+
+        fiddir = make_epi_dir()
+        self.addCleanup(shutil.rmtree, fiddir)
+        vj.config['epiref'] = 'triple'
+        ref = vj.read_fid(fiddir).to_kspace(epiref_type='none')
+        vols = list(vj.core.epitools.iter_epi(fiddir,epiref_type='none'))
+        # reference scans are not yielded
+        self.assertEqual([i for (i, varr) in vols],[3,4])
+        for (i, varr) in vols:
+            self.assertEqual(varr.sdims,ref.sdims)
+            self.assertEqual(varr.data.shape[3],1)
+            self.assertTrue(np.allclose(varr.data[...,0,:],\
+                                        ref.data[...,i,:],atol=1e-5))
+
+    def test_out_of_core(self):
+
+        data = np.random.rand(8,2,16).astype('float32')
+        fiddir = make_fid_dir(data)
+        self.addCleanup(shutil.rmtree, fiddir)
+        scratch = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, scratch)
+        ref = vj.read_fid(fiddir).to_kspace().to_imagespace()
+        vj.config['out_of_core'] = True
+        vj.config['scratch_dir'] = scratch
+        vj.config['fft_memory_limit'] = 200/1024**2
+        varr = vj.read_fid(fiddir, mmap=True).to_kspace()
+        self.assertIsInstance(varr.data.base,np.memmap)
+        varr.to_imagespace()
+        self.assertIsInstance(varr.data.base,np.memmap)
+        self.assertTrue(np.allclose(varr.data,ref.data,atol=1e-5))
+        magn = vj.core.recon.ssos(varr.data)
+        self.assertIsInstance(magn,np.memmap)
+        self.assertTrue(np.allclose(magn,vj.core.recon.ssos(ref.data),\
+                                    atol=1e-5))
+
+    def test_to_kspace_from_imagespace(self):
+
+        data = np.random.rand(8,2,16).astype('float32')
+        fiddir = make_fid_dir(data)
+        self.addCleanup(shutil.rmtree, fiddir)
+        kspace = vj.read_fid(fiddir).to_kspace()
+        ref = kspace.data.copy()
+        kspace.to_imagespace()
+        self.assertEqual(kspace.vdtype,'imagespace')
+        kspace.to_kspace()
+        self.assertEqual(kspace.vdtype,'kspace')
+        self.assertTrue(np.allclose(kspace.data,ref,atol=1e-5))
+
+    def test_ssos(self):
+
+        ref = np.sqrt(np.sum(np.absolute(self.data)**2,axis=4))
+        out = vj.core.recon.ssos(self.data)
+        self.assertEqual(out.dtype,np.dtype('float32'))
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+        out = vj.core.recon.ssos(np.absolute(self.data),axis=4)
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+        out = vj.core.recon.ssos(np.moveaxis(self.data,4,0),axis=0)
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+
+    def test_ssos_weighted(self):
+
+        w = np.array([0.5,2.0])
+        ref = np.sqrt(np.sum(w*np.absolute(self.data)**2,axis=4))
+        out = vj.core.recon.ssos(self.data,weights=w)
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+        w = np.random.rand(*self.data.shape)
+        ref = np.sqrt(np.sum(w*np.absolute(self.data)**2,axis=4))
+        out = vj.core.recon.ssos(self.data,weights=w)
+        self.assertTrue(np.allclose(out,ref,atol=1e-5))
+
+    def test_adaptive_combine(self):
+
+        (x,y) = np.meshgrid(np.linspace(-1,1,16),np.linspace(-1,1,12),\
+                            indexing='ij')
+        sens = [2+0*x] + [np.exp(-(x-a)**2-(y-b)**2+1j*(a*x+b*y)) \
+                            for (a,b) in [(1,0),(0,1)]]
+        sens = np.stack(sens,axis=-1)[:,:,None,None,:]
+        magn = np.random.rand(16,12,4,2)+0.5
+        img = magn*np.exp(1j*np.random.rand(16,12,4,2))
+        data = (img[...,None]*sens).astype('complex64')
+        ref = img*np.sqrt(np.sum(np.absolute(sens)**2,axis=-1))
+        # voxelwise estimate is exact
+        out = vj.core.recon.adaptive_combine(data,block=1,smooth=1)
+        self.assertEqual(out.dtype,np.dtype('complex64'))
+        self.assertEqual(out.shape,(16,12,4,2))
+        self.assertTrue(np.allclose(out,ref,rtol=1e-4))
+        # downsampled estimate keeps phase, magnitude close to ssos
+        (out, s) = vj.core.recon.adaptive_combine(data,block=(4,4,1),\
+                                                    return_sens=True)
+        self.assertEqual(s.shape,data.shape)
+        err = np.absolute(out-ref)/np.absolute(ref)
+        self.assertLess(np.median(err),0.02)
+        ssos = vj.core.recon.ssos(data)
+        self.assertTrue(np.allclose(np.absolute(out),ssos,rtol=0.1))
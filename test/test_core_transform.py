@@ -0,0 +1,45 @@
+import unittest
+import vnmrjpy as vj
+import numpy as np
+import shutil
+from test.util import make_fid_dir
+
+vj.config['verbose']=False
+
+class Test_core_transform(unittest.TestCase):
+
+    def setUp(self):
+
+        data = np.random.rand(8,2,16).astype('float32')
+        self.fiddir = make_fid_dir(data)
+        self.addCleanup(shutil.rmtree, self.fiddir)
+
+    def test_lazy_to_anatomical(self):
+
+        varr = vj.read_fid(self.fiddir).to_kspace()
+        local = varr.data.copy()
+        varr.to_anatomical()
+        # transforms are pending until data is accessed
+        self.assertIsNotNone(varr._pending)
+        swap, flip = vj.core.transform._anatomical_swaps(varr.pd)
+        ref = np.moveaxis(local, [0,1,2,3,4], swap+[3,4])
+        for ax in flip:
+            ref = np.flip(ref, axis=ax)
+        self.assertEqual(varr.shape,ref.shape)
+        self.assertEqual(tuple(varr.nifti_header['dim'][1:6]),ref.shape)
+        self.assertIsNotNone(varr._pending)
+        self.assertTrue(np.array_equal(varr.data,ref))
+        self.assertIsNone(varr._pending)
+        self.assertTrue(np.shares_memory(varr.data,varr._data))
+
+    def test_lazy_flip(self):
+
+        varr = vj.read_fid(self.fiddir).to_kspace()
+        ref = varr.data.copy()
+        varr.flip_axis('read').flip_axis('phase').flip_axis('read')
+        varr._lazy_moveaxis([0,1],[1,0])
+        ref = np.moveaxis(np.flip(ref,axis=0),[0,1],[1,0])
+        self.assertTrue(np.array_equal(varr.data,ref))
+        varr.data = np.zeros(3)
+        self.assertIsNone(varr._pending)
+        self.assertEqual(varr.shape,(3,))
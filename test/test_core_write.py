@@ -1,8 +1,30 @@
 import vnmrjpy as vj
 import unittest
+import numpy as np
+import nibabel as nib
+import shutil
+import os
+from test.util import make_epi_dir
+
+vj.config['verbose']=False
 
 class Test_core_write(unittest.TestCase):
 
     def test_write_nifti(self):
 
         pass
+
+    def test_write_nifti_series(self):
+
+        fiddir = make_epi_dir()
+        self.addCleanup(shutil.rmtree, fiddir)
+        out = os.path.join(fiddir,'series.nii.gz')
+        ref = vj.read_fid(fiddir).to_kspace(epiref_type='none')
+        # image volumes, references are not written
+        ref = vj.core.recon.ssos(ref.to_imagespace().data)[...,3:]
+        volumes = vj.core.epitools.iter_epi(fiddir,epiref_type='none')
+        count = vj.core.write.write_nifti_series(volumes, out)
+        self.assertEqual(count,2)
+        img = nib.load(out)
+        self.assertEqual(img.shape,ref.shape)
+        self.assertTrue(np.allclose(img.get_fdata(),ref,atol=1e-5))
@@ -100,6 +100,49 @@ class Test_hankelutils(unittest.TestCase):
         self.assertEqual(hankel.shape,(29584,1764))
         print('Construct_2d big hankel time : {}'.format(end-start))
 
+    def test_hankel_view(self):
+
+        indata = (np.random.rand(2,12,9)+1j*np.random.rand(2,12,9))\
+                    .astype('complex64')
+        (p,q) = (5,3)
+        view = vj.aloha.hankel_view(indata,(p,q))
+        self.assertTrue(np.shares_memory(view,indata))
+        hankel = vj.aloha.construct_lvl2_hankel(indata,(p,q))
+        self.assertEqual(hankel.shape,((12-p+1)*(9-q+1),2*p*q))
+        # block k,i row and rcvr,c,a column element is indata[rcvr,i+a,k+c]
+        (k,i,rcvr,c,a) = (4,2,1,2,3)
+        self.assertEqual(hankel[k*(12-p+1)+i,rcvr*p*q+c*p+a],\
+                        indata[rcvr,i+a,k+c])
+        self.assertTrue(np.array_equal(hankel,\
+                        vj.aloha.construct_hankel(indata,{'filter_size':(p,q)})))
+        # level 1
+        hankel = vj.aloha.construct_lvl1_hankel(indata[...,0],p)
+        self.assertEqual(hankel.shape,(12-p+1,2*p))
+        self.assertEqual(hankel[3,p+2],indata[1,5,0])
+
+    def test_hankel_projector(self):
+
+        (p,q) = (5,3)
+        fiber = (np.random.rand(2,12,4)+1j*np.random.rand(2,12,4))\
+                    .astype('complex64')
+        proj = vj.aloha.get_hankel_projector(fiber.shape,(p,q))
+        self.assertIs(vj.aloha.get_hankel_projector((2,12,4),[p,q]),proj)
+        hankel = proj.construct(fiber)
+        self.assertTrue(np.array_equal(hankel,\
+                        vj.aloha.construct_lvl2_hankel(fiber,(p,q))))
+        self.assertTrue(np.allclose(proj.deconstruct(hankel),fiber))
+        # element multiplicities, time dim is shorter than 2*q-1
+        self.assertEqual(proj.weights[0,0,0],1)
+        self.assertEqual(proj.weights[0,6,1],p*2)
+        noisy = hankel + np.random.rand(*hankel.shape)
+        avg = vj.aloha.avg_lvl2_hankel(noisy.copy(),(12-p+1,p),2)
+        self.assertTrue(np.allclose(proj.project(noisy),avg,atol=1e-5))
+        # level 1
+        proj = vj.aloha.get_hankel_projector((2,12),p)
+        noisy = proj.construct(fiber[...,0]) + np.random.rand(12-p+1,2*p)
+        avg = vj.aloha.avg_lvl1_hankel(noisy.copy(),2)
+        self.assertTrue(np.allclose(proj.project(noisy),avg,atol=1e-5))
+
     def test_construct_hankel(self):
 
         rp={'rcvrs':4,'filter_size':(11,7),'virtualcoilboost':False}
@@ -26,4 +26,22 @@ class Test_Lmafit(unittest.TestCase):
         self.assertTrue(mse_end < mse_start)
         print('Starting, ending  MSE : {}, {}'.format(mse_start,mse_end))
 
+    def test_solve_warm_start(self):
 
+        fiber = (np.random.rand(2,16,8)+1j*np.random.rand(2,16,8))\
+                    .astype('complex64')
+        fiber[:,::3,:] = 0
+        hankel = vj.aloha.construct_lvl2_hankel(fiber,(5,3))
+        init_Y = np.eye(4,hankel.shape[1],dtype='complex64')
+        lmafit = vj.aloha.Lmafit(hankel,known_data=hankel,tol=1e-3,\
+                                init_Y=init_Y,rank_strategy='fixed')
+        X,Y,out = lmafit.solve(10)
+        # rank is kept at the rank of the warm start
+        self.assertEqual(X.shape[1],4)
+        self.assertEqual(Y.shape,(4,hankel.shape[1]))
+        # a seed truncated too low recovers with an adaptive rank
+        lmafit = vj.aloha.Lmafit(hankel,known_data=hankel,tol=1e-3,\
+                                init_Y=init_Y[:1],rank_strategy='increase')
+        X,Y,out = lmafit.solve(50)
+        self.assertGreater(X.shape[1],1)
+        self.assertEqual(Y.shape,(X.shape[1],hankel.shape[1]))
@@ -1,6 +1,8 @@
 import unittest
 import vnmrjpy as vj
 import numpy as np
+import shutil
+from test.util import make_fid_dir
 
 class Test_Pyramidal(unittest.TestCase):
 
@@ -17,6 +19,33 @@ class Test_Pyramidal(unittest.TestCase):
 
         self.assertEqual(kspace_fin.shape,kspace_fiber.shape)
 
+    def test_pyramidal_kt_warm_start(self):
+
+        rp = {'rcvrs':2,'fiber_shape':(2,32,12),'recontype':'k-t',\
+                'stages':3,'solver':'lmafit','virtualcoilboost':False,\
+                'filter_size':(7,5)}
+        shape = rp['fiber_shape']
+        kspace_fiber = (np.random.rand(*shape)+1j*np.random.rand(*shape))\
+                        .astype('complex64')
+        kspace_fiber[:,::3,:] = 0
+        weights = vj.aloha.make_kspace_weights(rp)
+        warm_start = {}
+        for _ in range(2):
+            kspace_fin = vj.aloha.pyramidal_kt(kspace_fiber,weights,rp,\
+                                                warm_start=warm_start)
+            self.assertEqual(kspace_fin.shape,shape)
+            self.assertTrue(np.all(np.isfinite(kspace_fin)))
+        # Lmafit Y factors of each stage, columns are 2*7*5
+        self.assertEqual(sorted(warm_start.keys()),[0,1,2])
+        self.assertEqual(warm_start[2].shape[1],70)
+        # the first stage starts cold, later ones are seeded
+        tol = vj.config['lmafit_tol']
+        self.assertIsNone(vj.aloha.pyramidal._lmafit_seed(\
+                                    warm_start,0,None,0,tol[0]))
+        seed = vj.aloha.pyramidal._lmafit_seed(warm_start,1,None,1,tol[1])
+        self.assertEqual(seed.shape[1],70)
+        self.assertLessEqual(seed.shape[0],warm_start[1].shape[0])
+
     def test_pyramidal_kxky(self):
 
         rp = {'rcvrs':4,'fiber_shape':(4,128,128),'recontype':'kx-ky',\
@@ -29,3 +58,77 @@ class Test_Pyramidal(unittest.TestCase):
         kspace_fin = vj.aloha.pyramidal_kxky(kspace_fiber,weights,rp)
 
         self.assertEqual(kspace_fin.shape,kspace_fiber.shape)
+
+    def test_aloha_recon_workers(self):
+
+        rp = {'rcvrs':2,'fiber_shape':(2,32),'recontype':'k','cs_dim':0,\
+                'ro_dim':2,'timedim':4,'stages':3,'solver':'lmafit',\
+                'virtualcoilboost':False,'filter_size':7}
+        # [rcvrs, phase, read, slice, time] with skipped phase lines
+        shape = (2,32,1,2,1)
+        kspace = (np.random.rand(*shape)+1j*np.random.rand(*shape))\
+                    .astype('complex64')
+        kspace[:,::3,...] = 0
+        fiddir = make_fid_dir(np.random.rand(8,2,16).astype('float32'))
+        self.addCleanup(shutil.rmtree, fiddir)
+        self.addCleanup(vj.config.update,\
+                        aloha_workers=vj.config['aloha_workers'])
+        ref = vj.aloha.Aloha(kspace,fiddir+'/procpar',reconpar=rp).recon()
+        vj.config['aloha_workers'] = 2
+        aloha = vj.aloha.Aloha(kspace,fiddir+'/procpar',reconpar=rp)
+        kspace_fin = aloha.recon()
+        self.assertTrue(np.allclose(kspace_fin,ref,atol=1e-5))
+        self.assertFalse(np.allclose(kspace_fin,kspace))
+
+    def test_aloha_recon_workers_warm_start(self):
+
+        rp = {'rcvrs':2,'fiber_shape':(2,32,12),'recontype':'k-t',\
+                'cs_dim':(2,3),'ro_dim':2,'timedim':4,'stages':3,\
+                'solver':'lmafit','virtualcoilboost':False,\
+                'filter_size':(7,5)}
+        shape = (2,32,2,2,12)
+        kspace = (np.random.rand(*shape)+1j*np.random.rand(*shape))\
+                    .astype('complex64')
+        kspace[:,::3,...] = 0
+        fiddir = make_fid_dir(np.random.rand(8,2,16).astype('float32'))
+        self.addCleanup(shutil.rmtree, fiddir)
+        self.addCleanup(vj.config.update,\
+                        aloha_workers=vj.config['aloha_workers'],\
+                        lmafit_warm_start=vj.config['lmafit_warm_start'])
+        vj.config['lmafit_warm_start'] = True
+        vj.config['aloha_workers'] = 1
+        aloha = vj.aloha.Aloha(kspace,fiddir+'/procpar',reconpar=rp)
+        fibers = [(slice(None),slice(None),x,slc,slice(None)) \
+                    for slc in range(2) for x in range(2)]
+        # each worker gets a contiguous run, seeded as in serial order
+        ref = aloha.kspace_cs.copy()
+        aloha._recon_fibers(ref, fibers[:2], 'pyramidal_kt')
+        aloha._recon_fibers(ref, fibers[2:], 'pyramidal_kt')
+        # a single serial pass seeds across the run boundary
+        serial = aloha.kspace_cs.copy()
+        aloha._recon_fibers(serial, fibers, 'pyramidal_kt')
+        vj.config['aloha_workers'] = 2
+        kspace_fin = aloha.recon()
+        self.assertTrue(np.allclose(kspace_fin,ref,atol=1e-5))
+        self.assertFalse(np.allclose(kspace_fin,serial,atol=1e-5))
+
+    def test_aloha_recon_angio_workers(self):
+
+        rp = {'rcvrs':2,'fiber_shape':(2,12,12),'recontype':'kx-ky_angio',\
+                'cs_dim':(1,2),'ro_dim':3,'timedim':4,'stages':1,\
+                'solver':'lmafit','virtualcoilboost':False,'filter_size':(5,5)}
+        # all slices and time points are completed in one pool
+        shape = (2,12,2,12,2)
+        kspace = (np.random.rand(*shape)+1j*np.random.rand(*shape))\
+                    .astype('complex64')
+        kspace[:,::3,...] = 0
+        fiddir = make_fid_dir(np.random.rand(8,2,16).astype('float32'))
+        self.addCleanup(shutil.rmtree, fiddir)
+        self.addCleanup(vj.config.update,\
+                        aloha_workers=vj.config['aloha_workers'])
+        ref = vj.aloha.Aloha(kspace,fiddir+'/procpar',reconpar=rp).recon()
+        vj.config['aloha_workers'] = 2
+        aloha = vj.aloha.Aloha(kspace,fiddir+'/procpar',reconpar=rp)
+        kspace_fin = aloha.recon()
+        self.assertTrue(np.allclose(kspace_fin,ref,atol=1e-5))
+        self.assertFalse(np.allclose(kspace_fin[...,1],kspace[...,1]))
@@ -0,0 +1,73 @@
+"""Synthetic fid and procpar writers shared by the tests"""
+import numpy as np
+import tempfile
+
+# minimal procpar for a 2D gems-like acquisition
+PROCPAR_PARS = {'seqfil':'gems','pslabel':'gems','seqcon':'ncsnn',\
+                'apptype':'im2D','te':0.005,'tr':0.1,'flip1':30,\
+                'mtfrq':0,'rcvrs':'yy','np':16,'nv':4,'ns':2,'nf':4,\
+                'psi':0,'phi':0,'theta':0,'orient':'trans90',\
+                'lro':2.0,'lpe':2.0,'thk':1.0,'gap':0,'sliceorder':0}
+
+def write_procpar(path, pars):
+    """Write a procpar file with real or string parameters"""
+    with open(path,'w') as f:
+        for name, val in pars.items():
+            vals = val if type(val) == list else [val]
+            if type(vals[0]) == str:
+                f.write('{} 1 2 8 0 0 2 1 0 1 64\n'.format(name))
+                f.write('{} '.format(len(vals))+\
+                        '\n'.join(['"{}"'.format(v) for v in vals])+'\n')
+            else:
+                f.write('{} 1 1 1e+18 -1e+18 0 1 1 0 1 64\n'.format(name))
+                f.write('{} '.format(len(vals))+\
+                        ' '.join([str(v) for v in vals])+' \n')
+            f.write('0 \n')
+
+def write_fid(path, data, ebytes=4, status=0x19, nblocks=None):
+    """Write a fid file from (nblocks, ntraces, np) shaped real data"""
+    nb, ntraces, npts = data.shape
+    if nblocks == None:
+        nblocks = nb
+    if ebytes == 4 and status & 0x8:
+        dt = '>f4'
+    elif ebytes == 4:
+        dt = '>i4'
+    else:
+        dt = '>i2'
+    tbytes = npts*ebytes
+    bbytes = ntraces*tbytes+28
+    header = np.array([nblocks,ntraces,npts,ebytes,tbytes,bbytes],dtype='>i4')
+    with open(path,'wb') as f:
+        f.write(header.tobytes())
+        f.write(np.array([0,status],dtype='>i2').tobytes())
+        f.write(np.array([1],dtype='>i4').tobytes())
+        for b in range(nb):
+            blockhead = np.zeros(4,dtype='>i2')
+            blockhead[1] = status
+            blockhead[2] = b+1
+            f.write(blockhead.tobytes())
+            # ctcount
+            f.write(np.array([b+1],dtype='>i4').tobytes())
+            f.write(np.zeros(4,dtype='>f4').tobytes())
+            f.write(data[b].astype(dt).tobytes())
+
+def make_fid_dir(data, pars=PROCPAR_PARS, **kwargs):
+    """Return temporary .fid directory with fid and procpar"""
+    fiddir = tempfile.mkdtemp(suffix='.fid')
+    write_procpar(fiddir+'/procpar', pars)
+    write_fid(fiddir+'/fid', data, **kwargs)
+    return fiddir
+
+# segmented epip with navigator and reference scans
+EPI_PARS = dict(PROCPAR_PARS, apptype='im2Depi', seqfil='epip',\
+                seqcon='ncnnn', navigator='n', nseg=2, etl=4, kzero=0,\
+                images=5, image=['0','-2','-1','1','1'], pescheme='l',\
+                petable='n', pro=0, nread=16, nphase=8, ns=2, np=80,\
+                cseg='n', altread='n', epiref_type='none')
+
+def make_epi_dir():
+    """Return fid directory of synthetic epip data with 2 receivers"""
+    # time*rcvrs blocks, nseg*slices traces, npe*read*2 points
+    data = np.random.rand(5*2,2*2,5*8*2).astype('float32')
+    return make_fid_dir(data, pars=EPI_PARS)
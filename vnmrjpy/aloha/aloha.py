@@ -3,8 +3,14 @@ import vnmrjpy as vj
 import timeit
 import time
 import copy
+import concurrent.futures
+import multiprocessing
+from multiprocessing import shared_memory
 import matplotlib.pyplot as plt
 
+# shared memory arrays and fiber function of aloha worker processes
+_WORKER = {}
+
 class Aloha():
     """Aloha framework for Compressed Sensing
 
@@ -182,19 +188,10 @@ class Aloha():
             print('Processing Aloha reconstruction...')
             #------------------MAIN ITERATION----------------------------    
             time = 0
-            for slc in range(self.kspace_cs.shape[3]):
-
-                for ro in range(self.kspace_cs.shape[vj.config['ro_dim']]):
-
-                    fiber3d = self.kspace_cs[:,:,ro,slc,time]
-                    fiber3d = vj.aloha.pyramidal_k(fiber3d,\
-                                                    self.weights,\
-                                                    self.rp)
-                    kspace_completed[:,:,ro,slc,time] = fiber3d
-            
-                    print('ro {}/{} slice {}/{} done.'.format(\
-                                ro+1,self.kspace_cs.shape[2],\
-                                slc+1,self.kspace_cs.shape[3]))
+            fibers = [(slice(None),slice(None),ro,slc,time) \
+                    for slc in range(self.kspace_cs.shape[3]) \
+                    for ro in range(self.kspace_cs.shape[2])]
+            self._recon_fibers(kspace_completed, fibers, 'pyramidal_k')
 
             return kspace_completed
         #------------------------------------------------------------------
@@ -203,21 +200,12 @@ class Aloha():
         if self.rp['recontype'] in ['k-t']:
             print('Processing Aloha reconstruction...')
             #------------------MAIN ITERATION----------------------------    
-            for slc in range(self.kspace_cs.shape[3]):
-
-                for x in range(self.kspace_cs.shape[self.rp['cs_dim'][0]]):
-
-                    # main call for solvers
-                    fiber3d = self.kspace_cs[:,:,x,slc,:]
-                    fiber3d = vj.aloha.pyramidal_kt(fiber3d,\
-                                                self.weights,\
-                                                self.rp,\
-                                                realtimeplot=self.realtimeplot)
-                    kspace_completed[:,:,x,slc,:] = fiber3d
-            
-                    print('slice {}/{} line {}/{} done.'.format(\
-                                slc+1,self.kspace_cs.shape[3],\
-                                x+1,self.kspace_cs.shape[2]))
+            fibers = [(slice(None),slice(None),x,slc,slice(None)) \
+                for slc in range(self.kspace_cs.shape[3]) \
+                for x in range(self.kspace_cs.shape[self.rp['cs_dim'][0]])]
+            # main call for solvers
+            self._recon_fibers(kspace_completed, fibers, 'pyramidal_kt',\
+                                realtimeplot=self.realtimeplot)
 
             return kspace_completed
         #TODO reconsider merging angio and kxky
@@ -227,44 +215,36 @@ class Aloha():
         if self.rp['recontype'] in ['kx-ky_angio']:
             print('Processing Aloha reconstruction...')
             #------------------MAIN ITERATION----------------------------    
-            for time in range(self.kspace_cs.shape[4]):
-            
-                # for testing only
-                if self.check:
-
-                    print('Filling center line only')
-                    # take center slice
-                    slc = self.kspace_cs.shape[self.rp['cs_dim'][1]]//2
-                    fiber3d = self.kspace_cs[:,:,slc,:,time]
-                    fiber3d_old = copy.copy(fiber3d)
-                    fiber3d = vj.aloha.pyramidal_kxky(fiber3d,\
-                                                self.weights,\
-                                                self.rp,\
-                                                realtimeplot=self.realtimeplot)
-                    plt.subplot(1,2,1)
-                    plt.imshow(np.absolute(fiber3d_old[1,:,:]),\
-                                            vmin=0,vmax=50,cmap='gray')
-                    plt.subplot(1,2,2)
-                    plt.imshow(np.absolute(fiber3d[1,:,:]),\
-                                            vmin=0,vmax=50,cmap='gray')
-                    plt.show()
-            
-                    print('slice {}/{} line {}/{} done.'.format(\
-                                slc+1,self.kspace_cs.shape[2],\
-                                time+1,self.kspace_cs.shape[4]))
-                    return
-
-                for slc in range(self.kspace_cs.shape[self.rp['cs_dim'][1]]):
-
-                    fiber3d = self.kspace_cs[:,:,slc,:,time]
-                    fiber3d = vj.aloha.pyramidal_kxky(fiber3d,\
-                                                    self.weights,\
-                                                    self.rp)
-                    kspace_completed[:,:,slc,:,time] = fiber3d
-            
-                    print('slice {}/{} line {}/{} done.'.format(\
-                                slc+1,self.kspace_cs.shape[2],\
-                                time+1,self.kspace_cs.shape[4]))
+            # for testing only
+            if self.check:
+
+                time = 0
+                print('Filling center line only')
+                # take center slice
+                slc = self.kspace_cs.shape[self.rp['cs_dim'][1]]//2
+                fiber3d = self.kspace_cs[:,:,slc,:,time]
+                fiber3d_old = copy.copy(fiber3d)
+                fiber3d = vj.aloha.pyramidal_kxky(fiber3d,\
+                                            self.weights,\
+                                            self.rp,\
+                                            realtimeplot=self.realtimeplot)
+                plt.subplot(1,2,1)
+                plt.imshow(np.absolute(fiber3d_old[1,:,:]),\
+                                        vmin=0,vmax=50,cmap='gray')
+                plt.subplot(1,2,2)
+                plt.imshow(np.absolute(fiber3d[1,:,:]),\
+                                        vmin=0,vmax=50,cmap='gray')
+                plt.show()
+
+                print('slice {}/{} line {}/{} done.'.format(\
+                            slc+1,self.kspace_cs.shape[2],\
+                            time+1,self.kspace_cs.shape[4]))
+                return
+
+            fibers = [(slice(None),slice(None),slc,slice(None),time) \
+                for time in range(self.kspace_cs.shape[4]) \
+                for slc in range(self.kspace_cs.shape[self.rp['cs_dim'][1]])]
+            self._recon_fibers(kspace_completed, fibers, 'pyramidal_kxky')
 
             return kspace_completed
         #------------------------------------------------------------------
@@ -273,19 +253,10 @@ class Aloha():
         if self.rp['recontype'] in ['kx-ky']:
             print('Processing Aloha reconstruction...')
             #------------------MAIN ITERATION----------------------------    
-            for time in range(self.kspace_cs.shape[4]):
-
-                for slc in range(self.kspace_cs.shape[self.rp['cs_dim'][1]]):
-
-                    fiber3d = self.kspace_cs[:,:,slc,:,time]
-                    fiber3d = vj.aloha.pyramidal_kxky(fiber3d,\
-                                                    self.weights,\
-                                                    self.rp)
-                    kspace_completed[:,:,slc,:,time] = fiber3d
-            
-                    print('slice {}/{} line {}/{} done.'.format(\
-                                slc+1,self.kspace_cs.shape[2],\
-                                time+1,self.kspace_cs.shape[4]))
+            fibers = [(slice(None),slice(None),slc,slice(None),time) \
+                for time in range(self.kspace_cs.shape[4]) \
+                for slc in range(self.kspace_cs.shape[self.rp['cs_dim'][1]])]
+            self._recon_fibers(kspace_completed, fibers, 'pyramidal_kxky')
 
             return kspace_completed
 
@@ -294,3 +265,105 @@ class Aloha():
         #------------------------------------------------------------------
         if self.rp['recontype'] in ['kx-ky-t']:
             raise(Exception('dream on...'))
+
+    def _recon_fibers(self, kspace_completed, fibers, func, **kwargs):
+        """Complete independent fibers of kspace_cs into kspace_completed
+
+        Fibers are processed serially, or distributed over a process pool
+        with 'aloha_workers' in config. In the pool kspace_cs and
+        kspace_completed are copied to shared memory arrays, the workers
+        read their fibers and write the results in place, which are then
+        copied back, so the peak memory of both arrays is doubled.
+        Workers are started by a forkserver, so scripts using the pool
+        should guard their main code with if __name__ == '__main__'.
+        Fibers are handed to the workers in chunks as they become free.
+        With 'lmafit_warm_start' in config Lmafit is seeded from the
+        previous fiber in the fiber order. The pool is then given one
+        contiguous run of fibers per worker instead, each run is completed
+        in order and starts cold, so the seeds do not depend on scheduling.
+        The first fiber of each run is not seeded, so warm started results
+        depend on 'aloha_workers' and differ from a serial recon.
+
+        Args:
+            kspace_completed -- output array, updated in place
+            fibers -- list of index tuples of fibers in kspace_cs
+            func -- name of pyramidal function in vj.aloha
+            kwargs -- passed to func
+        """
+        workers = min(vj.core.utils.get_workers(key='aloha_workers'),\
+                        len(fibers))
+        if workers <= 1:
+            if vj.config['lmafit_warm_start']:
+                kwargs['warm_start'] = {}
+            for num, index in enumerate(fibers):
+                kspace_completed[index] = getattr(vj.aloha, func)(\
+                            self.kspace_cs[index],self.weights,self.rp,**kwargs)
+                print('fiber {}/{} done.'.format(num+1,len(fibers)))
+            return kspace_completed
+        shms = [shared_memory.SharedMemory(create=True,size=arr.nbytes) \
+                for arr in (self.kspace_cs, kspace_completed)]
+        try:
+            arrays = [np.ndarray(arr.shape,dtype=arr.dtype,buffer=shm.buf) \
+                for arr, shm in zip((self.kspace_cs,kspace_completed),shms)]
+            arrays[0][...] = self.kspace_cs
+            arrays[1][...] = kspace_completed
+            spec = [(shm.name, arr.shape, arr.dtype.str) \
+                    for arr, shm in zip(arrays, shms)]
+            # numba threads of the parent are not fork safe, workers are
+            # forked from a clean server process instead
+            context = multiprocessing.get_context('forkserver')
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers,\
+                    mp_context=context,initializer=_init_fiber_worker,\
+                    initargs=(spec,func,self.weights,self.rp,kwargs,\
+                                dict(vj.config)))\
+                    as executor:
+                if vj.config['lmafit_warm_start']:
+                    runs = [fibers[run[0]:run[-1]+1] for run in \
+                            np.array_split(np.arange(len(fibers)),workers)]
+                    done = 0
+                    for run in executor.map(_recon_fiber_run, runs):
+                        done += len(run)
+                        print('fiber {}/{} done.'.format(done,len(fibers)))
+                else:
+                    chunksize = max(1, len(fibers) // (4*workers))
+                    for num, _ in enumerate(executor.map(_recon_fiber,\
+                                            fibers,chunksize=chunksize)):
+                        print('fiber {}/{} done.'.format(num+1,len(fibers)))
+            kspace_completed[...] = arrays[1]
+            del arrays
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+        return kspace_completed
+
+def _init_fiber_worker(spec, func, weights, rp, kwargs, config):
+    """Attach shared kspace arrays in an aloha worker process"""
+    vj.config.update(config)
+    shms = [shared_memory.SharedMemory(name=name) for (name, _, _) in spec]
+    _WORKER['shms'] = shms
+    _WORKER['arrays'] = [np.ndarray(shape,dtype=dtype,buffer=shm.buf) \
+                        for (_, shape, dtype), shm in zip(spec, shms)]
+    _WORKER['func'] = getattr(vj.aloha, func)
+    _WORKER['weights'] = weights
+    _WORKER['rp'] = rp
+    _WORKER['kwargs'] = kwargs
+
+def _recon_fiber(index):
+    """Complete one fiber from shared memory, in place"""
+    (kspace_cs, kspace_completed) = _WORKER['arrays']
+    kspace_completed[index] = _WORKER['func'](kspace_cs[index],\
+                                    _WORKER['weights'],_WORKER['rp'],\
+                                    **_WORKER['kwargs'])
+    return index
+
+def _recon_fiber_run(run):
+    """Complete a run of fibers in order from shared memory, in place"""
+    (kspace_cs, kspace_completed) = _WORKER['arrays']
+    warm_start = {} if vj.config['lmafit_warm_start'] else None
+    for index in run:
+        kspace_completed[index] = _WORKER['func'](kspace_cs[index],\
+                                        _WORKER['weights'],_WORKER['rp'],\
+                                        warm_start=warm_start,\
+                                        **_WORKER['kwargs'])
+    return run
@@ -37,9 +37,10 @@ class Admm():
         #U = np.matrix(U)
         #V = np.matrix(V)
         # make ankel mask out of known elmenets
-        hankel_mask = np.absolute(vj.aloha.construct_hankel(fiber_stage_known,rp))
-        hankel_mask[hankel_mask != 0] = 1
-        hankel_mask = np.array(hankel_mask,dtype='complex64')
+        known = vj.aloha.hankel_view(fiber_stage_known,rp['filter_size']) != 0
+        # column axes of the view are the last (rcvr, filter) axes
+        cols = int(np.prod(known.shape[known.ndim//2:]))
+        hankel_mask = known.reshape(-1,cols).astype('complex64')
         hankel_mask_inv = np.ones(hankel_mask.shape) - hankel_mask
 
         self.hankel_mask = hankel_mask
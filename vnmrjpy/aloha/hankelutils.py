@@ -1,16 +1,23 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import copy
+import collections
 import vnmrjpy as vj
 import numba
 #import cupy as cp
 from scipy.ndimage.filters import convolve
-from scipy.signal import fftconvolve
+from vnmrjpy.aloha.mathutils import fftconvolve
 """
 Functions for handling Hankel matrices in various ALOHA implementations
 
 """
 DTYPE = 'complex64'
+# cache of Hankel projectors, see get_hankel_projector
+_HANKEL_PROJECTORS = collections.OrderedDict()
+# Hankel view axes from sliding window axes
+#   level 1: [rcvr, i, a] -> [i, rcvr, a]
+#   level 2: [rcvr, i, k, a, c] -> [k, i, rcvr, c, a]
+_HANKEL_AXES = {1 : (1,0,2), 2 : (2,1,0,4,3)}
 
 def avg_xy_fibers(fiber_x,fiber_y,weight_x,weight_y):
     """Weighted average of same fiber completed with different weights.
@@ -50,51 +57,162 @@ def replace_zerofreq_ky(fiber,lines):
 def construct_hankel_2d(slice3d,rp):
     """Make Hankel matrix from 2d+rcvrs data
 
-    This is the old implementation
+    Same as construct_lvl2_hankel with the filter size from rp
     INPUT: slice2d_all_rcvrs : numpy.array[receivers, slice]
     OUTPUT: hankel : numpy.array (m-p)*(n-q) x p*q*rcvrs
     """
-    slice3d = np.array(slice3d, dtype='complex64')
-    # annihilating filter size
-    (p,q) = rp['filter_size']
-    # hankel m n
-    (m,n) = slice3d.shape[1:3]
-
-    for rcvr in range(slice3d.shape[0]):
-
-        slice2d = slice3d[rcvr,...]
-
-        #make inner hankel list
-        for j in range(0,n):
-            # iterate in outer hankel elements
-            for k in range(0,p):
-                # iterate inner hankel columns
-                col = np.expand_dims(slice2d[k:m-p+k+1,j],axis=1)
-                if k == 0:
-                    cols = col
-                else:
-                    cols = np.concatenate([cols,col],axis=1)
-            if j == 0:
-                hankel = np.expand_dims(cols,axis=0)
-            else:
-                hankel = np.concatenate(\
-                    [hankel, np.expand_dims(cols,axis=0)], axis=0)
-
-        # make outer hankel
-        for i in range(q):
-            #col = cp.hstack([hankel[i:n-q+i,:,:]])
-            col = np.vstack([hankel[k,:,:] for k in range(i,n-q+i+1)])
-            if i == 0:
-                cols = col
-            else:
-                cols = np.concatenate([cols,col], axis=1)
-        # concatenating along the receivers
-        if rcvr == 0:
-            hankel_full = cols
-        else:
-            hankel_full = np.concatenate([hankel_full, cols], axis=1)
+    return construct_lvl2_hankel(slice3d, rp['filter_size'])
 
-    return hankel_full
+def hankel_view(nd_data, filter_size):
+    """Return multilevel Hankel matrix of data as a zero-copy strided view
+
+    The block structure is kept in separate axes of the view. With filter
+    size p (level 1) or (p,q) (level 2) and data of shape [rcvrs, m] or
+    [rcvrs, m, n] the view has axes
+
+        level 1: [i, rcvr, a]            = nd_data[rcvr, i+a]
+        level 2: [k, i, rcvr, c, a]      = nd_data[rcvr, i+a, k+c]
+
+    so the 2D Hankel matrix is the view reshaped to (rows, columns), which
+    makes the only contiguous copy.
+
+    Args:
+        nd_data (np.ndarray) -- input data, dim 0 is the receiver dimension
+        filter_size (int or tuple) -- annihilating filter size
+    Return:
+        view (np.ndarray) -- read-only strided view of nd_data
+    """
+    nd_data = np.asarray(nd_data, dtype=DTYPE)
+    filter_size = tuple(np.atleast_1d(filter_size))
+    level = len(filter_size)
+    if level != nd_data.ndim - 1:
+        raise(Exception('Filter size does not match data dimensions'))
+    if level not in _HANKEL_AXES:
+        raise(Exception('not implemented'))
+    axes = tuple(range(1, level+1))
+    view = np.lib.stride_tricks.sliding_window_view(nd_data, filter_size,\
+                                                    axis=axes)
+    return view.transpose(_HANKEL_AXES[level])
+
+def construct_lvl1_hankel(nd_data, filter_size):
+    """Contruct Level1 Hankel matrix
+
+    Args:
+        nd_data : (np.ndarray) -- input n dimensional data. dim 0 is assumed
+                                to be the receiver dimension
+        filter_size (int) -- annihilating filter size
+
+    Returns:
+        hankel (np.ndarray(x,y)) 2D multilevel Hankel matrix
+    """
+    view = hankel_view(nd_data, filter_size)
+    return view.reshape(view.shape[0], -1)
+
+def construct_lvl2_hankel(nd_data, filter_size):
+    """Contruct Multilevel Hankel matrix
+
+    Args:
+        nd_data : (np.ndarray) -- input n dimensional data. dim 0 is assumed
+                                to be the receiver dimension
+        filter_size (tuple) -- annihilating filter size (p,q)
+
+    Returns:
+        hankel (np.ndarray(x,y)) 2D multilevel Hankel matrix
+    """
+    view = hankel_view(nd_data, filter_size)
+    return view.reshape(view.shape[0]*view.shape[1], -1)
+
+class HankelProjector():
+    """Projection of matrices onto the Hankel structure of a fiber shape
+
+    Stores the block layout and the multiplicity weights of the fiber
+    elements, so deconstruction is a scatter-add of the Hankel elements
+    followed by one multiplication, and construction is one gather. The
+    scatter-add is done for each filter offset as a shifted slice sum, which
+    is faster than a flat index bincount.
+
+    Args:
+        fiber_shape (tuple) -- fiber shape at the stage, dim 0 is rcvrs
+        filter_size (int or tuple) -- annihilating filter size
+    """
+    def __init__(self, fiber_shape, filter_size):
+
+        self.fiber_shape = tuple(fiber_shape)
+        self.filter_size = tuple(np.atleast_1d(filter_size))
+        level = len(self.filter_size)
+        if level != len(self.fiber_shape) - 1 or level not in _HANKEL_AXES:
+            raise(Exception('Filter size does not match fiber shape'))
+        self.windows = tuple(n-p+1 for (n,p) \
+                        in zip(self.fiber_shape[1:],self.filter_size))
+        window_shape = self.fiber_shape[:1] + self.windows + self.filter_size
+        self._axes = _HANKEL_AXES[level]
+        self._block_shape = tuple(window_shape[ax] for ax in self._axes)
+        rows = int(np.prod(self._block_shape[:level]))
+        self.hankel_shape = (rows, int(np.prod(window_shape))//rows)
+        # multiplicity is the product of the 1D window counts of an element
+        weights = np.ones(self.fiber_shape[1:], dtype='float32')
+        for (dim, (n,p)) in enumerate(zip(self.fiber_shape[1:],\
+                                            self.filter_size)):
+            j = np.arange(n)
+            count = np.minimum.reduce([j+1, n-j, np.full(n,min(p,n-p+1))])
+            shape = [1]*weights.ndim
+            shape[dim] = n
+            weights = weights * count.reshape(shape)
+        self.weights = np.broadcast_to(weights, self.fiber_shape)
+        self._inv_weights = 1 / self.weights
+
+    def _scatter_add(self, hankel):
+        """Return fiber of summed Hankel elements"""
+        hankel = np.asarray(hankel)
+        if hankel.shape != self.hankel_shape:
+            raise(Exception('Hankel matrix does not match projector'))
+        # [rcvr, i, (k), a, (c)]
+        blocks = hankel.reshape(self._block_shape)\
+                            .transpose(np.argsort(self._axes))
+        # accumulate in the input precision, at least complex64
+        dtype = np.result_type(hankel.dtype, DTYPE)
+        nd_data = np.zeros(self.fiber_shape, dtype=dtype)
+        for offset in np.ndindex(*self.filter_size):
+            target = tuple(slice(o, o+w) for (o,w) \
+                            in zip(offset, self.windows))
+            nd_data[(slice(None),)+target] += blocks[(Ellipsis,)+offset]
+        return nd_data
+
+    def deconstruct(self, hankel):
+        """Return fiber averaged from the Hankel matrix elements"""
+        nd_data = self._scatter_add(hankel)
+        nd_data *= self._inv_weights
+        return nd_data.astype(DTYPE, copy=False)
+
+    def construct(self, nd_data):
+        """Return Hankel matrix of the fiber"""
+        view = hankel_view(nd_data, self.filter_size)
+        return view.reshape(self.hankel_shape)
+
+    def project(self, hankel):
+        """Return the nearest Hankel structured matrix in Frobenius norm"""
+        return self.construct(self.deconstruct(hankel))
+
+def get_hankel_projector(fiber_shape, filter_size):
+    """Return cached HankelProjector for fiber shape and filter size
+
+    Args:
+        fiber_shape (tuple) -- fiber shape at the stage, dim 0 is rcvrs
+        filter_size (int or tuple) -- annihilating filter size
+    Return:
+        projector (HankelProjector)
+    """
+    key = (tuple(fiber_shape), tuple(np.atleast_1d(filter_size)))
+    if key in _HANKEL_PROJECTORS:
+        _HANKEL_PROJECTORS.move_to_end(key)
+        return _HANKEL_PROJECTORS[key]
+    projector = HankelProjector(*key)
+    cache_size = int(vj.config['hankel_projector_cache_size'])
+    if cache_size > 0:
+        _HANKEL_PROJECTORS[key] = projector
+        while len(_HANKEL_PROJECTORS) > cache_size:
+            _HANKEL_PROJECTORS.popitem(last=False)
+    return projector
 
 def lvl2_hankel_average(hankel_full,filter_shape, fiber_shape):
 
@@ -525,81 +643,15 @@ def construct_hankel(nd_data, rp, level=None,order=None):
     Returns:
         hankel (np.ndarray(x,y)) 2D multilevel Hankel matrix
     """
-    def _construct_hankel_level(block_vector, filt):
-        """Create hanekl from a vector of matrices
-
-        Args:
-            block_vector (np.ndarray) --  vector of matrices
-            filt (int)  -- filter size on dimension according to Hankel level
-        Return:
-            hankel
-        """
-        if len(block_vector.shape) == 1:
-            lvl=1
-            block_vector = np.expand_dims(block_vector,axis=-1) 
-            block_vector = np.expand_dims(block_vector,axis=-1) 
-        if len(block_vector.shape) == 3:
-            lvl=2
-        else:
-            raise(Exception('weird shape'))
-        shape_x = (block_vector.shape[0]-filt+1)*block_vector.shape[1]
-        shape_y = block_vector.shape[2]*filt
-        hankel = np.zeros((shape_x,shape_y),dtype='complex64')
-
-        row_num = block_vector.shape[0]-filt+1
-        col_num = filt
-        row_size = block_vector.shape[1]
-        col_size = block_vector.shape[2]
-        for col in range(col_num):
-
-            for row in range(row_num):
-
-                hankel[row*row_size : (row+1)*row_size,\
-                        col*col_size : (col+1)*col_size] = \
-                                            block_vector[col+row,:,:]
-
-        return hankel
-
-    nd_data = np.array(nd_data, dtype='complex64')
-
     # getting level
     if level == None: 
-        level = len(rp['filter_size'])
+        level = len(np.atleast_1d(rp['filter_size']))
 
     if level == 1:
-
-        raise(Exception('not implemented'))
+        return construct_lvl1_hankel(nd_data, rp['filter_size'])
 
     if level == 2:    
-        # annihilating filter size
-        p, q = rp['filter_size']
-        # hankel m n
-        m, n = nd_data.shape[1:]
-        #init final shape
-        shape_x = (m-p+1)*(n-q+1)
-        shape_y = p*q*nd_data.shape[0]  # concatenate along receiver dimension
-        shape_x_lvl1 = m-p+1
-        shape_y_lvl1 = p
-        shape_x_rcvr = shape_x
-        shape_y_rcvr = shape_y//nd_data.shape[0]
-        
-        hankel_rcvr = np.zeros((shape_x_rcvr,shape_y_rcvr),dtype='complex64')
-        hankel_lvl1_vec = np.zeros((n,shape_x_lvl1,shape_y_lvl1),dtype='complex64')
-        hankel = np.zeros((shape_x,shape_y),dtype='complex64')
-
-        for rcvr in range(nd_data.shape[0]):
-
-            for j in range(nd_data.shape[2]):
-               
-                #vec = [nd_data[rcvr,i,j] for i in range(nd_data.shape[1])]
-                #vec = np.array(vec)
-                vec = nd_data[rcvr,:,j]
-                hankel_lvl1 = _construct_hankel_level(vec,p)
-                hankel_lvl1_vec[j,:,:] = hankel_lvl1
-            hankel_rcvr = _construct_hankel_level(hankel_lvl1_vec,q)
-            hankel[:,rcvr*shape_y_rcvr:(rcvr+1)*shape_y_rcvr] = hankel_rcvr
-
-        return hankel
+        return construct_lvl2_hankel(nd_data, rp['filter_size'])
 
     if level == 3:
         raise(Exception('not implemented'))
@@ -607,8 +659,9 @@ def construct_hankel(nd_data, rp, level=None,order=None):
 def deconstruct_hankel(hankel,stage,rp):
     """Make the original ndarray from the multilevel Hankel matrix.
 
-    Used upon completion, and also in an ADMM averaging step
-    
+    Used upon completion, and also in an ADMM averaging step. Elements are
+    averaged with the cached HankelProjector of the stage.
+
     Args:
         hankel (np.ndarray) -- input hankel matrix
         rp (dictionary) -- recon parameters
@@ -632,123 +685,9 @@ def deconstruct_hankel(hankel,stage,rp):
         else:
             raise(Exception('not implemented'))
     
-    def _block_vector_from_col(col, height):
-        """Make vector of blocks from a higher level Hankel column"""
-
-        block_num = col.shape[0]//height
-        block_x = height
-        block_y = col.shape[1]
-        vec = np.zeros((block_num,block_x,block_y),dtype='complex64')
-        for num in range(block_num):
-            vec[num,:,:] = col[num*block_x:(1+num)*block_x,:]
-        return vec
-
-    def _deconstruct_hankel_level(hankel,m,p,factors):
-        """ Make an array of Hankel building block
-
-        This is the main local function         
-        
-        Args:
-            hankel -- 2 dim array to decompose
-            blockshape -- tuple, shape of inner matrices building up the Hankel
-        Return:
-            vec -- 3 dim array, dim 0 counts the individual blocks
-        """
-        inner_x = hankel.shape[0]//(m-p+1)
-        inner_y = hankel.shape[1]//p
-        block_vector = np.zeros((m,inner_x,inner_y),dtype='complex64')
-        for col in range(p):
-            to_add = np.zeros((m,inner_x,inner_y),dtype='complex64')
-            hankel_col = hankel[:,col*inner_y:(col+1)*inner_y]
-            vec = _block_vector_from_col(hankel_col,inner_x)
-            to_add[col:col+vec.shape[0],:,:] = vec
-            block_vector = block_vector + to_add
-        # average the lower level hankel blocks 
-        hankels_inner = _average_block_vector(block_vector,factors) 
-        return hankels_inner
-
-    def _average_block_vector(vec,factors):
-        """Return list of lover level hankels"""
-
-        if len(factors.shape) != len(vec.shape):
-            factors = factors[:,np.newaxis,np.newaxis]
-        hankels = np.divide(vec,factors)
-        return hankels
-
-    def _make_factors(n,q):
-        """Make array of Hankel block multiplicities for averaging
-
-        Args:
-            n -- kspace length in a dimension
-            q -- annihilating filter length in same dimension
-        Return:
-            factors -- np.array of lenth n
-        """
-        factors = np.zeros(n) # multiplicity of 1 block
-        ramp = [i for i in range(1,q)]
-        factors[0:len(ramp)] = ramp
-        factors[n-len(ramp):] = ramp[::-1]
-        factors[factors == 0] = q
-        return factors
-
-    # init
-    if rp['recontype'] in ['kx-ky','k-t','kx-ky_angio']:
-        level = 2
-    elif rp['recontype'] in ['k']:
-        level = 1
-    # work work 
-    if level == 1:
-
-        # subinit level
-        (rcvrs,m) = _calc_fiber_shape(stage,rp['recontype'],rp['fiber_shape'])
-        p = rp['filter_size']  # annihilating filter
-        #number of hankel hankel block columns
-        cols_rcvr_lvl2 = hankel.shape[1]//(rcvrs*p) 
-        # zeroinit final output
-        nd_data = np.zeros((rcvrs,m),dtype='complex64')        
-
-        factors_lvl1 = _make_factors(m,p) # multiplicity of 1 block
-        
-        # decompose level2
-        for rcvr in range(rcvrs):
-
-            hankel_rcvr = hankel[:,rcvr*p:(rcvr+1)*p]
-            # decompose level1
-            elements = _deconstruct_hankel_level(hankel_rcvr,m,p,factors_lvl1)
-            nd_data[rcvr,:] = elements[:,0,0]  # dim 1,2 are single
-
-        #print('nd data shape {}'.format(nd_data.shape))
-        return nd_data
-
-    elif level == 2:
-        
-        # subinit level
-        (rcvrs,m,n) = _calc_fiber_shape(stage,rp['recontype'],rp['fiber_shape'])
-        (p,q) = rp['filter_size']  # annihilating filter
-        #number of hankel hankel block columns
-        cols_rcvr_lvl2 = hankel.shape[1]//(rcvrs*p) 
-        # zeroinit final output
-        nd_data = np.zeros((rcvrs,m,n),dtype='complex64')        
-
-        factors_lvl2 = _make_factors(n,q) # multiplicity of 1 block
-        factors_lvl1 = _make_factors(m,p) # multiplicity of 1 block
-        
-        # decompose level2
-        for rcvr in range(rcvrs):
-
-            hankel_rcvr = hankel[:,rcvr*p*q:(rcvr+1)*p*q]
-            hankels_lvl1 = _deconstruct_hankel_level(hankel_rcvr,n,q,\
-                                                            factors_lvl2)
-            # decompose level1
-            for num in range(hankels_lvl1.shape[0]):
-                hank = hankels_lvl1[num,:,:]
-                elements = _deconstruct_hankel_level(hank,m,p,factors_lvl1)
-                nd_data[rcvr,:,num] = elements[:,0,0]  # dim 1,2 are single
-
-        return nd_data
-
-    elif level == 3:
-        raise(Exception('not implemented'))
-    else:
-        raise(Exception('not implemented'))
-
+    fiber_shape = _calc_fiber_shape(stage,rp['recontype'],rp['fiber_shape'])
+    # receivers from the matrix, virtual coils double them
+    rcvrs = hankel.shape[1]//int(np.prod(rp['filter_size']))
+    fiber_shape = (rcvrs,) + fiber_shape[1:]
+    projector = get_hankel_projector(fiber_shape, rp['filter_size'])
+    return projector.deconstruct(hankel)
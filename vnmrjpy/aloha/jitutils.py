@@ -98,145 +98,6 @@ def avg_lvl2_hankel(hankel_full, block_shape, rcvrs):
 
     return hankel_full
 
-@numba.njit(parallel=True)
-def _hankel_lvl1(block_vector, filt):
-    """Create inner (level1) hankel from a vector
-
-    Args:
-        block_vector (np.ndarray) --  vector of matrices
-        filt (int)  -- filter size on dimension according to Hankel level
-    Return:
-        hankel
-    """
-    block_vector = np.expand_dims(block_vector,axis=-1) 
-    block_vector = np.expand_dims(block_vector,axis=-1) 
-    
-    shape_x = (block_vector.shape[0]-filt+1)*block_vector.shape[1]
-    shape_y = block_vector.shape[2]*filt
-    hankel = np.zeros((shape_x,shape_y),numba.complex64)
-
-    row_num = block_vector.shape[0]-filt+1
-    col_num = filt
-    row_size = block_vector.shape[1]
-    col_size = block_vector.shape[2]
-    for col in numba.prange(col_num):
-
-        for row in range(row_num):
-
-            hankel[row*row_size : (row+1)*row_size,\
-                    col*col_size : (col+1)*col_size] = \
-                                        block_vector[col+row,:,:]
-
-    return hankel
-
-@numba.njit(parallel=True)
-def _hankel_lvl2(block_vector, filt):
-    """Create level2 hankel from a vector of matrices
-
-    Args:
-        block_vector (np.ndarray) --  vector of matrices
-        filt (int)  -- filter size on dimension according to Hankel level
-    Return:
-        hankel
-    """
-    shape_x = (block_vector.shape[0]-filt+1)*block_vector.shape[1]
-    shape_y = block_vector.shape[2]*filt
-    hankel = np.zeros((shape_x,shape_y),numba.complex64)
-
-    row_num = block_vector.shape[0]-filt+1
-    col_num = filt
-    row_size = block_vector.shape[1]
-    col_size = block_vector.shape[2]
-    for col in numba.prange(col_num):
-
-        for row in range(row_num):
-
-            hankel[row*row_size : (row+1)*row_size,\
-                    col*col_size : (col+1)*col_size] = \
-                                        block_vector[col+row,:,:]
-
-    return hankel
-
-@numba.njit()
-def construct_lvl1_hankel(nd_data, filter_size):
-    """Contruct Level1 Hankel matrix
-
-    Args:
-        nd_data : (np.ndarray) -- input n dimensional data. dim 0 is assumed
-                                to be the receiver dimension
-        filter_size (int) -- annihilating filter size
-
-    Returns:
-        hankel (np.ndarray(x,y)) 2D multilevel Hankel matrix
-    """
-    # annihilating filter size
-    p = filter_size
-    # hankel m n
-    m = nd_data.shape[1:][0]
-    #init final shape
-    shape_x = m-p+1
-    shape_y = p*nd_data.shape[0]  # concatenate along receiver dimension
-    shape_x_lvl1 = m-p+1
-    shape_y_lvl1 = p
-    shape_x_rcvr = shape_x
-    shape_y_rcvr = shape_y//nd_data.shape[0]
-   
-    #hankel_rcvr = np.zeros((shape_x_rcvr,shape_y_rcvr),'complex64')
-    #hankel = np.zeros((shape_x,shape_y),'complex64')
-
-    hankel_rcvr = np.zeros((shape_x_rcvr,shape_y_rcvr),numba.complex64)
-    hankel = np.zeros((shape_x,shape_y),numba.complex64)
-    
-    for rcvr in range(nd_data.shape[0]):
-
-        vec = nd_data[rcvr,:]
-        hankel_rcvr = _hankel_lvl1(vec,p)
-
-        hankel[:,rcvr*shape_y_rcvr:(rcvr+1)*shape_y_rcvr] = hankel_rcvr
-
-    return hankel
-
-@numba.njit()
-def construct_lvl2_hankel(nd_data, filter_size):
-    """Contruct Multilevel Hankel matrix
-
-    Args:
-        nd_data : (np.ndarray) -- input n dimensional data. dim 0 is assumed
-                                to be the receiver dimension
-        rp (dictionary) -- vnmrjpy aloha reconpar dictionary
-
-    Returns:
-        hankel (np.ndarray(x,y)) 2D multilevel Hankel matrix
-    """
-    # annihilating filter size
-    p, q = filter_size
-    # hankel m n
-    m, n = nd_data.shape[1:]
-    #init final shape
-    shape_x = (m-p+1)*(n-q+1)
-    shape_y = p*q*nd_data.shape[0]  # concatenate along receiver dimension
-    shape_x_lvl1 = m-p+1
-    shape_y_lvl1 = p
-    shape_x_rcvr = shape_x
-    shape_y_rcvr = shape_y//nd_data.shape[0]
-   
-    hankel_rcvr = np.zeros((shape_x_rcvr,shape_y_rcvr),numba.complex64)
-    hankel_lvl1_vec = np.zeros((n,shape_x_lvl1,shape_y_lvl1),numba.complex64)
-    hankel = np.zeros((shape_x,shape_y),numba.complex64)
-    
-    for rcvr in range(nd_data.shape[0]):
-
-        for j in range(nd_data.shape[2]):
-           
-            #vec = [nd_data[rcvr,i,j] for i in range(nd_data.shape[1])]
-            #vec = np.array(vec)
-            vec = nd_data[rcvr,:,j]
-            hankel_lvl1 = _hankel_lvl1(vec,p)
-            hankel_lvl1_vec[j,:,:] = hankel_lvl1
-        hankel_rcvr = _hankel_lvl2(hankel_lvl1_vec,q)
-        hankel[:,rcvr*shape_y_rcvr:(rcvr+1)*shape_y_rcvr] = hankel_rcvr
-
-    return hankel
 #---------------------------------SLOOWWWWWWWW----------------------------
 @numba.njit()
 def deconstruct_lvl2_hankel(hankel,stage,recontype_int,fiber_shape,filter_size):
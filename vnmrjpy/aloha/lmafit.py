@@ -14,6 +14,7 @@ class Lmafit():
                 known_data='NOT GIVEN',\
                 tol=None,\
                 k=None,\
+                init_Y=None,\
                 rank_strategy=None,\
                 verbose=False,\
                 realtimeplot=False):
@@ -25,7 +26,10 @@ class Lmafit():
             known_data (np.ndarray) : matrix of the same shape as init_data 
                     with only the known elements, rest are zero
             tol (float) : tolerance of fitting
-            rank_strategy (str) : increase or decrease rank
+            init_Y (np.ndarray) : warm start row factor (k,n), eg.: Y of a
+                    similar solved problem. Overrides the start rank k,
+                    which is then adjusted by rank_strategy
+            rank_strategy (str) : increase or decrease rank, or 'fixed'
 
             verbose
             realtimeplot
@@ -53,8 +57,14 @@ class Lmafit():
         Z = init_data
         #X = np.matrix(np.zeros((m,k),dtype='complex64'))
         #TODO check removed matrix ok
+        if init_Y is not None:
+            if init_Y.shape[1] != n:
+                raise(Exception('Warm start Y does not match init_data'))
+            k = init_Y.shape[0]
+            Y = np.array(init_Y,dtype='complex64')
+        else:
+            Y = np.eye(k,n,dtype='complex64')
         X = np.zeros((m,k),dtype='complex64')
-        Y = np.eye(k,n,dtype='complex64')
         Res = np.multiply(init_data,datamask) - known_data
         res = datanrm
         reschg_tol = 0.5*tol
@@ -175,8 +185,11 @@ class Lmafit():
                     print('Stopping crit achieved')
                 break
 
-            # rank adjustment
-            rankadjust = rank_check(R,reschg,tol)
+            # rank adjustment, a 'fixed' rank is kept
+            if rank_strategy == 'fixed':
+                rankadjust = 'stay'
+            else:
+                rankadjust = rank_check(R,reschg,tol)
             if rankadjust == 'increase':
                 X,Y,Z = increase_rank(X,Y,Z,rank_incr,rank_max)
 
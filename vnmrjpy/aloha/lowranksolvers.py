@@ -263,16 +263,14 @@ def admm(U,V,fiber_stage_known,stage,rp,\
     if hankel_level == 2:
         hankel_orig_part = vj.aloha.construct_lvl2_hankel(\
                                         fiber_orig_part,rp['filter_size'])
-        hankel_mask = np.absolute(vj.aloha.construct_lvl2_hankel(\
-                                        fiber_stage_known,rp['filter_size']))
     elif hankel_level == 1:
         hankel_orig_part = vj.aloha.construct_lvl1_hankel(\
                                         fiber_orig_part,rp['filter_size'])
-        hankel_mask = np.absolute(vj.aloha.construct_lvl1_hankel(\
-                                        fiber_stage_known,rp['filter_size']))
-    #hankel_mask = np.absolute(vj.aloha.construct_hankel(fiber_stage_known,rp))
-    hankel_mask[hankel_mask != 0] = 1
-    hankel_mask = np.array(hankel_mask,dtype='complex64')  # where data is unknown
+    # cached index maps for averaging onto the Hankel structure
+    projector = vj.aloha.get_hankel_projector(fiber_shape,rp['filter_size'])
+    # mask of known elements from the strided view, without a complex copy
+    known = vj.aloha.hankel_view(fiber_stage_known,rp['filter_size']) != 0
+    hankel_mask = known.reshape(hankel_orig_part.shape).astype('complex64')
     hankel_mask_inv = np.ones(hankel_mask.shape) - hankel_mask
 
     hankel0 = U.dot(V.conj().T)
@@ -302,10 +300,7 @@ def admm(U,V,fiber_stage_known,stage,rp,\
     
         #start = time.time()
         # average the hankel structure, and put back original elements
-        if hankel_level == 2:
-            hankel = vj.aloha.avg_lvl2_hankel(hankel,hankel_block_shape,rcvrs)
-        elif hankel_level == 1:
-            hankel = vj.aloha.avg_lvl1_hankel(hankel,rcvrs)
+        hankel = projector.project(hankel)
 
         #print('admm hankel shape {}'.format(hankel.shape))
         hankel = np.multiply(hankel,hankel_mask_inv) + hankel_orig_part
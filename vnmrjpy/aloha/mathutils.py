@@ -9,6 +9,8 @@ from numpy import (arange, array, asarray, atleast_1d, intc, integer,
                    isscalar, issubdtype, take, unique, where)
 
 import numpy as np
+from bisect import bisect_left
+import vnmrjpy as vj
 
 
 def fftconvolve(in1, in2, mode="full", axes=None):
@@ -92,26 +94,16 @@ def fftconvolve(in1, in2, mode="full", axes=None):
     # Speed up FFT by padding to optimal size for FFTPACK
     fshape = [next_fast_len(d) for d in shape[axes]]
     fslice = tuple([slice(sz) for sz in shape])
-    # Pre-1.9 NumPy FFT routines are not threadsafe.  For older NumPys, make
-    # sure we only call rfftn/irfftn from one thread at a time.
-    if not complex_result and (_rfft_mt_safe or _rfft_lock.acquire(False)):
-        try:
-            sp1 = np.fft.rfftn(in1, fshape, axes=axes)
-            sp2 = np.fft.rfftn(in2, fshape, axes=axes)
-            ret = np.fft.irfftn(sp1 * sp2, fshape, axes=axes)[fslice].copy()
-        finally:
-            if not _rfft_mt_safe:
-                _rfft_lock.release()
+    # FFTs go through the vnmrjpy backend set by 'fft_backend' in config
+    if not complex_result:
+        sp1 = vj.core.recon._rfftn(in1, fshape, axes=axes)
+        sp2 = vj.core.recon._rfftn(in2, fshape, axes=axes)
+        ret = vj.core.recon._irfftn(sp1 * sp2, fshape, axes=axes)[fslice].copy()
     else:
-        # If we're here, it's either because we need a complex result, or we
-        # failed to acquire _rfft_lock (meaning rfftn isn't threadsafe and
-        # is already in use by another thread).  In either case, use the
-        # (threadsafe but slower) SciPy complex-FFT routines instead.
-        sp1 = fftpack.fftn(in1, fshape, axes=axes)
-        sp2 = fftpack.fftn(in2, fshape, axes=axes)
-        ret = fftpack.ifftn(sp1 * sp2, axes=axes)[fslice].copy()
-        if not complex_result:
-            ret = ret.real
+        sp1 = vj.core.recon._backend_fft('fftn', in1, s=fshape, axes=axes)
+        sp2 = vj.core.recon._backend_fft('fftn', in2, s=fshape, axes=axes)
+        ret = vj.core.recon._ifftn(sp1 * sp2, axes=axes, overwrite=True)
+        ret = ret[fslice].copy()
 
     if mode == "full":
         return ret
@@ -125,6 +117,15 @@ def fftconvolve(in1, in2, mode="full", axes=None):
         raise ValueError("acceptable mode flags are 'valid',"
 " 'same', or 'full'")
 
+def _centered(arr, newshape):
+    """Return the center newshape portion of the array"""
+    newshape = np.asarray(newshape)
+    currshape = np.array(arr.shape)
+    startind = (currshape - newshape) // 2
+    endind = startind + newshape
+    myslice = [slice(startind[k], endind[k]) for k in range(len(endind))]
+    return arr[tuple(myslice)]
+
 def _init_nd_shape_and_axes(x, shape, axes):
     """Handle shape and axes arguments for n-dimensional transforms.
     Returns the shape and axes in a standard form, taking into account negative
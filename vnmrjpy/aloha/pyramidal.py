@@ -6,7 +6,8 @@ import matplotlib.pyplot as plt
 import time
 
 def pyramidal_k(kspace_fiber,weights,rp,\
-                    realtimeplot=False):
+                    realtimeplot=False,\
+                    warm_start=None):
     """ Pyramidal decomposition composit function for single k sparsity case.
 
     Main Aloha unit.
@@ -18,10 +19,14 @@ def pyramidal_k(kspace_fiber,weights,rp,\
         kspace_fiber
         weights
         rp
+        warm_start (dict) -- Lmafit Y factors by weighting, used as warm
+                start and updated in place. Pass the same dict for
+                neighbouring fibers, None is a cold start at every stage
     Return:
         kspace_fiber_complete
     """
     kspace_fiber_complete = copy.deepcopy(kspace_fiber)
+    prev_Y = None
     if rp['stages'] == 3:
         lmafit_tolerance = vj.config['lmafit_tol']
     else:
@@ -47,8 +52,12 @@ def pyramidal_k(kspace_fiber,weights,rp,\
                                     known_data=hankel_known,\
                                     verbose=False,\
                                     realtimeplot=realtimeplot,\
-                                    tol=lmafit_tolerance[s])
+                                    tol=lmafit_tolerance[s],\
+                                    init_Y=_lmafit_seed(warm_start,s,prev_Y,\
+                                            s,lmafit_tolerance[s]))
             X,Y,obj = lmafit.solve(max_iter=200)
+            if warm_start is not None:
+                warm_start[s] = prev_Y = Y
             hankel = vj.aloha.lowranksolvers.admm(X,\
                                                 Y.conj().T,\
                                                 fiber_known,\
@@ -65,7 +74,8 @@ def pyramidal_k(kspace_fiber,weights,rp,\
     return kspace_fiber_complete
 
 def pyramidal_kxky(kspace_fiber,weights,rp,\
-                    realtimeplot=False):
+                    realtimeplot=False,\
+                    warm_start=None):
     """ Pyramidal decomposition composit function for kx-ky sparsity case.
 
     Main Aloha unit.
@@ -77,10 +87,14 @@ def pyramidal_kxky(kspace_fiber,weights,rp,\
         kspace_fiber
         weights
         rp
+        warm_start (dict) -- Lmafit Y factors by weighting, used as warm
+                start and updated in place. Pass the same dict for
+                neighbouring fibers, None is a cold start at every stage
     Return:
         kspace_fiber_complete
     """
     kspace_fiber_complete = copy.deepcopy(kspace_fiber)
+    prev_Y = None
     if rp['stages'] == 3:
         lmafit_tolerance = vj.config['lmafit_tol']
     #TODO ugly hack correct this....
@@ -111,8 +125,12 @@ def pyramidal_kxky(kspace_fiber,weights,rp,\
                                         known_data=hankel_known,\
                                         verbose=False,\
                                         realtimeplot=realtimeplot,\
-                                        tol=lmafit_tolerance[s])
+                                        tol=lmafit_tolerance[s],\
+                                        init_Y=_lmafit_seed(warm_start,\
+                                        2*s+i,prev_Y,s,lmafit_tolerance[s]))
                 X,Y,obj = lmafit.solve(max_iter=500)
+                if warm_start is not None:
+                    warm_start[2*s+i] = prev_Y = Y
                 print('lmafit ready')
                 hankel = vj.aloha.lowranksolvers.admm(X,\
                                                     Y.conj().T,\
@@ -140,7 +158,8 @@ def pyramidal_kxky(kspace_fiber,weights,rp,\
             
 
 def pyramidal_kt(kspace_fiber,weights,rp,\
-                    realtimeplot=False):
+                    realtimeplot=False,\
+                    warm_start=None):
     """ Pyramidal decomposition composit function for k-t sparsity.
 
     Main Aloha unit.
@@ -152,10 +171,14 @@ def pyramidal_kt(kspace_fiber,weights,rp,\
         kspace_fiber
         weights
         rp
+        warm_start (dict) -- Lmafit Y factors by weighting, used as warm
+                start and updated in place. Pass the same dict for
+                neighbouring fibers, None is a cold start at every stage
     Return:
         kspace_fiber_complete
     """
     kspace_fiber_complete = copy.deepcopy(kspace_fiber)
+    prev_Y = None
     if rp['stages'] == 3:
         lmafit_tolerance = vj.config['lmafit_tol']
     else:
@@ -180,8 +203,12 @@ def pyramidal_kt(kspace_fiber,weights,rp,\
                                     known_data=hankel_known,\
                                     verbose=False,\
                                     realtimeplot=realtimeplot,\
-                                    tol=lmafit_tolerance[s])
+                                    tol=lmafit_tolerance[s],\
+                                    init_Y=_lmafit_seed(warm_start,s,prev_Y,\
+                                            s,lmafit_tolerance[s]))
             X,Y,obj = lmafit.solve(max_iter=500)
+            if warm_start is not None:
+                warm_start[s] = prev_Y = Y
             """ old
             admm = vj.aloha.Admm(X,Y.conj().T,fiber_known, s,rp,\
                                     realtimeplot=False)
@@ -202,6 +229,24 @@ def pyramidal_kt(kspace_fiber,weights,rp,\
     return kspace_fiber_complete
             
 
+def _lmafit_seed(warm_start, key, prev_Y, stage, tol):
+    """Return Lmafit warm start Y of a weighting, or None for cold start
+
+    The same weighting of the previous fiber is preferred, then the
+    previous stage of the current fiber. The seed is truncated to the
+    singular vectors above 10*tol of the largest, which sets the Lmafit
+    rank. The first stage starts cold, at its coarse tolerance the seed
+    rank would be too low to complete the matrix.
+    """
+    if warm_start is None or stage == 0:
+        return None
+    Y = warm_start.get(key, prev_Y)
+    if Y is None:
+        return None
+    (_, sv, vh) = np.linalg.svd(Y, full_matrices=False)
+    rank = max(1, int(np.sum(sv > 10*tol*sv[0])))
+    return vh[:rank]
+
 # deprecated-------------------------------------------------------------------
 def pyramidal_solve_kt(slice3d,\
                     slice3d_orig,\
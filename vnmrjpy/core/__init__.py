@@ -1,4 +1,5 @@
 from .varray import *
+from .procpar import *
 from .read import *
 from .write import *
 from .utils import*
@@ -8,3 +9,4 @@ from .transform import *
 from .epitools import *
 from .fit import *
 from .xrecon import *
+from . import kplan
@@ -1,14 +1,227 @@
 import vnmrjpy as vj
 import numpy as np
-import matplotlib.pyplot as plt
+import collections
 import copy
+import functools
+import os
 import warnings
+from vnmrjpy.core.utils import vprint
 """
 Collection of helper functions for epi and epip k-space formation, ghost
 correction, fieldmap correction and general preprocessing dealing with kspace.
+
+Ghost and navigator corrections work in hybrid (x, ky) space, where only the
+readout is transformed. The caller transforms once into hybrid space with
+vj.core.recon._ifft along readout and once back with vj.core.recon._fft.
+Reference scan filters are computed once per receiver, slice and segment,
+and can be cached by geometry, see get_epiref_filters.
 """
-def _navigator_scan_correct(kspace, p, method='default'):
-    """Correct epi kspace with reference images
+# cache of reference scan filters, see get_epiref_filters
+_EPIREF_FILTERS = collections.OrderedDict()
+
+def iter_epi(fid, procpar=None, epiref_type='default', epiref_key=None,\
+                follow=False, poll=1.0, timeout=60):
+    """Yield reconstructed epi volumes one repetition at a time
+
+    Only the fid blocks of one repetition are read and corrected at a time,
+    so long time series are made in constant memory. Reference scans
+    (image = 0, -2, -1) are consumed for the corrections and are not
+    yielded, the reference filters are made once per array element, see
+    get_epiref_filters. References should precede the image volumes, as
+    they do in the vnmrj 'image' parameter.
+
+    Args:
+        fid -- path to .fid directory
+        procpar -- path to procpar file, defaults to the one in fid directory
+        epiref_type -- reference correction method, see varray.to_kspace
+        epiref_key -- key to cache the reference filters by geometry
+        follow, poll, timeout -- see vj.core.read.iter_fid_blocks
+    Yield:
+        (index, varr) -- index of the volume in the full time series and
+                    vj.varray of the k-space volume, with time dimension 1
+    """
+    if os.path.isdir(fid):
+        fid_path = fid
+        fid = str(fid)+'/fid'
+    else:
+        fid_path = os.path.dirname(fid)
+    if procpar == None:
+        procpar = os.path.join(fid_path,'procpar')
+    pd = vj.core.read.read_procpar(procpar)
+    header_dict = vj.core.read._wait_fid_header(fid, follow, poll, timeout)
+    geom = _epi_geometry(pd)
+    if pd['seqcon'] != 'ncnnn':
+        raise(Exception('This seqcon not implemented in epip'))
+    if int(header_dict['np']) != int(geom['npe']*geom['read']*2):
+        raise Exception("np and kspace format doesn't match")
+    # repetitions are the outermost loop in the blocks of an array element
+    volume = geom['rcvrs']*geom['nseg']*geom['slices']*geom['npe']\
+                *geom['read']
+    (nblocks, rem) = divmod(volume, header_dict['ntraces']*\
+                            header_dict['np']//2)
+    if rem != 0:
+        raise(Exception('Epi repetitions do not fill whole fid blocks'))
+    arrayed = [l for (par,l) in vj.core.read._get_arrayed_par_length(pd) \
+                if l > 1]
+    array_length = arrayed[0] if len(arrayed) == 1 else 1
+    # method resolution is the same as in to_kspace
+    navmethod = vj.config['epiref']
+    if navmethod == 'default':
+        navmethod = pd['epiref_type']
+    refmethod = pd['epiref_type'] if epiref_type == 'default' else epiref_type
+    image = [str(x) for x in pd['image']]
+    blocks = vj.core.read.iter_fid_blocks(fid, nblocks=nblocks, follow=follow,\
+                                        poll=poll, timeout=timeout)
+    for (num, (blockheads, data)) in enumerate(blocks):
+        if data.shape[0] < nblocks:
+            vprint('incomplete epi volume {}, stopping'.format(num))
+            return
+        (i, t) = divmod(num, geom['time'])
+        if t == 0:
+            # new array element
+            (refs, filters, ref_kspace) = ({}, None, None)
+            elem_pd = copy.deepcopy(pd)
+            if array_length > 1:
+                vj.core.read._select_fid_blocks(dict(header_dict), elem_pd,\
+                                                array_index=i)
+        label = image[t]
+        hybrid = _epi_to_hybrid(_epi_preshape(data, geom, time=1))
+        if label in ['0','-2']:
+            # navigator scans are only used for the filters
+            refs[label] = hybrid
+            if navmethod in ['triple','fulltriple'] and len(refs) == 2:
+                key = None if epiref_key is None else (epiref_key, i)
+                navs = np.concatenate([refs['0'],refs['-2']],axis=1)
+                filters = get_epiref_filters(navs,{'image':['0','-2']},key=key)
+            continue
+        if navmethod in ['triple','fulltriple']:
+            if filters is None:
+                raise(Exception('Navigator scans must precede image volumes'))
+            hybrid = _apply_epiref_filters(hybrid, {'image':[label]}, filters)
+        elif navmethod != 'none':
+            raise(Exception('Incorrect method specification'))
+        kspace = _epi_from_hybrid(hybrid, elem_pd, geom)
+        if refmethod in ['triple','fulltriple']:
+            if label == '-1':
+                ref_kspace = kspace
+                continue
+            elif ref_kspace is None:
+                raise(Exception('Reference scan must precede image volumes'))
+            kspace = np.concatenate([ref_kspace,kspace],axis=3)
+            kspace = _refcorrect(kspace,{'image':['-1','1']},method=refmethod)
+        elif label == '-1':
+            continue
+        varr = vj.varray(data=kspace,pd=elem_pd,fid_header=header_dict,\
+                        source='fid',dtype=vj.DTYPE,seqcon=elem_pd['seqcon'],\
+                        apptype=elem_pd['apptype'],vdtype='kspace',\
+                        arrayed_params=vj.core.read.\
+                                    _get_arrayed_par_length(elem_pd),\
+                        fid_path=fid_path,fid_blockheads=blockheads,\
+                        is_kspace_complete=True)
+        varr.to_local()
+        if vj.config['default_space'] == 'anatomical':
+            varr.to_anatomical()
+        yield (num, varr)
+
+def _epi_geometry(p):
+    """Return dictionary of epi acquisition sizes from procpar"""
+    # count navigator echos, also there is a unused one
+    if p['navigator'] == 'y':
+        pluspe = 1 + p.getint('nnav')  # navigator echo + unused
+    else:
+        pluspe = 1  # unused only
+    etl = p.getint('etl')  # echo train length
+    # getting phase encode scheme
+    if p['pescheme'] == 'l':
+        pescheme = 'linear'
+    elif p['pescheme'] == 'c':
+        pescheme = 'centric'
+    else:
+        pescheme = None
+    if p.getint('pro') != 0:
+        read = p.getint('nread')
+    else:
+        read = p.getint('nread')//2
+    return {'rcvrs' : int(p['rcvrs'].count('y')),\
+            'time' : len(p['image']),\
+            'nseg' : p.getint('nseg'),\
+            'slices' : p.getint('ns'),\
+            'etl' : etl,\
+            'npe' : etl + pluspe,\
+            'read' : read,\
+            'phase' : p.getint('nphase'),\
+            'pescheme' : pescheme}
+
+def _epi_preshape(data, geom, time=None):
+    """Reshape fid blocks to [time, rcvrs, nseg, slices, npe, read]"""
+    time = geom['time'] if time is None else time
+    preshape = (time, geom['rcvrs'], geom['nseg'], geom['slices'],\
+                geom['npe'], geom['read'])
+    return np.reshape(data, preshape, order='c')
+
+def _epi_to_hybrid(kspace):
+    """Return hybrid space [rcvrs, time, slices, nseg, npe, read] data
+
+    Odd echos are reversed, then the readout is transformed once.
+    """
+    # utility swaps...
+    kspace = np.swapaxes(kspace, 2,3)
+    kspace = np.swapaxes(kspace, 0,1)
+    # reverse odd readout lines
+    kspace = _reverse_odd(kspace, read_dim=5, phase_dim=4)
+    return vj.core.recon._ifft(kspace,(5,))
+
+def _epi_from_hybrid(hybrid, p, geom):
+    """Return epi k-space [read, phase, slice, time, rcvrs] from hybrid space
+
+    Navigator echo correction is done before the readout is transformed
+    back. Removing navigator echos, zerofilling, combining segments and
+    reordering slices is then a single gather by a cached index plan.
+    """
+    # navigator correct
+    # this is for intersegment, and additional ghost corr
+    kspace = _navigator_echo_correct(hybrid,geom['npe'],geom['etl'],\
+                                    method='single')
+    kspace = vj.core.recon._fft(kspace,(5,),overwrite=True)
+    plan = _epi_plan(kspace.shape, geom['etl'], geom['phase'],\
+                    geom['pescheme'], p.getint('sliceorder') == 1)
+    return vj.core.kplan.apply_kspace_plan(kspace, plan, workers=1)
+
+@functools.lru_cache(maxsize=16)
+def _epi_plan(shape, etl, phase, pescheme, interleaved):
+    """Return read-only gather plan from corrected epi data to k-space
+
+    The plan is made by applying the reordering steps on an index array.
+
+    Args:
+        shape -- shape of data [rcvrs, time, slices, nseg, npe, read]
+        etl -- echo train length
+        phase -- final number of phase encodes
+        pescheme -- 'linear' or 'centric'
+        interleaved -- True if slices were acquired interleaved
+    Return:
+        plan -- index array of k-space [read, phase, slice, time, rcvrs]
+                shape, -1 where k-space is zerofilled
+    """
+    size = int(np.prod(shape))
+    index = np.arange(size, dtype=vj.core.kplan._index_dtype(size))
+    index = _remove_navigator_echos(index.reshape(shape),etl)
+    index = _zerofill(index, phase, shape[3], fill=-1)
+    # start combining segments
+    index = _combine_segments(index,pescheme)
+    # reshape to [read,phase,slice,time,rcvrs]
+    index = _reshape_stdepi(index)
+    # correct for interleaved slices
+    if interleaved:
+        index = vj.core.kplan._permute(index, \
+                    vj.core.kplan._slice_permutation(index.shape[2]), 2)
+    plan = np.ascontiguousarray(index)
+    plan.flags.writeable = False
+    return plan
+
+def _navigator_scan_correct(kspace, p, method='default', filters=None,\
+                            key=None):
+    """Correct epi hybrid space data with reference images
 
     Corrects phases with the navigator scans after the readout reversal,
     but does not apply the additional triple reference scheme.
@@ -21,15 +234,20 @@ def _navigator_scan_correct(kspace, p, method='default'):
     1998, Springer
 
     Args:
-        kspace -- kspace, including reference scans. dimensions:
+        kspace -- hybrid space data with readout transformed, including
+                  reference scans. dimensions:
 
                     [rcvrs, time, slice, seg, phase, read]
 
         p -- procpar dictionary
         method -- specificator string, method specified here takes
                   priority over the one in config file
+        filters -- (stdfilt, revfilt) from get_epiref_filters, made from
+                   the reference scans in kspace if None
+        key -- filter cache key passed to get_epiref_filters
     Return:
-        kspace -- navigator scan corrected kspace with same dims as input
+        kspace -- navigator scan corrected hybrid space data with same dims
+                  as input
     """
     # init
     if method == 'default':
@@ -41,69 +259,9 @@ def _navigator_scan_correct(kspace, p, method='default'):
     # default vnmrj-like correction
     elif method == 'triple' or method == 'fulltriple':
 
-        # check if data is eligible for this correction
-        if (int(p['image'][0]) != 0 and
-            int(p['image'][1]) != -2):
-            raise(Exception('Navigator scans not found. Quitting.'))
-        shape = kspace.shape
-        # phase correction of non-phase-encoded navgator scans
-        ind = p['image'].index('0')
-        stdrofilt = _phasefilter(kspace[:,ind:ind+1,...],shape)
-        stdromtffilt = _mtffilter(kspace[:,ind:ind+1,...],shape)
-        # phase ccorrection for reverse-readout navigator scan
-        ind = p['image'].index('-2')
-        revrofilt = _phasefilter(kspace[:,ind:ind+1,...],shape)
-        revromtffilt = _mtffilter(kspace[:,ind:ind+1,...],shape)
-
-        ind = [i for i, x in enumerate(p['image']) if x == '0']
-        kspace_nav = kspace[:,ind,...]
-        ind = [i for i, x in enumerate(p['image']) if x == '-2']
-        kspace_revnav = kspace[:,ind,...]
-        # 'normal' scans are labeled 'image' = 1
-        ind = [i for i, x in enumerate(p['image']) if x == '1']
-        kspace_img = kspace[:,ind,...]
-        # reversed readout scans are labeled 'image' = -1
-        ind = [i for i, x in enumerate(p['image']) if x == '-1']
-        kspace_ref = kspace[:,ind,...]
-
-        # creating final image filters
-        stdfilt = _combined_filt(stdrofilt,stdromtffilt)
-        revfilt = _combined_filt(revrofilt,revromtffilt)
-
-        print('filt shape {}'.format(stdfilt.shape))
-        print('kspace shape {}'.format(kspace.shape))
-        plt.subplot(2,3,1)
-        plt.imshow(np.absolute(stdfilt[1,0,10,0,:,:]))
-        plt.subplot(2,3,2)
-        plt.imshow(np.absolute(stdromtffilt[1,0,10,0,:,:]))
-        plt.subplot(2,3,3)
-        plt.imshow(np.absolute(stdrofilt[1,0,10,0,:,:]))
-        plt.subplot(2,3,4)
-        plt.imshow(np.absolute(kspace[1,3,10,0,:,:]))
-
-        # correcting individual images
-        kspace_img = _apply_filter(kspace_img,stdfilt) 
-        kspace_ref = _apply_filter(kspace_ref,revfilt)
-        kspace_nav = _apply_filter(kspace_nav,stdfilt)
-        kspace_revnav = _apply_filter(kspace_revnav,revfilt)
-       
-        # concatenating volumes into the correct series
-
-        ind = [i for i, x in enumerate(p['image']) if x == '0']
-        kspace[:,ind,...] = kspace_nav
-        ind = [i for i, x in enumerate(p['image']) if x == '-2']
-        kspace[:,ind,...] = kspace_revnav
-        # 'normal' scans are labeled 'image' = 1
-        ind = [i for i, x in enumerate(p['image']) if x == '1']
-        kspace[:,ind,...] = kspace_img
-        # reversed readout scans are labeled 'image' = -1
-        ind = [i for i, x in enumerate(p['image']) if x == '-1']
-        kspace[:,ind,...] = kspace_ref
-        
-        plt.subplot(2,3,5)
-        plt.imshow(np.absolute(kspace[1,3,10,0,:,:]))
-        plt.show()
-        return kspace
+        if filters is None:
+            filters = get_epiref_filters(kspace, p, key=key)
+        return _apply_epiref_filters(kspace, p, filters)
 
     elif method == 'aloha':
         raise(Exception('ALOHA Not implemented yet'))
@@ -115,20 +273,20 @@ def _navigator_echo_correct(kspace, npe, etl, method=None):
     """Basic navigator echo correction with various methods
 
     Perform navigator echo correction before the segments are merged, and after
-    the readout lines are reversed. 
+    the readout lines are reversed, in hybrid space.
 
     Ref [1].: Kim et al.: Fast Interleaved Echo-Planar Imaging with Navigator:
     High Resolution anatomic and Functional Images at 4T, MRM, 1996
     ref [2].: O.Heid : Robust EPI Phase Correction, PROC ISMRM, 1997
 
     Args:
-        kspace -- kspace in numpy.ndarray with dimensions of 
+        kspace -- hybrid space data in numpy.ndarray with dimensions of 
                         (rcvr,time,slices,nseg,npe,read)
         npe -- number of readout lines, including navigators
         etl -- echo train length
         method -- method specification string, if None it is figured out
     Return:
-        kspace -- corrected kspace in the same deimnsions
+        kspace -- corrected hybrid space data in the same deimnsions
     """ 
     # count navigator echos to determine method
     if type(method) == type(None):
@@ -151,24 +309,16 @@ def _navigator_echo_correct(kspace, npe, etl, method=None):
 
     if method == 'single':
         shape = kspace.shape
-        # correct for magnitude offset between segments
-        ro_proj = np.fft.fftshift(kspace, axes=-1)
+        # readout projections are the hybrid space data itself
         phase_filt = _phasefilter(kspace[...,:1,:],shape)
-        ro_proj = np.fft.ifft(ro_proj,axis=-1)
-        magn = np.absolute(ro_proj)
-        phase = np.arctan2(np.imag(ro_proj),np.real(ro_proj))
-        # magnitude correction
-        magn_corr_factor = np.mean(magn[...,:1,:],axis=3,\
-                                keepdims=True)/magn[...,:1,:]
-        ro_proj = ro_proj * magn_corr_factor
-        # phase correction
-        ro_proj = ro_proj * phase_filt
-        kspace = np.fft.fft(ro_proj,axis=-1)
-        kspace = np.fft.fftshift(kspace, axes=-1)
-        return kspace
+        magn = np.absolute(kspace[...,:1,:])
+        # correct for magnitude offset between segments
+        magn_corr_factor = np.mean(magn,axis=3,keepdims=True)/magn
+        # magnitude and phase correction
+        return kspace * (magn_corr_factor * phase_filt)
     #TODO
     elif method == 'dual':
-        print('Warning, dual echo orr not implemented, doing nothing...')
+        warnings.warn('Dual navigator echo correction not implemented')
         return kspace
         
     #TODO
@@ -178,7 +328,7 @@ def _navigator_echo_correct(kspace, npe, etl, method=None):
         nav3 = kspace[...,2:3,:]
         nav2_p = ( nav1 + nav3 ) / 2
         nav2_n = kspace[...,1:2,:]
-        print('Warning, triple echo orr not implemented, doing nothing...')
+        warnings.warn('Triple navigator echo correction not implemented')
         return kspace
 
 def _remove_navigator_echos(kspace, etl):
@@ -186,31 +336,20 @@ def _remove_navigator_echos(kspace, etl):
     npe = kspace.shape[4]
     return kspace[...,(npe-etl):,:]
 
-def _zerofill(kspace, phase_dim, nseg):
+def _zerofill(kspace, phase_dim, nseg, fill=0):
     """Zerofill kspace to fill the intended phase dimension"""
     shape = list(kspace.shape)
     shape[4] = phase_dim // nseg - shape[4]
-    add_zeros = np.zeros((shape),dtype=kspace.dtype)
+    add_zeros = np.full(shape, fill, dtype=kspace.dtype)
     return np.concatenate([kspace, add_zeros],axis=4)
 
 def _combine_segments(kspace, pescheme=None):
     """Combine segments in the same manner as vnmrj"""
-    def _get_pe_order(nseg, pe, order='linear'):
-        if order == 'linear':
-            phase_order = []
-            oneshot = [i*nseg for i in range(pe)]
-            for i in range(nseg):
-                phase_order += [j+i for j in oneshot]
-            return phase_order
-        #TODO
-        elif order == 'centric':
-            raise Exception
     (rcvrs,time,slc,nseg,pe,read) = kspace.shape
     new_shape = [rcvrs,time,slc,nseg*pe,read]
     kspace = np.reshape(kspace, new_shape,order='c')
-    phase_order = _get_pe_order(nseg,pe,order=pescheme)
-    kspace[:,:,:,np.array(phase_order),:] = copy.copy(kspace)
-    return kspace
+    perm = vj.core.kplan._segment_permutation(nseg,pe,order=pescheme)
+    return vj.core.kplan._permute(kspace, perm, 3)
 
 def _reshape_stdepi(kspace):
     """Reshape to consistent dims after segment combination"""
@@ -221,8 +360,8 @@ def _reshape_stdepi(kspace):
 
 def _arrange_pe(kspace, phase_order):
     """Rearrange PE dimension to combine segments to be in order"""
-    kspace[:,:,:,np.array(phase_order),:] = copy.copy(kspace)
-    return kspace
+    # phase_order gives the target line of each acquired line
+    return vj.core.kplan._permute(kspace, np.argsort(phase_order), 3)
 
 def _reverse_even(kspace, read_dim=4, phase_dim=3):
     """Reverse even echos (0,2,4...)"""
@@ -269,7 +408,7 @@ def _refcorrect(kspace, p, method='none'):
         kspace -- final version before IFFT with references and navigators
                  removed
     """
-    print('epiref method {}'.format(method))
+    vprint('epiref method {}'.format(method))
     if method == 'default':
         method = p['epiref_type']
     if method == 'none':
@@ -303,24 +442,23 @@ def _fulltriple_ref_correct(kspace, p):
     return kspace
 
 def _phasefilter(nav,shape):
-    """Make phase filter from navigator scan"""
-    nav = np.fft.fftshift(nav,axes=5)
-    nav = np.fft.ifft(nav,axis=5)
+    """Make phase filter from hybrid space navigator scan"""
     phase = np.arctan2(np.imag(nav),np.real(nav))
     filt =  np.exp(-1j * phase)
     return filt
 
 def _mtffilter(nav,shape,echo_average=False):
-    """Return modulation transfer function filter for odd lines"""
+    """Return modulation transfer function filter for odd lines
+
+    Args:
+        nav -- hybrid space navigator scan
+        shape -- shape of the data to be filtered
+        echo_average -- average the first 4 echo pairs
+    """
     # phase correction
-    nav = np.fft.fftshift(nav,axes=5)
-    nav = np.fft.ifft(nav,axis=5)
     phase = np.arctan2(np.imag(nav),np.real(nav))
     phase_filt =  np.exp(-1j * phase)
     filt = nav * phase_filt
-    print(filt.shape)
-    #plt.imshow(np.absolute(filt[1,0,10,0,:,:]))
-    #plt.show()
     shape = list(shape)
     shape[1] = 1  # time dim should be 1
     mtf = np.ones(shape,dtype='complex64')
@@ -345,40 +483,75 @@ def _combined_filt(phasefilt, mtffilt):
     filt = phasefilt * mtffilt
     return filt
 
-def _apply_filter(kspace, filt):
-    """Apply filter to kspace
+def get_epiref_filters(kspace, p, key=None):
+    """Return reference scan filters of epi data, cached by geometry
+
+    The phase and modulation transfer function filters are made from the
+    non phase encoded navigator scans (image = 0 and -2), once per receiver,
+    slice and segment. They are stored with a time dimension of 1 and are
+    applied to each volume by a broadcast multiply in hybrid space.
+
+    Filters are only cached if key is given. The cache key includes the
+    geometry, so the same key (eg. the fid path, or a session name) can be
+    used to reuse filters across runs with identical geometry.
 
     Args:
-        kspace (np.ndarray) -- raw preprocesed kspace, excluding reference scans
-                shape : [rcvrs, time, slice, seg, phase, read]
-        filt (np.ndarray) -- filter to be applied after FFT in RO dimension
-                shape : [rcvrs, time, slice, seg, phase, read]
+        kspace -- hybrid space data including reference scans
+                    [rcvrs, time, slice, seg, phase, read]
+        p -- procpar dictionary
+        key -- hashable, filters are cached under (key, geometry) if given
     Return:
-        kspace
+        (stdfilt, revfilt) -- complex64 filters for normal and reversed
+                    readout volumes, shape [rcvrs, 1, slice, seg, phase, read]
+    """
+    image = tuple(str(x) for x in p['image'])
+    # check if data is eligible for this correction
+    if '0' not in image or '-2' not in image:
+        raise(Exception('Navigator scans not found. Quitting.'))
+    shape = kspace.shape
+    if key is not None:
+        cache_key = (key, shape[:1]+shape[2:], image)
+        if cache_key in _EPIREF_FILTERS:
+            _EPIREF_FILTERS.move_to_end(cache_key)
+            return _EPIREF_FILTERS[cache_key]
+    vprint('making epi reference filters')
+    filters = []
+    # non phase encoded navigator and its reversed readout pair
+    for label in ['0','-2']:
+        ind = image.index(label)
+        nav = kspace[:,ind:ind+1,...]
+        filt = _combined_filt(_phasefilter(nav,shape),_mtffilter(nav,shape))
+        filt = filt.astype('complex64',copy=False)
+        filt.flags.writeable = False
+        filters.append(filt)
+    filters = tuple(filters)
+    cache_size = int(vj.config['epiref_cache_size'])
+    if key is not None and cache_size > 0:
+        _EPIREF_FILTERS[cache_key] = filters
+        while len(_EPIREF_FILTERS) > cache_size:
+            _EPIREF_FILTERS.popitem(last=False)
+    return filters
+
+def _apply_epiref_filters(kspace, p, filters):
+    """Multiply each volume in place with its reference scan filter
+
+    Navigators (0) and normal scans (1) get the standard filter, reversed
+    readout scans (-2, -1) get the reversed one, others are unchanged.
     """
-    kspace = np.fft.fftshift(kspace,axes=5)
-    kspace = np.fft.ifft(kspace,axis=5)
-    kspace = kspace * filt
-    kspace = np.fft.fft(kspace,axis=5) 
-    kspace = np.fft.fftshift(kspace,axes=(5))
-    return kspace 
+    (stdfilt, revfilt) = filters
+    labels = {'0':stdfilt,'1':stdfilt,'-2':revfilt,'-1':revfilt}
+    for (t, label) in enumerate(p['image'][:kspace.shape[1]]):
+        if str(label) in labels:
+            vol = kspace[:,t:t+1,...]
+            np.multiply(vol, labels[str(label)], out=vol)
+    return kspace
 
 def _correct_ilepi(kspace, p):
     """Reorder slices if acquisition was interleaved"""
     # current shape is [read,phase, slice, time, rcvrs]
     # if interleaved
-    if int(p['sliceorder']) == 1:
-        # if even slices
-        slices = kspace.shape[2]
-        if int(p['ns']) % 2 == 0:
-            c = np.zeros(kspace.shape,dtype=kspace.dtype)
-            c[...,0::2,:,:] = kspace[...,:slices//2,:,:] 
-            c[...,1::2,:,:] = kspace[...,slices//2:,:,:] 
-            kspace = c
-        else:
-            c[...,0::2,:,:] = kspace[...,:(slices+1)//2,:,:] 
-            c[...,1::2,:,:] = kspace[...,(slices-1)//2+1:,:,:] 
-            kspace = c
-        return kspace
+    if p.getint('sliceorder') == 1:
+        perm = vj.core.kplan._slice_permutation(kspace.shape[2])
+        return vj.core.kplan._permute(kspace, perm, 2)
     else:
         return kspace
@@ -0,0 +1,254 @@
+"""
+kplan
+=====
+
+Gather-index plans for k-space assembly from fid data.
+
+The reordering of fid blocks and traces into k-space depends only on the
+acquisition protocol (apptype, seqcon, slice order, phase encode table,
+arrayed parameters and matrix size). The reshape chains of the k-space
+builders are applied once on an index array, which gives the fid sample
+for each k-space point in the final [phase, read, slice, time, rcvr] layout.
+Making k-space is then a single np.take, and plans are cached by protocol.
+
+"""
+import vnmrjpy as vj
+import numpy as np
+import collections
+import os
+from vnmrjpy.core.utils import vprint
+
+# cache of k-space plans, see get_kspace_plan
+_KSPACE_PLANS = collections.OrderedDict()
+
+def get_kspace_plan(pd, array_length, fid_shape):
+    """Return cached gather-index plan for building k-space
+
+    The least recently used plans are dropped when the cached plans exceed
+    'kspace_plan_cache_limit' in config (MB).
+
+    Args:
+        pd -- procpar dictionary
+        array_length -- number of arrayed parameter elements
+        fid_shape -- shape of complex fid data (blocks, ntraces*np/2)
+    Return:
+        plan -- integer numpy.ndarray in final k-space shape, values are
+                flat indices into the fid data, -1 where k-space is empty
+    """
+    pd = vj.core.procpar._as_procpar(pd)
+    key = _plan_key(pd, array_length, fid_shape)
+    if key in _KSPACE_PLANS:
+        _KSPACE_PLANS.move_to_end(key)
+        return _KSPACE_PLANS[key]
+    vprint('making k-space plan for {} {}'.format(pd['apptype'],pd['seqcon']))
+    plan = _make_plan(pd, array_length, fid_shape)
+    plan.flags.writeable = False
+    # plans are full size index arrays, the cache is bounded by bytes
+    limit = int(float(vj.config['kspace_plan_cache_limit']) * 1024**2)
+    if plan.nbytes <= limit:
+        _KSPACE_PLANS[key] = plan
+        while sum(p.nbytes for p in _KSPACE_PLANS.values()) > limit:
+            _KSPACE_PLANS.popitem(last=False)
+    return plan
+
+def apply_kspace_plan(data, plan, workers=None, out=None):
+    """Return k-space gathered from complex fid data by plan
+
+    The output is preallocated and filled in chunks along its first axis,
+    the chunks are gathered in parallel. Contiguous complex input of any
+    precision or byte order (eg. a memory-mapped fid viewed as complex) is
+    gathered without an intermediate copy, and chunks are kept within the
+    memory limit, so k-space can be built into a scratch memmap.
+
+    Args:
+        data -- complex fid data (blocks, ntraces*np/2)
+        plan -- from get_kspace_plan
+        workers -- number of threads, defaults to 'kspace_workers' in config
+        out -- complex64 output array, defaults to vj.core.utils.empty_array
+    Return:
+        kspace -- complex64 numpy.ndarray in the shape of plan
+    """
+    if np.iscomplexobj(data) and data.flags.c_contiguous:
+        flat = data.reshape(-1)
+    elif np.iscomplexobj(data) and data.ndim == 2 \
+                    and data.strides[-1] == data.dtype.itemsize:
+        # rows of memory-mapped fid blocks, separated by block headers
+        flat = None
+    else:
+        flat = np.ascontiguousarray(data, dtype='complex64').reshape(-1)
+    if out is None:
+        out = vj.core.utils.empty_array(plan.shape, dtype='complex64')
+    kspace = out
+    workers = vj.core.utils.get_workers(workers)
+    n = plan.shape[0]
+    slab = vj.core.utils.get_slab_size(kspace.nbytes, n)
+    step = max(1, min(slab, -(-n // workers)))
+    chunks = [slice(i, min(i+step, n)) for i in range(0, n, step)]
+
+    def _gather(chunk):
+        # 'clip' keeps -1 (not acquired) in range, these are zeroed below
+        if flat is not None:
+            np.take(flat, plan[chunk], out=kspace[chunk], mode='clip')
+        else:
+            (row, col) = np.divmod(np.maximum(plan[chunk], 0), data.shape[1])
+            kspace[chunk] = data[row, col]
+        missing = plan[chunk] < 0
+        if missing.any():
+            kspace[chunk][missing] = 0
+
+    vj.core.utils.run_parallel(_gather, chunks, workers=workers)
+    return kspace
+
+def _plan_key(pd, array_length, fid_shape):
+    """Return hashable key describing the protocol"""
+    apptype = pd['apptype']
+    pars = ['seqcon','rcvrs','np','nv','nv2','ns','ne','images','etl',\
+            'nseg','sliceorder']
+    vals = tuple(str(pd[par]) if par in pd.keys() else None for par in pars)
+    petab = _petab_key(pd) if apptype == 'im2Dfse' else None
+    return (apptype, vals, int(array_length), tuple(fid_shape), petab)
+
+def _petab_key(pd):
+    """Return (path, mtime, size) of the phase encode table, or None
+
+    The table is only read when a plan is made, cache hits need a stat.
+    """
+    if 'petable' not in pd.keys():
+        return None
+    path = os.path.abspath(vj.config['tablib_dir']+'/'+pd['petable'])
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise(Exception('could not find petab file'))
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+def _index_dtype(size):
+    """Return smallest index dtype for arrays of size"""
+    return np.dtype('int32') if size < 2**31 else np.dtype('int64')
+
+def _make_plan(pd, array_length, fid_shape):
+    """Return k-space index plan by applying builder reshapes on indices"""
+    size = int(np.prod(fid_shape))
+    index = np.arange(size, dtype=_index_dtype(size)).reshape(fid_shape)
+    blocks = fid_shape[0] // array_length
+    elements = [index[i*blocks:(i+1)*blocks,...] for i in range(array_length)]
+    apptype = pd['apptype']
+    if apptype == 'im2D':
+        elements = [_im2D_element(k, pd) for k in elements]
+    elif apptype == 'im2Dfse':
+        petab = np.array(vj.core.read_petab(pd)).flatten()
+        elements = [_im2Dfse_element(k, pd, petab) for k in elements]
+    elif apptype == 'im3D':
+        elements = [_im3D_element(k, pd) for k in elements]
+    else:
+        raise(Exception('No k-space plan for apptype {}'.format(apptype)))
+    # [rcvrs, phase, read, slice, echo*time*array_length]
+    plan = np.concatenate(elements, axis=4)
+    # additional reordering to [phase, read, slice, time, rcvrs]
+    plan = np.moveaxis(plan,[0,1,2,3,4],[4,1,0,2,3])
+    plan = np.swapaxes(plan,0,1)
+    return np.ascontiguousarray(plan)
+
+def _slice_permutation(slices, interleaved=True):
+    """Return gather indices taking acquired slice order to spatial order
+
+    Interleaved acquisitions take the even slices first, then the odd ones,
+    for both even and odd slice counts.
+    """
+    perm = np.arange(slices)
+    if interleaved:
+        perm[0::2] = np.arange((slices+1)//2)
+        perm[1::2] = np.arange((slices+1)//2, slices)
+    return perm
+
+def _segment_permutation(nseg, pe, order='linear'):
+    """Return gather indices merging segments into one phase encode axis
+
+    Segment i and line m of the [nseg*pe] segment major axis go to phase
+    encode m*nseg+i, same as vnmrj.
+    """
+    if order == 'linear':
+        return np.arange(nseg*pe).reshape(nseg, pe).T.reshape(-1)
+    #TODO
+    elif order == 'centric':
+        raise(Exception('Centric phase encode order not implemented'))
+    else:
+        raise(Exception('Unknown phase encode order {}'.format(order)))
+
+def _permute(k, perm, axis, out=None):
+    """Return k reordered along axis by gather indices, as a single take"""
+    return np.take(k, perm, axis=axis, out=out)
+
+def _interleave_slices(k, pd, slice_dim=3):
+    """Reorder interleaved slices to spatial order"""
+    if pd.getint('sliceorder') != 1:
+        return k
+    return _permute(k, _slice_permutation(k.shape[slice_dim]), slice_dim)
+
+def _im2D_element(k, pd):
+    """Index reordering of one array element, same as vnmrj im2Drecon"""
+    rcvrs = pd['rcvrs'].count('y')
+    (read, phase, slices) = (pd.getint('np')//2,pd.getint('nv'),pd.getint('ns'))
+    echo = pd.getint('ne') if 'ne' in pd.keys() else 1
+    time = 1
+    if pd['seqcon'] == 'nccnn':
+        shape = (rcvrs, phase, slices, echo*time, read)
+        k = np.reshape(k, shape, order='C')
+    elif pd['seqcon'] in ['ncsnn','ccsnn']:
+        preshape = (rcvrs, phase, slices*echo*time*read)
+        shape = (rcvrs, phase, slices, echo*time, read)
+        k = np.reshape(k, preshape, order='F')
+        k = np.reshape(k, shape, order='C')
+    else:
+        raise(Exception('Not implemented yet'))
+    k = np.moveaxis(k, [0,1,4,2,3], [0,1,2,3,4])
+    return _interleave_slices(k, pd)
+
+def _im2Dfse_element(k, pd, petab):
+    """Index reordering of one array element of fast spin echo"""
+    rcvrs = pd['rcvrs'].count('y')
+    etl = pd.getint('etl')
+    (read, phase, slices) = (pd.getint('np')//2,pd.getint('nv'),pd.getint('ns'))
+    echo, time = 1, pd.getint('images')
+    if pd['seqcon'] != 'nccnn':
+        raise(Exception('not implemented'))
+    #TODO check for images > 1
+    preshape = (rcvrs, phase//etl, slices, echo*time, etl, read)
+    shape = (rcvrs, echo*time, slices, phase, read)
+    k = np.reshape(k, preshape, order='C')
+    k = np.swapaxes(k,1,3)
+    k = np.reshape(k, shape, order='C')
+    # shape is [rcvrs, phase, slices, echo*time, read]
+    k = np.swapaxes(k,1,3)
+    phase_sort_order = np.array(petab)
+    # shift to positive
+    phase_sort_order = phase_sort_order + phase_sort_order.size//2-1
+    k_fin = np.full(k.shape, -1, dtype=k.dtype)
+    k_fin[:,phase_sort_order,:,:,:] = k
+    k = np.moveaxis(k_fin, [0,1,4,2,3], [0,1,2,3,4])
+    return _interleave_slices(k, pd)
+
+def _im3D_element(k, pd):
+    """Index reordering of one array element, same as vnmrj im3Drecon"""
+    rcvrs = pd['rcvrs'].count('y')
+    (read, phase, phase2) = (pd.getint('np')//2,pd.getint('nv'),\
+                            pd.getint('nv2'))
+    echo = pd.getint('ne') if 'ne' in pd.keys() else 1
+    time = pd.getint('images') if 'images' in pd.keys() else 1
+    seqcon = pd['seqcon']
+    if seqcon == 'nccsn':
+        preshape = (rcvrs,phase2,phase*echo*time*read)
+        shape = (rcvrs,phase2,phase,echo*time,read)
+        k = np.reshape(k,preshape,order='F')
+        k = np.reshape(k,shape,order='C')
+    elif seqcon in ['ncccn','cccsn']:
+        preshape = (rcvrs,phase2,phase*echo*time*read)
+        shape = (rcvrs,phase,phase2,echo*time,read)
+        k = np.reshape(k,preshape,order='F')
+        k = np.reshape(k,shape,order='C')
+    elif seqcon == 'ccccn':
+        shape = (rcvrs,phase2,phase,echo*time,read)
+        k = np.reshape(k,shape,order='C')
+    else:
+        raise(Exception('Not implemented yet'))
+    return np.moveaxis(k, [0,2,4,1,3], [0,1,2,3,4])
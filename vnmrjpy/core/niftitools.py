@@ -17,10 +17,10 @@ def _set_nifti_header(varr, update=True):
     if varr.space == 'anatomical':
 
         qfac = 1
-        dim_count = len(varr.data.shape)
+        dim_count = len(varr.shape)
         header['dim'][0] = dim_count
         for i in range(dim_count):
-            header['dim'][i+1] = varr.data.shape[i]
+            header['dim'][i+1] = varr.shape[i]
         # setting pixdim based on procpar data
         d = _get_pixdims(varr.pd)
         swap,flip = vj.core.transform._anatomical_swaps(varr.pd)
@@ -44,10 +44,10 @@ def _set_nifti_header(varr, update=True):
     elif varr.space == 'local':
         
         qfac = 1  # qfac: -1 if left handed
-        dim_count = len(varr.data.shape)
+        dim_count = len(varr.shape)
         header['dim'][0] = dim_count
         for i in range(dim_count):
-            header['dim'][i+1] = varr.data.shape[i]
+            header['dim'][i+1] = varr.shape[i]
         # setting pixdom based on procpar data
         d = _get_pixdims(varr.pd)
         
@@ -83,21 +83,22 @@ def _set_nifti_header(varr, update=True):
 def _get_pixdims(pd):
     """Return nifti pixdims in [read, phase, slice] dimensions"""
 
+    pd = vj.core.procpar._as_procpar(pd)
     mul = 10  # procpar lengths are in cm, we need mm
     if pd['apptype'] in ['im2D','im2Dfse','im2Dcs','im2Dfsecs']: 
-        d0 = float(pd['lro'])/(int(pd['np'])//2)*mul
-        d1 = float(pd['lpe'])/int(pd['nv'])*mul
-        d2 = float(pd['thk'])+float(pd['gap'])
+        d0 = pd.getfloat('lro')/(pd.getint('np')//2)*mul
+        d1 = pd.getfloat('lpe')/pd.getint('nv')*mul
+        d2 = pd.getfloat('thk')+pd.getfloat('gap')
         d = (d0,d1,d2)
     elif pd['apptype'] in ['im2Depi','im2Depics']: 
-        d0 = float(pd['lro'])/(int(pd['nread'])//2)*mul
-        d1 = float(pd['lpe'])/int(pd['nphase'])*mul
-        d2 = float(pd['thk'])+float(pd['gap'])
+        d0 = pd.getfloat('lro')/(pd.getint('nread')//2)*mul
+        d1 = pd.getfloat('lpe')/pd.getint('nphase')*mul
+        d2 = pd.getfloat('thk')+pd.getfloat('gap')
         d = (d0,d1,d2)
     elif pd['apptype'] in ['im3D','im3Dcs','im3Dfse']: 
-        d0 = float(pd['lro'])/(int(pd['np'])//2)*mul
-        d1 = float(pd['lpe'])/int(pd['nv'])*mul
-        d2 = float(pd['lpe2'])/int(pd['nv2'])*mul
+        d0 = pd.getfloat('lro')/(pd.getint('np')//2)*mul
+        d1 = pd.getfloat('lpe')/pd.getint('nv')*mul
+        d2 = pd.getfloat('lpe2')/pd.getint('nv2')*mul
         d = (d0,d1,d2)
     else:
         raise(Exception('apptype not implemented in _get_pixdim'))
@@ -151,11 +152,12 @@ def _qform_affine(varr,qfac):
 
 def _qform_rot_matrix(pd):
     """Return rotation matrix for qform affine"""
+    pd = vj.core.procpar._as_procpar(pd)
     # try without
     #TODO
-    psi = float(pd['psi']) * 2*np.pi / 360
-    phi = float(pd['phi']) * 2*np.pi / 360
-    t = float(pd['theta']) * 2*np.pi / 360
+    psi = pd.getfloat('psi') * 2*np.pi / 360
+    phi = pd.getfloat('phi') * 2*np.pi / 360
+    t = pd.getfloat('theta') * 2*np.pi / 360
     
     #Rotations from Euler angles
     rot_x = np.array([[1,       0,       0],\
@@ -0,0 +1,97 @@
+"""
+procpar
+=======
+
+Procpar parameter dictionary with typed access.
+
+"""
+import numpy as np
+
+class Procpar(dict):
+    """Dictionary of Varian procpar parameters
+
+    Values are stored as read from the procpar file: strings, or lists of
+    strings for multiple values, so it works as a plain dictionary.
+    Numeric values are available by getint, getfloat and getarray, these are
+    converted on first access and cached until the parameter is changed.
+
+    Attributes:
+        meta -- dictionary of (subtype, basictype, maxvalue, minvalue, step)
+                for each parameter, as given in the procpar file
+    """
+    def __init__(self, pd=None, meta=None):
+
+        super().__init__(pd if pd is not None else {})
+        # parameter metadata from procpar file
+        self.meta = dict(meta) if meta is not None else {}
+        # cache of converted values {key : {type : value}}
+        self._typed = {}
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self), self.meta))
+
+    def __setitem__(self, key, val):
+        self._typed.pop(key, None)
+        super().__setitem__(key, val)
+
+    def __delitem__(self, key):
+        self._typed.pop(key, None)
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._typed.clear()
+        super().update(*args, **kwargs)
+
+    def pop(self, key, *args):
+        self._typed.pop(key, None)
+        return super().pop(key, *args)
+
+    def popitem(self):
+        self._typed.clear()
+        return super().popitem()
+
+    def clear(self):
+        self._typed.clear()
+        super().clear()
+
+    def setdefault(self, key, default=None):
+        self._typed.pop(key, None)
+        return super().setdefault(key, default)
+
+    def copy(self):
+        return Procpar(self, self.meta)
+
+    def _get_typed(self, key, kind, convert):
+        """Return cached conversion of parameter value"""
+        typed = self._typed.setdefault(key, {})
+        if kind not in typed:
+            typed[kind] = convert(self[key])
+        return typed[kind]
+
+    def getfloat(self, key):
+        """Return single valued parameter as float"""
+        def _convert(val):
+            if type(val) == list:
+                raise(Exception('Parameter {} has multiple values, '\
+                                'use getarray'.format(key)))
+            return float(val)
+        return self._get_typed(key, 'float', _convert)
+
+    def getint(self, key):
+        """Return single valued parameter as int"""
+        return self._get_typed(key, 'int', \
+                        lambda val : int(round(self.getfloat(key))))
+
+    def getarray(self, key):
+        """Return parameter values as read-only 1D float numpy array"""
+        def _convert(val):
+            arr = np.atleast_1d(np.array(val, dtype='float64'))
+            arr.flags.writeable = False
+            return arr
+        return self._get_typed(key, 'array', _convert)
+
+def _as_procpar(pd):
+    """Return pd as Procpar, without copying if it is one already"""
+    if isinstance(pd, Procpar):
+        return pd
+    return Procpar(pd)
@@ -10,89 +10,121 @@ General Nifti1: nii, nii.gz
 """
 import vnmrjpy as vj
 from vnmrjpy.core.utils import vprint
+from vnmrjpy.core.procpar import Procpar
 import numpy as np
 import os
 import glob
 import csv
+import copy
+import time
+import pickle
+import collections
 
-def read_procpar(procpar):
-    """Return dictionary of varian parameters from procpar file"""
+# in-process cache of parsed procpar files, see read_procpar
+_PROCPAR_CACHE = collections.OrderedDict()
 
-    with open(procpar,'r') as openpp:
-        
-        name = []
-        value = []
-        subtype = []
-        basictype = []
-        maxvalue = []
-        minvalue = []
-        # possibilities (as of manual): 0 :'line1', 1: 'line2', 2: 'last'
-        line_id = 0 
-    
-        current_name = 0
-
-        for line_num, line in enumerate(openpp.readlines()):
-
-            if line_id == 0:  # parameter name line
-                
-                fields = line.rsplit('\n')[0].rsplit(' ')
-                current_name = fields[0]
-                name.append(fields[0])
-                subtype.append(int(fields[1]))
-                basictype.append(int(fields[2]))
-
-                # can be 0 (undefined), 1 (real), 2 (string)
-                current_basictype = int(fields[2])  
-                val_list = []  # if parameter value is a multitude of strings
-                line_id = 1
-                                
-            elif line_id == 1:  # parameter value line
-
-                fields = line.rsplit('\n')[0].rsplit(' ')
-
-                # values are real, and all are on this line
-                if current_basictype == 1:  
-                    val = [fields[i] for i in range(1,len(fields)-1)]
-                    if len(val) == 1:  # don't make list if there is only one value
-                        val = val[0]
-                    value.append(val)
-                    line_id = 2
-                # values are strings
-                elif current_basictype == 2 and int(fields[0]) == 1:
-                    
-                    value.append(str(fields[1].rsplit('"')[1]))
-                    line_id = 2
-                # multiple string values
-                elif current_basictype == 2 and int(fields[0]) > 1:
-                    
-                    val_list.append(fields[1])
-                    remaining_values = int(fields[0])-1
-                    line_id = 3
-                
-            elif line_id == 2:
-
-                line_id = 0
-        
-            elif line_id == 3:  # if values are on multiple lines
-                if remaining_values > 1:  # count backwards from remaining values
-                    val_list.append(fields[0])
-                    remaining_values = remaining_values - 1
-                elif remaining_values == 1:
-                    val_list.append(fields[0])
-                    remaining_values = remaining_values - 1
-                    value.append(val_list)
-                    line_id = 2
-                else:
-                    raise(Exception('Error reading procpar, problem with line_id'))
-            else:
-                raise(Exception('Error reading procpar, problem with line_id'))
+def read_procpar(procpar):
+    """Return Procpar dictionary of varian parameters from procpar file
 
+    Parsed files are cached in memory, keyed by path, modification time and
+    size, so repeated reads of the same procpar are nearly free. The number
+    of cached files is set by 'procpar_cache_size' in config. If
+    'procpar_sidecar' is True, the parsed parameters are also pickled next
+    to the procpar file and reused in later sessions.
+    """
+    values, meta = _load_procpar(procpar)
+    return Procpar({key : (list(val) if type(val) == list else val) \
+                    for key, val in values.items()}, meta)
+
+def _load_procpar(procpar):
+    """Return cached (values, meta) dictionaries of procpar file"""
+    path = os.path.abspath(str(procpar))
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    cache_size = int(vj.config['procpar_cache_size'])
+    if key in _PROCPAR_CACHE:
+        _PROCPAR_CACHE.move_to_end(key)
+        return _PROCPAR_CACHE[key]
+    parsed = None
+    sidecar = os.path.join(os.path.dirname(path),\
+                            '.'+os.path.basename(path)+'.pickle')
+    use_sidecar = vj.config['procpar_sidecar']
+    if use_sidecar and os.path.isfile(sidecar):
+        try:
+            with open(sidecar,'rb') as openside:
+                side = pickle.load(openside)
+            if side['key'] == key[1:]:
+                parsed = side['procpar']
+        except Exception:
+            parsed = None
+    if parsed is None:
+        parsed = _parse_procpar(path)
+        if use_sidecar:
+            try:
+                with open(sidecar,'wb') as openside:
+                    pickle.dump({'key':key[1:],'procpar':parsed}, openside,\
+                                protocol=pickle.HIGHEST_PROTOCOL)
+            except OSError:
+                vprint('could not write procpar sidecar {}'.format(sidecar))
     vprint('procpar file {} read succesfully'.format(procpar))
+    if cache_size > 0:
+        _PROCPAR_CACHE[key] = parsed
+        while len(_PROCPAR_CACHE) > cache_size:
+            _PROCPAR_CACHE.popitem(last=False)
+    return parsed
 
-    return dict(zip(name, value))
+def _parse_procpar(procpar):
+    """Parse procpar file in a single pass
+
+    Each parameter is given by 3 or more lines as per the Vnmrj manual:
+        name subtype basictype maxvalue minvalue stepsize Ggroup Dgroup
+            protection active intptr
+        number_of_values value(s)   (multiple strings on separate lines)
+        number_of_enums enum_value(s)
+
+    Return:
+        values -- dictionary of parameter values, real values are kept as
+                  strings, multiple values as lists
+        meta -- dictionary of (subtype, basictype, maxvalue, minvalue, step)
+    """
+    with open(procpar,'r') as openpp:
+        lines = openpp.read().splitlines()
+
+    values = {}
+    meta = {}
+    i = 0
+    nlines = len(lines)
+    while i < nlines:
+        fields = lines[i].split()
+        if len(fields) < 3:  # empty or broken line
+            i += 1
+            continue
+        name = fields[0]
+        basictype = int(fields[2])
+        meta[name] = (int(fields[1]), basictype, float(fields[3]),\
+                        float(fields[4]), float(fields[5]))
+        count, _, rest = lines[i+1].partition(' ')
+        count = int(count)
+        if basictype == 2:  # strings, one per line
+            val = [rest.strip().strip('"')]
+            for k in range(1, count):
+                val.append(lines[i+1+k].strip().strip('"'))
+            i += 1 + max(count,1)
+        else:  # reals, all on one line
+            val = rest.split()
+            i += 2
+        if len(val) == 1:  # don't make list if there is only one value
+            val = val[0]
+        values[name] = val
+        # skip the enum line
+        i += 1
+
+    return values, meta
 
 def read_fid(fid,procpar=None,load_data=True,
-            xrecon=False,xrecon_space='imagespace'):
+            xrecon=False,xrecon_space='imagespace',mmap=False,
+            blocks=None,traces=None,array_index=None,receivers=None,
+            blockscale=False,ctnorm=False):
     """Handles raw data from Varian spectrometer
 
     Args:
@@ -101,6 +133,20 @@ def read_fid(fid,procpar=None,load_data=True,
         load_data -- set false to prevent loading binary data into memory
         xrecon -- Set True for direct reconstruction by Xrecon
         xrecon_space -- either 'kspace' or 'imagespace' for xrecon output
+        mmap -- set True to memory-map the fid file instead of reading it.
+                varray.data is then a read-only big-endian view of the
+                file, nothing is copied until the data is processed
+        blocks -- block index, slice or list, select raw fid blocks
+        traces -- trace index, slice or list, select traces within blocks
+        array_index -- index or list of arrayed parameter elements to load
+        receivers -- index or list of receivers to load
+        blockscale -- multiply each block by 2**scale from its block header
+        ctnorm -- divide each block by its ctcount from the block header
+
+    Only the selected parts of the fid file are read from disk. Array element
+    and receiver selections update procpar and arrayed_params accordingly, so
+    the varray can be made into k-space as usual. Block and trace selections
+    are meant for raw data inspection, they only update the fid header.
 
     .fid File structure as per Vnmrj manual:
     ===================================
@@ -130,55 +176,6 @@ def read_fid(fid,procpar=None,load_data=True,
        float   lvl;        /* F2 level drift correction       
        float   tlt;        /* F2 tilt drift correction      
     """
-    def _decode_header(bheader):
-        """Return dictionary of fid header from binary header data"""
-        hkey_list = ['nblocks','ntraces','np','ebytes','tbytes','bbytes',\
-                 'vers_id','status','nbheaders']
-        hval_list = []
-        h_dict = {}
-        if len(bheader) != 32:
-            raise(Exception('Incorrect fid header data: not 32 bytes'))
-        else: 
-            hval_list.append(int.from_bytes(bheader[0:4],byteorder='big'))
-            hval_list.append(int.from_bytes(bheader[4:8],byteorder='big'))
-            hval_list.append(int.from_bytes(bheader[8:12],byteorder='big'))
-            hval_list.append(int.from_bytes(bheader[12:16],byteorder='big'))
-            hval_list.append(int.from_bytes(bheader[16:20],byteorder='big'))
-            hval_list.append(int.from_bytes(bheader[20:24],byteorder='big'))
-            hval_list.append(int.from_bytes(bheader[24:26],byteorder='big'))
-            hval_list.append(int.from_bytes(bheader[26:28],byteorder='big'))
-            hval_list.append(int.from_bytes(bheader[28:],byteorder='big'))
-
-            for num, i in enumerate(hkey_list):
-                h_dict[i] = hval_list[num]
-        
-        return h_dict
-
-    def _decode_blockhead(blockheader):
-        """Return block header dictionary"""
-        bh_dict = {}
-        bhk_list = ['scale','status','index','mode','ctcount','lpval'\
-                    'rpval','lvl','tlt']
-        bhv_list = []
-        bhv_list.append(int.from_bytes(blockheader[0:2],byteorder='big'))
-        bhv_list.append(int.from_bytes(blockheader[2:4],byteorder='big'))
-        bhv_list.append(int.from_bytes(blockheader[4:6],byteorder='big'))
-        bhv_list.append(int.from_bytes(blockheader[6:8],byteorder='big'))
-        bhv_list.append(int.from_bytes(blockheader[8:12],byteorder='big'))
-        bhv_list.append(int.from_bytes(blockheader[12:16],byteorder='big'))
-        bhv_list.append(int.from_bytes(blockheader[16:20],byteorder='big'))
-        bhv_list.append(int.from_bytes(blockheader[20:24],byteorder='big'))
-        bhv_list.append(int.from_bytes(blockheader[24:28],byteorder='big'))
-
-        for num, i in enumerate(bhk_list):
-            bh_dict[i] = bhv_list[num]        
-        return bh_dict
-
-    def _chunks(l, n):
-        """Generate n long chunks from list l"""
-        for i in range(0, len(l), n):
-            yield l[i:i + n]
-
     def _xrecon_read(varr,xrspace):
     
         varr = vj.xrecon.make_temp_dir(varr)
@@ -190,15 +187,13 @@ def read_fid(fid,procpar=None,load_data=True,
 
     # ============================ INIT =======================================
     # TODO is procpar != None making sense?
+    if os.path.isdir(fid):
+        fid_path = fid
+        fid = str(fid)+'/fid'
+    else:
+        fid_path = os.path.dirname(fid)
     if procpar==None:
-    
-        if os.path.isdir(fid):
-            fid_path = fid
-            procpar = str(fid)+'/procpar'
-            fid = str(fid)+'/fid'
-        else:
-            fid_path = fid.rsplit('/',1)[0]
-            procpar = fid.rsplit('/')[0]+'/procpar'
+        procpar = os.path.join(fid_path,'procpar')
     else:
         print('Warning: manual setting of procpar is not fully supported')
     # ============================ XRECON ====================================
@@ -231,44 +226,34 @@ def read_fid(fid,procpar=None,load_data=True,
 
 
     # ================================ VNMRJPY ================================
-    # header data should be 32 bytes
-    with open(fid,'rb') as openFid:
-        binary_data = openFid.read()
-        # binary header data 
-        bheader = bytearray(binary_data[:32])
-        # binary fid data
-        bdata = binary_data[32:]
-
-    header_dict = _decode_header(bheader)
+    header_dict = _read_fid_header(fid)
     pd = read_procpar(procpar)
 
-    chunk_size = int(header_dict['bbytes'])
-    block_list = list(_chunks(bdata,chunk_size))
-
-    if header_dict['bbytes'] == len(block_list[0]):
-        #print('blocksize check OK')
-        pass
-
     vprint('reading fid {}'.format(fid))
     vprint('\nfid header :\n')
     vprint(header_dict)
 
-    #------------main iteration through bytearray -----------------
-
+    blockheads = None
     if load_data == False:
         fid_data = None  #don't load fid data, useful if xrecon is called next
     elif load_data == True:
-        dim = (int(header_dict['nblocks']),\
-                int((header_dict['ntraces'])*int(header_dict['np'])))
-        fid_data = np.empty(dim)
-        if header_dict['ebytes'] == 4:
-            dt = '>f'
-        if header_dict['ebytes'] == 2:
-            dt = '>i2'
-        for k,block in enumerate(block_list): # for each block
-            block_header = block[:28] # separate block header
-            block_data = block[28:]
-            fid_data[k,:] = np.frombuffer(bytearray(block_data),dt)
+        fid_blocks = _map_fid_blocks(fid, header_dict)
+        header_dict['nblocks'] = fid_blocks.shape[0]
+        index = _select_fid_blocks(header_dict, pd, blocks=blocks,\
+                        array_index=array_index, receivers=receivers)
+        fid_data = fid_blocks['data'][index]
+        blockheads = _decode_blockheads(fid_blocks['blockhead'][index])
+        if traces is not None:
+            fid_data = _select_fid_traces(fid_data, header_dict, traces)
+        header_dict['nblocks'] = fid_data.shape[0]
+        if (blockscale or ctnorm) and blockheads is not None:
+            factors = _blockhead_factors(blockheads, blockscale, ctnorm)
+            if mmap:
+                fid_data = fid_data * factors[:,None]
+            else:
+                fid_data = fid_data * factors.astype('float64')[:,None]
+        elif not mmap:
+            fid_data = fid_data.astype('float64')
 
     # fid data ready, now create varray class
     arr = _get_arrayed_par_length(pd)
@@ -276,9 +261,105 @@ def read_fid(fid,procpar=None,load_data=True,
     varr = vj.varray(data=fid_data,space=None,pd=pd,fid_header=header_dict,\
                         source='fid',dtype=vj.DTYPE, seqcon=pd['seqcon'],\
                         apptype=pd['apptype'],arrayed_params=arr,vdtype='fid',\
-                        sdims = sdim, fid_path=fid_path)
+                        sdims = sdim, fid_path=fid_path,\
+                        fid_blockheads=blockheads)
     return varr
 
+def iter_fid_blocks(fid, nblocks=1, follow=False, poll=1.0, timeout=60):
+    """Yield decoded fid blocks, optionally while the fid is being written
+
+    The fid header is read once, then at most 'nblocks' blocks are kept in
+    memory at a time. With follow=True the generator waits for the
+    spectrometer to append the blocks announced in the header.
+
+    Args:
+        fid -- path to .fid directory or fid file
+        nblocks -- number of blocks yielded at once
+        follow -- set True to wait for blocks during acquisition
+        poll -- seconds between file size checks when following
+        timeout -- stop following after this many seconds without new data
+    Yield:
+        blockheads -- structured array of block headers, see read_fid
+        data -- complex64 numpy.ndarray([blocks, ntraces*np/2])
+    """
+    if os.path.isdir(fid):
+        fid = str(fid)+'/fid'
+    header_dict = _wait_fid_header(fid, follow, poll, timeout)
+    block_dt = _fid_block_dtype(header_dict)
+    offset = _FID_HEADER_DTYPE.itemsize
+    total = header_dict['nblocks']
+    done = 0
+    with open(fid,'rb') as openFid:
+        openFid.seek(offset)
+        last = time.time()
+        while done < total:
+            n = min(nblocks, total - done)
+            avail = (os.fstat(openFid.fileno()).st_size - offset) \
+                        // block_dt.itemsize - done
+            if avail < n:
+                if follow and time.time() - last < timeout:
+                    time.sleep(poll)
+                    continue
+                elif avail <= 0:
+                    vprint('fid {} ended after {} of {} blocks'\
+                            .format(fid, done, total))
+                    return
+                n = avail
+            last = time.time()
+            chunk = np.frombuffer(openFid.read(n*block_dt.itemsize),\
+                                    dtype=block_dt)
+            done += n
+            yield _decode_blockheads(chunk['blockhead']), \
+                    to_complex(chunk['data'])
+
+def iter_fid(fid, procpar=None, follow=False, poll=1.0, timeout=60):
+    """Yield a varray for each arrayed parameter element of a fid
+
+    Each varray holds the complex fid data of one array element, with the
+    procpar value of the arrayed parameter set accordingly, so it can be
+    made into k-space by to_kspace. With follow=True elements are yielded
+    as soon as they are acquired. Data without a single arrayed parameter
+    is one element, yielded only when the whole fid is acquired, so it
+    does not stream. Epi volumes are streamed by epitools.iter_epi.
+
+    Args:
+        fid -- path to .fid directory
+        procpar -- path to procpar file, defaults to the one in fid directory
+        follow, poll, timeout -- see iter_fid_blocks
+    Yield:
+        varr -- vj.varray with vdtype 'fid'
+    """
+    if os.path.isdir(fid):
+        fid_path = fid
+        fid = str(fid)+'/fid'
+    else:
+        fid_path = os.path.dirname(fid)
+    if procpar==None:
+        procpar = os.path.join(fid_path,'procpar')
+    pd = read_procpar(procpar)
+    header_dict = _wait_fid_header(fid, follow, poll, timeout)
+    arrayed = [l for (par,l) in _get_arrayed_par_length(pd) if l > 1]
+    array_length = arrayed[0] if len(arrayed) == 1 else 1
+    elem_blocks = header_dict['nblocks'] // array_length
+    sdim = ['phase', 'read', 'slice', 'time', 'rcvr']
+    for i, (blockheads, data) in enumerate(iter_fid_blocks(fid,\
+                    nblocks=elem_blocks, follow=follow, poll=poll,\
+                    timeout=timeout)):
+        if data.shape[0] < elem_blocks:
+            vprint('incomplete array element {}, stopping'.format(i))
+            return
+        elem_pd = copy.deepcopy(pd)
+        elem_header = dict(header_dict)
+        if array_length > 1:
+            _select_fid_blocks(elem_header, elem_pd, array_index=i)
+        elem_header['nblocks'] = elem_blocks
+        arr = _get_arrayed_par_length(elem_pd)
+        yield vj.varray(data=data,space=None,pd=elem_pd,\
+                        fid_header=elem_header,source='fid',dtype=vj.DTYPE,\
+                        seqcon=elem_pd['seqcon'],apptype=elem_pd['apptype'],\
+                        arrayed_params=arr,vdtype='fid',sdims=sdim,\
+                        fid_path=fid_path,fid_blockheads=blockheads)
+
 def read_fdf(path):
     """Return vnmrjpy.varray from varian .fdf files
 
@@ -461,6 +542,288 @@ def read_fdf(path):
     varr.to_local()
     return varr
 
+# fid file header, 32 bytes big-endian
+_FID_HEADER_DTYPE = np.dtype([('nblocks','>i4'),('ntraces','>i4'),\
+                        ('np','>i4'),('ebytes','>i4'),('tbytes','>i4'),\
+                        ('bbytes','>i4'),('vers_id','>i2'),('status','>i2'),\
+                        ('nbheaders','>i4')])
+# fid block header, 28 bytes big-endian
+_BLOCKHEAD_DTYPE = np.dtype([('scale','>i2'),('status','>i2'),\
+                        ('index','>i2'),('mode','>i2'),('ctcount','>i4'),\
+                        ('lpval','>f4'),('rpval','>f4'),('lvl','>f4'),\
+                        ('tlt','>f4')])
+# status bits of the fid file header
+_S_32 = 0x4
+_S_FLOAT = 0x8
+
+def _read_fid_header(fid):
+    """Return dictionary of fid header, only the first 32 bytes are read"""
+    with open(fid,'rb') as openFid:
+        bheader = openFid.read(_FID_HEADER_DTYPE.itemsize)
+    if len(bheader) != _FID_HEADER_DTYPE.itemsize:
+        raise(Exception('Incorrect fid header data: not 32 bytes'))
+    header = np.frombuffer(bheader, dtype=_FID_HEADER_DTYPE)[0]
+    return {key : int(header[key]) for key in _FID_HEADER_DTYPE.names}
+
+def _wait_fid_header(fid, follow=False, poll=1.0, timeout=60):
+    """Return fid header dictionary, wait for it to be written if following"""
+    offset = _FID_HEADER_DTYPE.itemsize
+    start = time.time()
+    while follow and (not os.path.exists(fid) or \
+                        os.path.getsize(fid) < offset):
+        if time.time() - start > timeout:
+            raise(Exception('No fid header found in {}'.format(fid)))
+        time.sleep(poll)
+    return _read_fid_header(fid)
+
+def _fid_data_dtype(header_dict):
+    """Return big-endian numpy dtype of fid data points from header status"""
+    ebytes = header_dict['ebytes']
+    if ebytes == 2:
+        return np.dtype('>i2')
+    elif ebytes == 4:
+        if header_dict['status'] & _S_FLOAT or \
+                not header_dict['status'] & _S_32:
+            return np.dtype('>f4')
+        else:
+            return np.dtype('>i4')
+    elif ebytes == 8:
+        return np.dtype('>f8')
+    else:
+        raise(Exception('Unknown fid data type: ebytes = {}'.format(ebytes)))
+
+def _fid_block_dtype(header_dict):
+    """Return structured dtype describing one fid block
+
+    A block is the block header(s) followed by ntraces*np data points.
+    The block headers are in field 'blockhead', as an array of block header
+    records if the sizes match, otherwise as raw bytes. The data points are
+    a flat array in field 'data'.
+    """
+    npts = header_dict['ntraces']*header_dict['np']
+    dt = _fid_data_dtype(header_dict)
+    headbytes = header_dict['bbytes'] - npts*dt.itemsize
+    if headbytes < 0:
+        raise(Exception('Incorrect fid header: block size is too small'))
+    bhsize = _BLOCKHEAD_DTYPE.itemsize
+    if headbytes > 0 and headbytes % bhsize == 0:
+        head_dt = (_BLOCKHEAD_DTYPE, (headbytes // bhsize,))
+    else:
+        head_dt = ('V{}'.format(headbytes),)
+    return np.dtype([('blockhead',)+head_dt,('data',dt,(npts,))])
+
+def _decode_blockheads(heads):
+    """Return native structured array of the first block header of each block
+
+    Args:
+        heads -- 'blockhead' field of the fid blocks
+    Return:
+        blockheads -- numpy structured array with fields scale, status,
+                      index, mode, ctcount, lpval, rpval, lvl, tlt
+                      or None if block headers are missing
+    """
+    if heads.dtype.base != _BLOCKHEAD_DTYPE:
+        return None
+    return heads[:,0].astype(_BLOCKHEAD_DTYPE.newbyteorder('='))
+
+def _blockhead_factors(blockheads, blockscale=False, ctnorm=False):
+    """Return per block multipliers from block headers
+
+    Args:
+        blockheads -- structured array from _decode_blockheads
+        blockscale -- apply the 2**scale scaling factor of the block
+        ctnorm -- normalize by the completed transient count (ctcount)
+    Return:
+        factors -- float32 numpy.ndarray([blocks])
+    """
+    factors = np.ones(blockheads.shape[0], dtype='float32')
+    if blockscale:
+        factors *= np.exp2(blockheads['scale'].astype('float32'))
+    if ctnorm:
+        ct = blockheads['ctcount'].astype('float32')
+        factors[ct > 0] /= ct[ct > 0]
+    return factors
+
+def _map_fid_blocks(fid, header_dict):
+    """Return read-only memory map of fid blocks with structured dtype
+
+    Args:
+        fid -- path to fid file
+        header_dict -- fid file header dictionary
+    Return:
+        blocks -- np.memmap of shape (nblocks,), fields 'blockhead', 'data'
+    """
+    block_dt = _fid_block_dtype(header_dict)
+    offset = _FID_HEADER_DTYPE.itemsize
+    # an interrupted acquisition may leave less blocks than the header says
+    avail = (os.path.getsize(fid) - offset) // block_dt.itemsize
+    nblocks = min(header_dict['nblocks'], avail)
+    if nblocks < header_dict['nblocks']:
+        vprint('fid file is truncated: {} of {} blocks'\
+                .format(nblocks,header_dict['nblocks']))
+    return np.memmap(fid, dtype=block_dt, mode='r', offset=offset,\
+                        shape=(nblocks,))
+
+def _as_index(sel):
+    """Return slice from contiguous or evenly spaced index list if possible
+
+    Basic slicing keeps memory mapped data as a view.
+    """
+    if isinstance(sel, slice):
+        return sel
+    sel = np.atleast_1d(np.asarray(sel, dtype=int))
+    if sel.size == 1:
+        return slice(int(sel[0]), int(sel[0])+1)
+    step = int(sel[1] - sel[0])
+    if step > 0 and np.all(np.diff(sel) == step):
+        return slice(int(sel[0]), int(sel[-1])+1, step)
+    return sel
+
+def _select_fid_blocks(header_dict, pd, blocks=None, array_index=None,\
+                        receivers=None):
+    """Return index of fid blocks matching the selection
+
+    Array elements are the outermost loop of the blocks. Receivers are the
+    innermost loop, except for epi, see _block_receivers. Procpar
+    dictionary 'pd' is updated in place to describe the selected data.
+
+    Args:
+        header_dict -- fid header dictionary
+        pd -- procpar dictionary
+        blocks -- block index, slice or list
+        array_index -- index or list of arrayed parameter elements
+        receivers -- index or list of receivers
+    Return:
+        index -- slice or integer array usable on the fid blocks
+    """
+    nblocks = header_dict['nblocks']
+    if blocks is None and array_index is None and receivers is None:
+        return slice(None)
+    index = np.arange(nblocks)
+    if blocks is not None:
+        index = index[blocks]
+    if array_index is not None:
+        array_index = np.atleast_1d(array_index)
+        arrayed = [(par,l) for (par,l) in _get_arrayed_par_length(pd) if l > 1]
+        if len(arrayed) > 1:
+            raise(Exception('Selecting array elements is not supported '\
+                            'for multiple arrayed parameters'))
+        array_length = arrayed[0][1] if len(arrayed) == 1 else 1
+        elem_blocks = header_dict['nblocks'] // array_length
+        index = index[np.isin(index // elem_blocks, array_index)]
+        if len(arrayed) == 1:
+            par = arrayed[0][0]
+            vals = [pd[par][i] for i in array_index]
+            pd[par] = vals[0] if len(vals) == 1 else vals
+    if receivers is not None:
+        receivers = np.atleast_1d(receivers)
+        index = index[np.isin(_block_receivers(header_dict, pd, index),\
+                                receivers)]
+        # switch off receivers not selected
+        rcvr_str = list(pd['rcvrs'])
+        active = [i for i, c in enumerate(rcvr_str) if c == 'y']
+        for num, i in enumerate(active):
+            if num not in receivers:
+                rcvr_str[i] = 'n'
+        pd['rcvrs'] = ''.join(rcvr_str)
+    if index.size == 0:
+        raise(Exception('Empty fid block selection'))
+    return _as_index(index)
+
+def _block_receivers(header_dict, pd, index):
+    """Return receiver number of fid blocks
+
+    Receivers are the innermost block loop of standard imaging data. Epi
+    data is ordered [time, rcvrs, nseg, slices, npe, read], so segments in
+    separate blocks are inside the receiver loop. There the receiver is
+    found from the first point of each block.
+    """
+    rcvrs = pd['rcvrs'].count('y')
+    apptype = pd['apptype'] if 'apptype' in pd.keys() else None
+    if apptype in ['im2D','im2Dfse','im3D','im3Dfse']:
+        return index % rcvrs
+    elif apptype == 'im2Depi':
+        geom = vj.core.epitools._epi_geometry(pd)
+        stride = geom['nseg']*geom['slices']*geom['npe']*geom['read']
+        points = header_dict['ntraces']*header_dict['np']//2
+        if stride % points != 0:
+            raise(Exception('Fid blocks span multiple receivers'))
+        return (index*points // stride) % rcvrs
+    else:
+        raise(Exception('Receiver selection is not supported for '\
+                        'apptype {}'.format(apptype)))
+
+def _select_fid_traces(fid_data, header_dict, traces):
+    """Return traces of fid data and update fid header"""
+    (ntraces, npts) = (header_dict['ntraces'], header_dict['np'])
+    data = fid_data.reshape(fid_data.shape[0], ntraces, npts)
+    data = data[:,_as_index(np.arange(ntraces)[traces]),:]
+    header_dict['bbytes'] -= (ntraces - data.shape[1])*header_dict['tbytes']
+    header_dict['ntraces'] = data.shape[1]
+    return data.reshape(data.shape[0],-1)
+
+def to_complex(data, imag=None, out=None):
+    """Return native-endian complex64 array from fid or real/imag data
+
+    Fid data points are interleaved real, imaginary pairs on the last axis.
+    Any integer or float input, big-endian included, is converted in a single
+    pass into the output array, without intermediate copies.
+
+    Args:
+        data -- interleaved data, or the real part if imag is given
+        imag -- (optional) imaginary part, same shape as data
+        out -- (optional) complex64 output array, eg. a scratch memmap
+    Return:
+        complex64 numpy.ndarray
+    """
+    data = np.asarray(data)
+    if imag is not None:
+        imag = np.asarray(imag)
+        if out is None:
+            out = np.empty(np.broadcast(data, imag).shape, dtype='complex64')
+        out.real = data
+        out.imag = imag
+        return out
+    if np.iscomplexobj(data):
+        if out is None:
+            return data.astype('complex64', copy=False)
+        out[...] = data
+        return out
+    if data.shape[-1] % 2 != 0:
+        raise(Exception('Odd number of points, data is not complex'))
+    if out is None:
+        out = np.empty(data.shape[:-1]+(data.shape[-1]//2,), dtype='complex64')
+    # casting and byteswapping happens during the assignment
+    out.view('float32').reshape(data.shape)[...] = data
+    return out
+
+def _complex_view(data):
+    """Return complex view of interleaved float data without copying
+
+    Byte order is kept, so a memory-mapped big-endian fid is not read.
+    Return None if the data cannot be viewed as complex.
+    """
+    if data.dtype.kind != 'f' or data.ndim == 0 or data.shape[-1] % 2 != 0:
+        return None
+    if data.strides[-1] != data.dtype.itemsize:
+        return None
+    dtype = np.dtype('c{}'.format(2*data.dtype.itemsize))
+    return data.view(dtype.newbyteorder(data.dtype.byteorder))
+
+def _fid_to_complex(data):
+    """Return complex fid data, kept on disk if 'out_of_core' is set
+
+    Out of core, memory-mapped float fid data is only viewed as complex,
+    other data is converted into a scratch memmap.
+    """
+    if vj.config['out_of_core'] != True:
+        return to_complex(data)
+    view = _complex_view(data)
+    if view is not None:
+        return view
+    shape = data.shape[:-1]+(data.shape[-1]//2,)
+    return to_complex(data, out=vj.core.utils.scratch_array(shape))
+
 def _get_arrayed_par_length(pd):
     """Return tuple of (name, length) of arrayed acquisition parameters
 
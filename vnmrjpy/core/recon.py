@@ -1,31 +1,395 @@
 import vnmrjpy as vj
 import numpy as np
+import scipy.fft
+import scipy.ndimage
+import functools
+import itertools
+import warnings
+from vnmrjpy.core.utils import vprint
 
 """
 Collection of basic functions for reconstruction.
 
+Fourier transforms go through a backend selected by 'fft_backend' in config:
+'numpy', 'scipy' (multithreaded by 'fft_workers') or 'pyfftw' (optional,
+multithreaded, with plan cache). Centered transforms use checkerboard
+modulation instead of fftshift and ifftshift on even sized axes, and are
+done in blocks over time and receivers to stay within 'fft_memory_limit'.
+
+Receiver combination is either sum of squares (ssos) or phase preserving
+adaptive combination (adaptive_combine).
+
 """
 
-def _ifft(data, dims):
-    """Take the inverse fourier transform of kspace data"""
-    data = np.fft.fftshift(data,axes=dims) 
-    if len(dims) == 2:
-        data = np.fft.ifft2(data,axes=dims,norm='ortho')
-    elif len(dims) == 3:
-        data = np.fft.ifftn(data,axes=dims,norm='ortho')
-    data = np.fft.ifftshift(data,axes=dims)
+def _get_fft_module(backend=None):
+    """Return (module, threaded) for the fft backend set in config"""
+    if backend is None:
+        backend = str(vj.config['fft_backend'])
+    if backend == 'numpy':
+        return (np.fft, False)
+    elif backend == 'scipy':
+        return (scipy.fft, True)
+    elif backend == 'pyfftw':
+        module = _load_pyfftw()
+        if module is None:
+            return (scipy.fft, True)
+        return (module, True)
+    else:
+        raise(Exception('Unknown fft_backend {}'.format(backend)))
+
+@functools.lru_cache(maxsize=None)
+def _load_pyfftw():
+    """Import pyfftw scipy interface and enable its plan cache"""
+    try:
+        import pyfftw
+        import pyfftw.interfaces.scipy_fft
+    except ImportError:
+        warnings.warn('pyfftw not found, using scipy.fft backend')
+        return None
+    pyfftw.interfaces.cache.enable()
+    return pyfftw.interfaces.scipy_fft
+
+def _backend_fft(name, data, s=None, axes=None, norm=None, overwrite=False,\
+                workers=None):
+    """Call fft function 'name' of the configured backend"""
+    (module, threaded) = _get_fft_module()
+    func = getattr(module, name)
+    if not threaded:
+        return func(data, s=s, axes=axes, norm=norm)
+    workers = vj.core.utils.get_workers(workers, key='fft_workers')
+    return func(data, s=s, axes=axes, norm=norm, overwrite_x=overwrite,\
+                workers=workers)
+
+def _fftn(data, axes, norm=None, overwrite=False, workers=None):
+    """Forward FFT along axes, keeps complex precision of data
+
+    Args:
+        data -- numpy.ndarray
+        axes -- tuple of axes to transform
+        norm -- None (numpy default) or 'ortho'
+        overwrite -- allow the backend to destroy data
+        workers -- threads, defaults to 'fft_workers' in config
+    Return:
+        transformed data
+    """
+    dtype = np.result_type(data.dtype, np.complex64)
+    out = _backend_fft('fftn', data, axes=axes, norm=norm, overwrite=overwrite,\
+                        workers=workers)
+    return out.astype(dtype, copy=False)
+
+def _ifftn(data, axes, norm=None, overwrite=False, workers=None):
+    """Inverse FFT along axes, keeps complex precision of data
+
+    Args:
+        data -- numpy.ndarray
+        axes -- tuple of axes to transform
+        norm -- None (numpy default) or 'ortho'
+        overwrite -- allow the backend to destroy data
+        workers -- threads, defaults to 'fft_workers' in config
+    Return:
+        transformed data
+    """
+    dtype = np.result_type(data.dtype, np.complex64)
+    out = _backend_fft('ifftn', data, axes=axes, norm=norm, overwrite=overwrite,\
+                        workers=workers)
+    return out.astype(dtype, copy=False)
+
+def _rfftn(data, s, axes, norm=None):
+    """Real input forward FFT along axes with backend"""
+    return _backend_fft('rfftn', data, s=s, axes=axes, norm=norm)
+
+def _irfftn(data, s, axes, norm=None):
+    """Real output inverse FFT along axes with backend"""
+    return _backend_fft('irfftn', data, s=s, axes=axes, norm=norm)
+
+@functools.lru_cache(maxsize=32)
+def _checkerboard(shape, dims, dtype):
+    """Return (pre, post) modulation replacing fftshift for even axes
+
+    For even N along an axis:
+        ifftshift(ifft(fftshift(x))) = (-1)**(N/2) * c * ifft(c * x)
+    with c = (-1)**n, and the same holds for fft.
+
+    Args:
+        shape -- shape of data
+        dims -- tuple of even sized axes
+        dtype -- real dtype of the modulation
+    Return:
+        (pre, post) -- read-only arrays broadcastable to shape
+    """
+    pre = np.ones([1]*len(shape), dtype=dtype)
+    sign = 1
+    for dim in dims:
+        n = shape[dim]
+        c_shape = [1]*len(shape)
+        c_shape[dim] = n
+        c = np.ones(n, dtype=dtype)
+        c[1::2] = -1
+        pre = pre * c.reshape(c_shape)
+        sign = sign * (-1)**(n//2)
+    post = pre * sign
+    pre.flags.writeable = False
+    post.flags.writeable = False
+    return (pre, post)
+
+def _fft_chunks(shape, dims, itemsize, limit):
+    """Return list of index tuples splitting data into blocks below limit
+
+    Axes not transformed are split starting from the first one (slices in
+    2D, readout after a readout transform in 3D, then time and receivers),
+    so each block still holds whole transform axes and is as contiguous as
+    possible, which matters for memory-mapped data.
+
+    Args:
+        shape -- shape of data
+        dims -- transformed axes
+        itemsize -- bytes per element of the transformed data
+        limit -- maximum bytes in a block, 0 or less means no limit
+    Return:
+        list of tuples of slices
+    """
+    block_bytes = itemsize * int(np.prod(shape))
+    steps = [None] * len(shape)
+    batch = [d for d in range(len(shape)) if d not in dims]
+    for axis in batch:
+        if limit <= 0 or block_bytes <= limit:
+            break
+        block_bytes = block_bytes // shape[axis]
+        steps[axis] = max(1, min(shape[axis], limit // max(block_bytes,1)))
+        block_bytes = block_bytes * steps[axis]
+    ranges = [[slice(None)] if step is None else \
+                [slice(i, min(i+step, n)) for i in range(0, n, step)] \
+                for (n, step) in zip(shape, steps)]
+    return list(itertools.product(*ranges))
+
+def _centered_fft(data, dims, inverse, overwrite=False):
+    """Centered orthonormal FFT in blocks, see _ifft and _fft
+
+    Blocks over the axes not transformed are kept within 'fft_memory_limit'
+    megabytes from config. With overwrite, blocks are transformed into data
+    in place, otherwise into a single preallocated output, which is a
+    scratch memmap if 'out_of_core' is set. If even whole transform axes do
+    not fit, the first axis (readout) is transformed first, then the rest
+    in slabs along it. Blocks are transformed in parallel when there are
+    at least as many as 'fft_workers', so up to that many blocks are in
+    memory at once.
+    """
+    dims = tuple(int(d) % data.ndim for d in dims)
+    dtype = np.result_type(data.dtype, np.complex64)
+    itemsize = np.dtype(dtype).itemsize
+    limit = int(float(vj.config['fft_memory_limit']) * 1024**2)
+    chunks = _fft_chunks(data.shape, dims, itemsize, limit)
+    if len(chunks) == 1:
+        return _centered_fft_block(data, dims, inverse, overwrite=overwrite)
+    block = data[chunks[0]]
+    if len(dims) > 1 and block.size * itemsize > limit:
+        data = _centered_fft(data, dims[:1], inverse, overwrite=overwrite)
+        return _centered_fft(data, dims[1:], inverse, overwrite=True)
+    vprint('fft in {} blocks'.format(len(chunks)))
+    if overwrite and data.dtype == dtype and data.flags.writeable:
+        out = data
+    else:
+        out = vj.core.utils.empty_array(data.shape, dtype=dtype)
+    workers = vj.core.utils.get_workers(key='fft_workers')
+    if len(chunks) >= workers > 1:
+        # independent blocks in parallel, each with a single threaded fft
+        fft_workers = 1
+    else:
+        (workers, fft_workers) = (1, None)
+
+    def _block(chunk):
+        out[chunk] = _centered_fft_block(data[chunk], dims, inverse, \
+                                overwrite=(out is data), workers=fft_workers)
+
+    vj.core.utils.run_parallel(_block, chunks, workers=workers)
+    return out
+
+def _centered_fft_block(data, dims, inverse, overwrite=False, workers=None):
+    """Centered orthonormal FFT of one block, see _ifft and _fft"""
+    even = tuple(d for d in dims if data.shape[d] % 2 == 0)
+    odd = tuple(d for d in dims if data.shape[d] % 2 == 1)
+    dtype = np.result_type(data.dtype, np.complex64)
+    if odd:
+        data = np.fft.fftshift(data, axes=odd)
+        overwrite = True
+    (pre, post) = _checkerboard(data.shape, even, np.finfo(dtype).dtype)
+    if overwrite and data.dtype == dtype and data.flags.writeable:
+        data *= pre
+    else:
+        data = np.multiply(data, pre, dtype=dtype)
+    if inverse:
+        data = _ifftn(data, dims, norm='ortho', overwrite=True, workers=workers)
+    else:
+        data = _fftn(data, dims, norm='ortho', overwrite=True, workers=workers)
+    data *= post
+    if odd:
+        data = np.fft.ifftshift(data, axes=odd)
     return data
 
-def _fft(data, dims):
-    """Take the inverse fourier transform of imagespace data"""
-    pass
+def _ifft(data, dims, overwrite=False):
+    """Take the inverse fourier transform of kspace data
+
+    Same as ifftshift(ifftn(fftshift(data))) with orthonormal scaling.
+
+    Args:
+        data -- kspace numpy.ndarray
+        dims -- axes to transform
+        overwrite -- allow data to be modified in place
+    Return:
+        imagespace numpy.ndarray
+    """
+    return _centered_fft(data, dims, inverse=True, overwrite=overwrite)
+
+def _fft(data, dims, overwrite=False):
+    """Take the fourier transform of imagespace data, inverse of _ifft
+
+    Args:
+        data -- imagespace numpy.ndarray
+        dims -- axes to transform
+        overwrite -- allow data to be modified in place
+    Return:
+        kspace numpy.ndarray
+    """
+    return _centered_fft(data, dims, inverse=False, overwrite=overwrite)
+
+def ssos(data,axis=4,weights=None):
+    """Return squared sum of squares combination of receiver data
 
-def ssos(data,axis=4):
-    """Return squared sum of squares combination of receiver data"""
+    Receivers are accumulated one by one as real**2 + imag**2 into a
+    preallocated float32 output, so temporaries are the size of one receiver.
+    Large data is processed in slabs along its first axis, and the output is
+    a scratch memmap if 'out_of_core' is set in config.
+
+    Args:
+        data -- complex or magnitude numpy.ndarray
+        axis -- receiver axis
+        weights -- optional real receiver weights, either 1D with one value
+                per receiver, or per voxel broadcastable to data
+    Return:
+        float32 numpy.ndarray of sqrt(sum(weights*|data|**2)) along axis
+    """
     # if 4 dim, just return the absolute
     if len(data.shape) == 4:
         return np.absolute(data)
-    else:
-        data = np.sqrt(np.sum(np.absolute(data)**2,axis=axis))
-        return np.array(data,dtype='float32')
-    
+    rcvrs = data.shape[axis]
+    data = np.moveaxis(data, axis, 0)
+    if weights is not None:
+        weights = np.asarray(weights)
+        if not (weights.ndim == 1 and weights.size == rcvrs):
+            weights = np.moveaxis(np.broadcast_to(weights, \
+                                    np.moveaxis(data, 0, axis).shape), axis, 0)
+    # slabs along the first axis keep memory bounded for memmap data
+    out = vj.core.utils.empty_array(data.shape[1:], dtype='float32')
+    n = data.shape[1]
+    step = vj.core.utils.get_slab_size(data.nbytes, n)
+    for start in range(0, n, step):
+        slab = slice(start, min(start+step, n))
+        acc = np.zeros(out[slab].shape, dtype='float32')
+        tmp = np.empty(out[slab].shape, dtype='float32')
+        for rcvr in range(rcvrs):
+            for part in _real_parts(data[rcvr, slab]):
+                np.multiply(part, part, out=tmp, casting='same_kind')
+                if weights is not None:
+                    tmp *= weights[rcvr] if weights.ndim == 1 \
+                            else weights[rcvr, slab]
+                acc += tmp
+        out[slab] = np.sqrt(acc, out=acc)
+    return out
+
+def _real_parts(data):
+    """Return real and imaginary part of complex data, or data if real"""
+    if np.iscomplexobj(data):
+        return (data.real, data.imag)
+    return (data,)
+
+def adaptive_combine(data, axis=4, block=4, smooth=3, return_sens=False):
+    """Return phase preserving adaptive (Walsh) combination of receiver data
+
+    Coil sensitivities are estimated as the dominant eigenvector of the
+    receiver covariance matrix. Covariances are summed over spatial blocks
+    and all time points on a grid downsampled by block, smoothed over
+    neighbouring blocks, eigendecomposed in one batch and interpolated back
+    to full resolution. The phase of the strongest receiver is kept.
+
+    Args:
+        data -- complex numpy.ndarray [read, phase, slice, time, rcvr]
+        axis -- receiver axis
+        block -- block size for the covariance grid, int or one per spatial
+                axis. Use 1 on the slice axis for 2D multislice data
+        smooth -- size of covariance smoothing in blocks
+        return_sens -- return the estimated sensitivities as well
+    Return:
+        combined -- complex64 numpy.ndarray without the receiver axis
+        sens -- (if return_sens) complex64 sensitivities, shape of data
+    """
+    if len(data.shape) == 4:
+        return data
+    data = np.moveaxis(data, axis, -1)
+    sens = _walsh_sensitivity(data, block, smooth)
+    combined = np.zeros(data.shape[:-1], dtype='complex64')
+    for rcvr in range(data.shape[-1]):
+        combined += np.conj(sens[...,rcvr])[...,None] * data[...,rcvr]
+    if return_sens:
+        sens = np.moveaxis(np.broadcast_to(sens[...,None,:], data.shape),\
+                            -1, axis)
+        return (combined, sens)
+    return combined
+
+def _walsh_sensitivity(data, block, smooth):
+    """Return unit norm sensitivities [read, phase, slice, rcvr] of data
+
+    Args:
+        data -- complex numpy.ndarray [read, phase, slice, time, rcvr]
+        block -- int or tuple of 3 block sizes
+        smooth -- smoothing size in blocks
+    """
+    spatial = data.shape[:3]
+    rcvrs = data.shape[-1]
+    if np.isscalar(block):
+        block = (block,)*3
+    block = tuple(max(1, min(int(b), n)) for (b, n) in zip(block, spatial))
+    low = tuple(-(-n // b) for (n, b) in zip(spatial, block))
+    # covariance R[c,d] = sum x_c conj(x_d) per block, one read block at a time
+    cov = np.empty(low + (rcvrs, rcvrs), dtype='complex64')
+    pad = [(0, l*b - n) for (n, b, l) in zip(spatial[1:], block[1:], low[1:])]
+    for i in range(low[0]):
+        x = data[i*block[0]:(i+1)*block[0]]
+        x = np.pad(x, [(0, block[0]-x.shape[0])] + pad + [(0,0),(0,0)])
+        x = x.reshape(block[0], low[1], block[1], low[2], block[2], -1, rcvrs)
+        x = x.transpose(1,3,0,2,4,5,6).reshape(low[1]*low[2], -1, rcvrs)
+        x = x.astype('complex64', copy=False)
+        r = np.matmul(x.transpose(0,2,1), np.conj(x))
+        cov[i] = r.reshape(low[1], low[2], rcvrs, rcvrs)
+    # smooth over neighbouring blocks where the grid is downsampled
+    size = [smooth if (b > 1 and l > 1) else 1 for (b, l) in zip(block, low)]
+    if max(size) > 1:
+        size = size + [1, 1]
+        cov = scipy.ndimage.uniform_filter(cov.real, size, mode='nearest') \
+            + 1j*scipy.ndimage.uniform_filter(cov.imag, size, mode='nearest')
+        cov = cov.astype('complex64')
+    (_, vecs) = np.linalg.eigh(cov)
+    sens = vecs[...,-1]
+    # remove eigenvector phase ambiguity by the strongest receiver
+    power = np.diagonal(cov, axis1=-2, axis2=-1).real.reshape(-1, rcvrs)
+    power = np.sum(power, axis=0)
+    ref = sens[...,int(np.argmax(power))]
+    sens = sens * np.exp(-1j*np.angle(ref))[...,None]
+    # linear interpolation to full grid, separable along spatial axes
+    for dim in range(3):
+        interp = _linear_interp_matrix(spatial[dim], block[dim], low[dim])
+        sens = np.moveaxis(np.tensordot(interp, sens, axes=(1, dim)), 0, dim)
+    norm = np.sqrt(np.sum(np.absolute(sens)**2, axis=-1, keepdims=True))
+    sens = sens / np.maximum(norm, np.finfo('float32').tiny)
+    return sens.astype('complex64')
+
+def _linear_interp_matrix(n, b, nlow):
+    """Return (n, nlow) linear interpolation from block centers to points"""
+    pos = (np.arange(n) + 0.5) / b - 0.5
+    pos = np.clip(pos, 0, nlow - 1)
+    lower = np.minimum(np.floor(pos).astype(int), max(nlow - 2, 0))
+    frac = pos - lower
+    interp = np.zeros((n, nlow), dtype='float32')
+    interp[np.arange(n), lower] = 1 - frac
+    if nlow > 1:
+        interp[np.arange(n), lower + 1] += frac
+    return interp
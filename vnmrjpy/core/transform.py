@@ -45,14 +45,15 @@ def _to_anatomical(varr):
     swapaxes, flipaxes = _anatomical_swaps(varr.pd)
     
     # setting data: 90deg rotation is done by swapping and flipping
-    oldaxes = [i for i in range(varr.data.ndim)]
+    # both are recorded on varr and applied once when data is accessed
+    oldaxes = [i for i in range(len(varr.shape))]
     newaxes = copy.copy(oldaxes)
     newaxes[0:3] = swapaxes
     #varr.data = np.moveaxis(varr.data, newaxes, oldaxes) 
-    varr.data = np.moveaxis(varr.data, oldaxes, newaxes) 
+    varr._lazy_moveaxis(oldaxes, newaxes)
     
     # ------flipping as part of rotation----------------------
-    varr.data = _flip_axes(varr.data,flipaxes)
+    varr._lazy_flip(flipaxes)
 
     # setting sdims
     #varr = _move_sdims(varr,new_sdims) 
@@ -212,10 +213,10 @@ def _flip_axis(varr,axis):
     """Flip data on axis 'x','y','z' or 'phase','read','slice'"""
     if axis in varr.dims:
         ax = varr.dims.index(axis)
-        varr.data = np.flip(varr.data,axis=ax)
+        varr._lazy_flip([ax])
     elif axis in varr.sdims:
         ax = varr.sdims.index(axis)
-        varr.data = np.flip(varr.data,axis=ax)
+        varr._lazy_flip([ax])
     else:
         raise(Exception('Axis not specified correctly'))
     
@@ -1,8 +1,10 @@
 import vnmrjpy as vj
 import os
 import json
+import tempfile
 import matplotlib.pyplot as plt
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 """
 Collection of unsorted utility functions and classes. Includes:
@@ -12,6 +14,9 @@ Functions:
     savepd -- save procpar dictionary to json
     loadpd -- load procpar dictionary from json
     change_procpar -- modify parameter value in procpar file
+    run_parallel -- map function over items in a thread pool
+    scratch_array -- temporary np.memmap in scratch directory
+    empty_array -- np.empty, or scratch_array if out of core is set
 
 Classes:
     FitViewer3D -- view 4D volume along with best fit on time axis
@@ -27,6 +32,69 @@ def vprint(string):
         pass
 
 
+def get_workers(workers=None, key='kspace_workers'):
+    """Return number of worker threads, 0 or None in config means all cores"""
+    if workers is None:
+        workers = vj.config[key]
+    workers = int(workers)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+def scratch_array(shape, dtype='complex64'):
+    """Return zero filled temporary np.memmap in 'scratch_dir' from config
+
+    The file is anonymous and removed when the array is garbage collected.
+    """
+    scratch_dir = os.path.expanduser(str(vj.config['scratch_dir']))
+    os.makedirs(scratch_dir, exist_ok=True)
+    vprint('making scratch array {} {} in {}'.format(shape,dtype,scratch_dir))
+    with tempfile.TemporaryFile(dir=scratch_dir) as f:
+        return np.memmap(f, dtype=dtype, mode='w+', shape=tuple(shape))
+
+def empty_array(shape, dtype='complex64'):
+    """Return np.empty, or scratch_array if 'out_of_core' is set in config"""
+    if vj.config['out_of_core'] == True:
+        return scratch_array(shape, dtype=dtype)
+    return np.empty(shape, dtype=dtype)
+
+def get_slab_size(nbytes, length, limit=None):
+    """Return number of axis elements per slab to keep within memory limit
+
+    Args:
+        nbytes -- total bytes of the array
+        length -- length of the slab axis
+        limit -- bytes, defaults to 'fft_memory_limit' in config (MB)
+    Return:
+        slab -- number of axis elements in one slab
+    """
+    if limit is None:
+        limit = int(float(vj.config['fft_memory_limit']) * 1024**2)
+    if limit <= 0 or nbytes <= limit:
+        return max(length, 1)
+    per = max(nbytes // max(length, 1), 1)
+    return max(1, min(length, limit // per))
+
+def run_parallel(func, items, workers=None):
+    """Return [func(item) for item in items], evaluated in a thread pool
+
+    Threads are used since the work is expected to be in numpy, which
+    releases the GIL. With 1 worker or 1 item no pool is started.
+
+    Args:
+        func -- function of one argument
+        items -- iterable of arguments
+        workers -- number of threads, defaults to 'kspace_workers' in config
+    Return:
+        list of results in the order of items
+    """
+    items = list(items)
+    workers = min(get_workers(workers), len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
+
 def getpetab(pd):
 
     pass 
@@ -120,7 +188,7 @@ def loadpd(infile):
     """Load procpar dictionary from json file"""
     with open(infile, 'r') as openfile:
         pd = json.load(openfile)
-    return pd
+    return vj.core.procpar.Procpar(pd)
 
 class FitViewer3D():
     """Draw a 3D volume along with regression lines and parameter maps
@@ -28,9 +28,9 @@ class varray():
                 nifti_header=None, space=None, intent=None,dtype=None,\
                 arrayed_params=[None,1], seqcon=None, apptype=None,\
                 vdtype=None, sdims=None, dims=None, description=None,\
-                fid_path=None):
+                fid_path=None, fid_blockheads=None):
 
-        # data stored in numpy nd.array
+        # data stored in numpy nd.array, with pending (axes, flips) transform
         self.data = data
         # procpar dictionary
         self.pd = pd
@@ -42,8 +42,10 @@ class varray():
         self.space = space
         # dtype in data
         self.dtype= dtype
-        # varian data type, 'imagespace' or 'kspace' or 'fid'
+        # varian data type, 'imagespace', 'hybridspace', 'kspace' or 'fid'
         self.vdtype = vdtype
+        # sdims already in image space if vdtype is 'hybridspace'
+        self.hybrid_dims = None
         # if kspace is zerofilled
         self.is_zerofilled = is_zerofilled
         # if kspace is complete
@@ -52,6 +54,8 @@ class varray():
         self.fid_path = fid_path
         # fid header dictionary if source is fid
         self.fid_header = fid_header
+        # structured array of fid block headers if source is fid
+        self.fid_blockheads = fid_blockheads
         # fdf dictionary if source is fdf
         self.fdf_header = fid_header
         # nifti header, can be constructed almost anytime
@@ -72,13 +76,89 @@ class varray():
         # optional string
         self.description = description
     
+    @property
+    def data(self):
+        """Data as numpy.ndarray, pending axis transforms applied as a view"""
+        if self._pending is not None:
+            (perm, flips) = self._pending
+            data = np.transpose(self._data, perm)
+            data = data[tuple(slice(None,None,-1) if flip else slice(None) \
+                                for flip in flips)]
+            self._data = data
+            self._pending = None
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._pending = None
+
+    @property
+    def shape(self):
+        """Shape of data without applying pending transforms"""
+        if self._pending is None:
+            return np.shape(self._data)
+        shape = np.shape(self._data)
+        return tuple(shape[i] for i in self._pending[0])
+
+    def _lazy_moveaxis(self, source, destination):
+        """Record np.moveaxis(data, source, destination) for later"""
+        ndim = len(self.shape)
+        order = [n for n in range(ndim) if n not in source]
+        for dest, src in sorted(zip(destination, source)):
+            order.insert(dest, src)
+        (perm, flips) = self._get_pending()
+        perm = tuple(perm[i] for i in order)
+        flips = tuple(flips[i] for i in order)
+        self._pending = (perm, flips)
+
+    def _lazy_flip(self, axes):
+        """Record np.flip(data, axis) on each of axes for later"""
+        (perm, flips) = self._get_pending()
+        flips = list(flips)
+        for ax in axes:
+            flips[ax] = not flips[ax]
+        self._pending = (perm, tuple(flips))
+
+    def _get_pending(self):
+        """Return pending (axes permutation, flips), identity if none"""
+        if self._pending is not None:
+            return self._pending
+        ndim = len(self.shape)
+        return (tuple(range(ndim)), (False,)*ndim)
+
+    @property
+    def nifti_header(self):
+        """Nifti header, built on first access after set_nifti_header"""
+        if self._nifti_stale:
+            self._nifti_stale = False
+            vj.core.niftitools._set_nifti_header(self)
+        return self._nifti_header
+
+    @nifti_header.setter
+    def nifti_header(self, header):
+        self._nifti_header = header
+        self._nifti_stale = False
+
+    @property
+    def pd(self):
+        """Procpar dictionary, see vj.core.procpar.Procpar"""
+        return self._pd
+
+    @pd.setter
+    def pd(self, pd):
+        if pd is not None:
+            pd = vj.core.procpar._as_procpar(pd)
+        self._pd = pd
+
     def flip_axis(self,axis):
         """Flip data on axis 'x','y','z' or 'phase','read','slice'"""
         return vj.core.transform._flip_axis(self,axis)        
 
     def set_nifti_header(self):
-
-        return vj.core.niftitools._set_nifti_header(self)
+        """Mark nifti header to be rebuilt for the current space on access"""
+        self._nifti_stale = True
+        return self
 
     def set_dims(self):
         """Set dims, meaning x,y,z axes order""" 
@@ -124,7 +204,7 @@ class varray():
 
     def to_kspace(self, raw=False, zerofill=True,
                     method='vnmrjpy',
-                    epiref_type='default',epinav='default'):
+                    epiref_type='default',epinav='default',epiref_key=None):
         """Build the k-space from the raw fid data and procpar.
 
         Raw fid_data is numpy.ndarray(blocks, traces * np) format. Should be
@@ -137,6 +217,9 @@ class varray():
             raw
             zerofill
             method -- 'xrecon', or 'vnmrjpy'
+            epiref_key -- if given, epi reference scan filters are cached
+                        under this key and reused for identical geometry,
+                        see vj.core.epitools.get_epiref_filters
 
 
         note:
@@ -146,79 +229,11 @@ class varray():
                 ([phase, read, slice, echo*time, rcvrs])
         """
         # ====================== Child functions, helpers======================
-        def _is_interleaved(ppdict):
-            res  = (int(ppdict['sliceorder']) == 1)
-            return res
-        def _is_evenslices(ppdict):
-            try:
-                res = (int(ppdict['ns']) % 2 == 0)
-            except:
-                res = (int(ppdict['pss']) % 2 == 0)
-            return res
         def make_im2D():
             """Child method of 'make', provides the same as vnmrj im2Drecon"""
-            p = self.pd 
-            rcvrs = int(p['rcvrs'].count('y'))
-            (read, phase, slices) = (int(p['np'])//2,int(p['nv']),int(p['ns']))
-            if 'ne' in p.keys():
-                echo = int(p['ne'])
-            else:
-                echo = 1
-            time = 1
-            # this is the old shape which worked, better to reshape at the end
-            finalshape = (rcvrs, phase, read, slices,echo*time*array_length)
-            final_kspace = np.zeros(finalshape,dtype='complex64')
-           
-            for i in range(array_length):
- 
-                kspace = self.data[i*blocks:(i+1)*blocks,...]
-
-                if p['seqcon'] == 'nccnn':
-                    shape = (rcvrs, phase, slices, echo*time, read)
-                    kspace = np.reshape(kspace, shape, order='C')
-                    kspace = np.moveaxis(kspace, [0,1,4,2,3], [0,1,2,3,4])
-                    
-
-                elif p['seqcon'] == 'nscnn':
-
-                    raise(Exception('not implemented'))
-
-                elif p['seqcon'] == 'ncsnn':
-
-                    preshape = (rcvrs, phase, slices*echo*time*read)
-                    shape = (rcvrs, phase, slices, echo*time, read)
-                    kspace = np.reshape(kspace, preshape, order='F')
-                    kspace = np.reshape(kspace, shape, order='C')
-                    kspace = np.moveaxis(kspace, [0,1,4,2,3], [0,1,2,3,4])
-
-                elif p['seqcon'] == 'ccsnn':
-
-                    preshape = (rcvrs, phase, slices*echo*time*read)
-                    shape = (rcvrs, phase, slices, echo*time, read)
-                    kspace = np.reshape(kspace, preshape, order='F')
-                    kspace = np.reshape(kspace, shape, order='C')
-                    kspace = np.moveaxis(kspace, [0,1,4,2,3], [0,1,2,3,4])
-                else:
-                    raise(Exception('Not implemented yet'))
-                if _is_interleaved(p): # 1 if interleaved slices
-                    if _is_evenslices(p):
-                        c = np.zeros(kspace.shape, dtype='complex64')
-                        c[...,0::2,:] = kspace[...,:slices//2,:]
-                        c[...,1::2,:] = kspace[...,slices//2:,:]
-                        kspace = c
-                    else:
-                        c = np.zeros(kspace.shape, dtype='complex64')
-                        c[...,0::2,:] = kspace[...,:(slices+1)//2,:]
-                        c[...,1::2,:] = kspace[...,(slices-1)//2+1:,:]
-                        kspace = c
-
-                final_kspace[...,i*echo*time:(i+1)*echo*time] = kspace
-
-            self.data = final_kspace
-            # additional reordering
-            self.data = np.moveaxis(self.data,[0,1,2,3,4],[4,1,0,2,3])
-            # swap axes 0 and 1 so phase, readout etc is the final order
-            self.data = np.swapaxes(self.data,0,1)
+            plan = vj.core.kplan.get_kspace_plan(self.pd, array_length,\
+                                                    self.data.shape)
+            self.data = vj.core.kplan.apply_kspace_plan(self.data, plan)
             return self
 
         def make_im2Dcs(**kwargs):
@@ -235,99 +250,48 @@ class varray():
         def make_im2Depi(**kwargs):
 
             p = self.pd
-            # count navigator echos, also there is a unused one
-            if p['navigator'] == 'y':
-                pluspe = 1 + int(p['nnav'])  # navigator echo + unused
-            else:
-                pluspe = 1  # unused only
-            
-            # init main params
-            # -------------------------------------------------------
-            comp_seg = p['cseg']
-            altread = p['altread']
-            nseg = int(p['nseg'])  # number of segments
-            etl = int(p['etl'])  # echo train length
-            kzero = int(p['kzero'])  
-            images = int(p['images'])  # repetitions
-            rcvrs = int(p['rcvrs'].count('y'))
-            time = len(p['image'])  # total volumes including references
-            npe = etl + pluspe  # total phase encode lines per shot
-            # getting phase encode scheme
-            if p['pescheme'] == 'l':
-                pescheme = 'linear'
-            elif p['pescheme'] == 'c':
-                pescheme = 'centric'
-            else:
-                pescheme = None
-            #TODO make petable?
-            if p['petable'] == 'y':
-                petab_file = None #TODO
-                phase_order = vj.core.epitools.\
-                            _get_phaseorder_frompetab(petab_file)
-            else:
-                phase_order = vj.core.epitools.\
-                            _get_phaseorder_frompar(nseg,npe,etl,kzero)
-
-            # init final shape
-            if int(p['pro']) != 0:
-                (read, phase, slices) = (int(p['nread']), \
-                                            int(p['nphase']), \
-                                            int(p['ns']))
-            else:
-                (read, phase, slices) = (int(p['nread'])//2, \
-                                            int(p['nphase']), \
-                                            int(p['ns']))
-            finalshape = (read, phase, slices,time*array_length, rcvrs)
+            geom = vj.core.epitools._epi_geometry(p)
+            (read, time, rcvrs) = (geom['read'], geom['time'], geom['rcvrs'])
+            finalshape = (read, geom['phase'], geom['slices'],\
+                            time*array_length, rcvrs)
             final_kspace = np.zeros(finalshape,dtype='complex64')
-            #navshape = (rcvrs, int(p['nnav']),read,slices,
+            #navshape = (rcvrs, p.getint('nnav'),read,slices,
             #        echo*time*array_length)
             #nav = np.zeros(navshape,dtype='complex64')  #full set of nav echos
 
             # sanity check
-            if int(self.fid_header['np']) != int((etl +pluspe)*read*2):
+            if int(self.fid_header['np']) != int(geom['npe']*read*2):
                 raise Exception("np and kspace format doesn't match")
 
-            for i in range(array_length):
- 
+            if p['seqcon'] != 'ncnnn':
+                raise(Exception('This seqcon not implemented in epip'))
+
+            def _make_epi_element(item):
+                """Arrange and correct one array element and receiver"""
+                (i, rcvr) = item
                 # arrange to kspace, but don't do corrections
                 kspace = self.data[i*blocks:(i+1)*blocks,...]
-
                 # this case repetitions are in different blocks
-                if p['seqcon'] == 'ncnnn':
-                
-                    #preshape = (rcvrs, time, nseg, slices, npe, read)
-                    preshape = (time, rcvrs, nseg, slices, npe, read)
-                    kspace = np.reshape(kspace, preshape, order='c')
-                    # utility swaps...
-                    kspace = np.swapaxes(kspace, 2,3)
-                    kspace = np.swapaxes(kspace, 0,1)
-                    # dims now: [rcvrs,time,nslices, nseg, phase, read]
-                    # reverse odd readout lines
-                    kspace = vj.core.epitools._reverse_odd(kspace,\
-                                                read_dim=5,phase_dim=4)
-                    # correct reversed echos for main ghost corr
-                    kspace = vj.core.epitools._navigator_scan_correct(kspace,p)
-                    # navigator correct
-                    # this is for intersegment, and additional ghost corr
-                    kspace = vj.core.epitools.\
-                            _navigator_echo_correct(kspace,npe,etl,method='single')
-                    # remove navigator echos 
-                    kspace = vj.core.epitools._remove_navigator_echos(kspace,etl)
-                    kspace = vj.core.epitools._zerofill(kspace, phase, nseg)
-                    # start combining segments
-                    kspace = vj.core.epitools._combine_segments(kspace,pescheme)
-                    # reshape to [read,phase,slice,time,rcvrs]
-                    kspace = vj.core.epitools._reshape_stdepi(kspace)
-                    # correct for interleaved slices
-                    kspace = vj.core.epitools._correct_ilepi(kspace,p)
-                    kspace = vj.core.epitools._refcorrect(\
-                                        kspace,p,method=epiref_type)
-
-                else:
-                    raise(Exception('This seqcon not implemented in epip'))
+                kspace = vj.core.epitools._epi_preshape(kspace, geom)
+                kspace = kspace[:,rcvr:rcvr+1,...]
+                # corrections are done in hybrid (x, ky) space, with a single
+                # readout transform in and out
+                kspace = vj.core.epitools._epi_to_hybrid(kspace)
+                # correct reversed echos for main ghost corr
+                key = None if epiref_key is None else (epiref_key, i, rcvr)
+                kspace = vj.core.epitools._navigator_scan_correct(kspace,p,\
+                                                                key=key)
+                kspace = vj.core.epitools._epi_from_hybrid(kspace, p, geom)
+                kspace = vj.core.epitools._refcorrect(\
+                                    kspace,p,method=epiref_type)
                 # -------------------epi kspace preprocessing------------------
                 # TODO check 'image' after array merginf
-                final_kspace[...,i*time:(i+1)*time,:] = kspace
+                final_kspace[...,i*time:(i+1)*time,rcvr:rcvr+1] = kspace
+
+            # array elements and receivers are independent
+            items = [(i, rcvr) for i in range(array_length) \
+                                for rcvr in range(rcvrs)]
+            vj.core.utils.run_parallel(_make_epi_element, items)
             # --------------------- kspace finished----------------------------
             self.data = final_kspace
             return self
@@ -335,130 +299,19 @@ class varray():
         def make_im2Depics():
             raise(Exception('not implemented'))
         def make_im2Dfse(**kwargs):
-
-            p = self.pd
-            #petab = vj.util.getpetab(self.procpar,is_procpar=True)
-            petab = vj.core.read_petab(self.pd)
-            nseg = int(p['nseg'])  # seqgments
-            etl = int(p['etl'])  # echo train length
-            kzero = int(p['kzero'])  
-            images = int(p['images'])  # repetitions
-            (read, phase, slices) = (int(p['np'])//2,int(p['nv']),int(p['ns']))
-
-            # setting time params
-            echo = 1
-            time = images
-
-            phase_sort_order = np.reshape(np.array(petab),petab.size,order='C')
-            # shift to positive
-            phase_sort_order = phase_sort_order + phase_sort_order.size//2-1
-
-            finalshape = (rcvrs, phase, read, slices,echo*time*array_length)
-            final_kspace = np.zeros(finalshape,dtype='complex64')
-           
-            for i in range(array_length):
- 
-                kspace = self.data[i*blocks:(i+1)*blocks,...]
-                if p['seqcon'] == 'nccnn':
-
-                    #TODO check for images > 1
-                    preshape = (rcvrs, phase//etl, slices, echo*time, etl, read)
-                    shape = (rcvrs, echo*time, slices, phase, read)
-                    kspace = np.reshape(kspace, preshape, order='C')
-                    kspace = np.swapaxes(kspace,1,3)
-                    kspace = np.reshape(kspace, shape, order='C')
-                    # shape is [rcvrs, phase, slices, echo*time, read]
-                    kspace = np.swapaxes(kspace,1,3)
-                    kspace_fin = np.zeros_like(kspace)
-                    kspace_fin[:,phase_sort_order,:,:,:] = kspace
-                    kspace_fin = np.moveaxis(kspace_fin, [0,1,4,2,3], [0,1,2,3,4])
-                    kspace = kspace_fin
-                else:
-                    raise(Exception('not implemented'))
-                
-                if _is_interleaved(p): # 1 if interleaved slices
-                    if _is_evenslices(p):
-                        c = np.zeros(kspace.shape, dtype='complex64')
-                        c[...,0::2,:] = kspace[...,:slices//2,:]
-                        c[...,1::2,:] = kspace[...,slices//2:,:]
-                        kspace = c
-                    else:
-                        c = np.zeros(kspace.shape, dtype='complex64')
-                        c[...,0::2,:] = kspace[...,:(slices+1)//2,:]
-                        c[...,1::2,:] = kspace[...,(slices-1)//2+1:,:]
-                        kspace = c
-            
-                final_kspace[...,i*echo*time:(i+1)*echo*time] = kspace
-
-            self.data = final_kspace
-            # additional reordering
-            self.data = np.moveaxis(self.data,[0,1,2,3,4],[4,1,0,2,3])
-            # swap axes 0 and 1 so phase, readout etc is the final order
-            self.data = np.swapaxes(self.data,0,1)
+            """Fast spin echo, phase encode order from petab"""
+            plan = vj.core.kplan.get_kspace_plan(self.pd, array_length,\
+                                                    self.data.shape)
+            self.data = vj.core.kplan.apply_kspace_plan(self.data, plan)
             return self
 
         def make_im2Dfsecs(**kwargs):
             raise(Exception('not implemented'))
         def make_im3D(**kwargs):
             """Child method of 'make', provides the same as vnmrj im3Drecon"""
-            p = self.pd 
-            rcvrs = int(p['rcvrs'].count('y'))
-            (read, phase, phase2) = (int(p['np'])//2,int(p['nv']),int(p['nv2']))
-            if 'ne' in p.keys():
-                echo = int(p['ne'])
-            else:
-                echo = 1
-            if 'images' in p.keys():
-                time = int(p['images'])
-            else:
-                time = 1
-
-            finalshape = (rcvrs, phase, read, phase2,echo*time*array_length)
-            final_kspace = np.zeros(finalshape,dtype='complex64')
-           
-            for i in range(array_length):
- 
-                kspace = self.data[i*blocks:(i+1)*blocks,...]
-
-                if p['seqcon'] == 'nccsn':
-                
-                    preshape = (rcvrs,phase2,phase*echo*time*read)
-                    shape = (rcvrs,phase2,phase,echo*time,read)
-                    kspace = np.reshape(kspace,preshape,order='F')
-                    kspace = np.reshape(kspace,shape,order='C')
-                    kspace = np.moveaxis(kspace, [0,2,4,1,3], [0,1,2,3,4])
-                    # what is this??
-                    #kspace = np.flip(kspace,axis=3)
-
-                if p['seqcon'] == 'ncccn':
-                    preshape = (rcvrs,phase2,phase*echo*time*read)
-                    shape = (rcvrs,phase,phase2,echo*time,read)
-                    kspace = np.reshape(kspace,preshape,order='F')
-                    kspace = np.reshape(kspace,shape,order='C')
-                    kspace = np.moveaxis(kspace, [0,2,4,1,3], [0,1,2,3,4])
-        
-                if p['seqcon'] == 'cccsn':
-                
-                    preshape = (rcvrs,phase2,phase*echo*time*read)
-                    shape = (rcvrs,phase,phase2,echo*time,read)
-                    kspace = np.reshape(kspace,preshape,order='F')
-                    kspace = np.reshape(kspace,shape,order='C')
-                    kspace = np.moveaxis(kspace, [0,2,4,1,3], [0,1,2,3,4])
-
-                if p['seqcon'] == 'ccccn':
-                    
-                    shape = (rcvrs,phase2,phase,echo*time,read)
-                    kspace = np.reshape(kspace,shape,order='C')
-                    kspace = np.moveaxis(kspace, [0,2,4,1,3], [0,1,2,3,4])
-
-                final_kspace[...,i*echo*time:(i+1)*echo*time] = kspace
-
-            self.data = final_kspace
-            # additional reordering
-            self.data = np.moveaxis(self.data,[0,1,2,3,4],[4,1,0,2,3])
-            # swap axes 0 and 1 so phase, readout etc is the final order
-            self.data = np.swapaxes(self.data,0,1)
-            
+            plan = vj.core.kplan.get_kspace_plan(self.pd, array_length,\
+                                                    self.data.shape)
+            self.data = vj.core.kplan.apply_kspace_plan(self.data, plan)
             return self
 
         def make_im3Dcs():
@@ -474,7 +327,7 @@ class varray():
                 which tells what lines are acquired in the phase1-phase2 plane
                 """
                 BITS = 32  # Skipint parameter is 32 bit encoded binary, see spinsights
-                skip_matrix = np.zeros([int(p['nv']), int(p['nv2'])])
+                skip_matrix = np.zeros([p.getint('nv'), p.getint('nv2')])
                 skipint = [int(x) for x in skipint]
                 skipint_bin_vals = [str(np.binary_repr(d, BITS)) for d in skipint]
                 skipint_bin_vals = ''.join(skipint_bin_vals)
@@ -505,16 +358,16 @@ class varray():
 
             kspace = self.pre_kspace
             p = self.p
-            (read, phase, phase2) = (int(p['np'])//2, \
-                                    int(p['nv']), \
-                                     int(p['nv2']))
+            (read, phase, phase2) = (p.getint('np')//2, \
+                                    p.getint('nv'), \
+                                     p.getint('nv2'))
 
             shiftaxis = (self.config['pe_dim'],\
                         self.config['ro_dim'],\
                         self.config['pe2_dim'])
 
             if 'ne' in p.keys():
-                echo = int(p['ne'])
+                echo = p.getint('ne')
             else:
                 echo = 1
 
@@ -543,11 +396,17 @@ class varray():
         # ========================== INIT =====================================
         # if data is not from fid, just fft it
         if self.vdtype == 'imagespace':
-            raise(Exception('not implemented yet'))        
-            #TODO something like this:
-
-            #self.data = vj.core.recon._fft(self.data,dims)
-            #self.vdype = 'kspace'                
+            self.data = vj.core.recon._fft(self.data,self._fft_dims(),\
+                                            overwrite=True)
+            self.vdtype = 'kspace'
+            return self
+        # from hybrid space only the axes in image space are transformed back
+        if self.vdtype == 'hybridspace':
+            self.data = vj.core.recon._fft(self.data,self._image_axes(),\
+                                            overwrite=True)
+            self.vdtype = 'kspace'
+            self.hybrid_dims = None
+            return self
 
         #=========================== Xrecon ===================================
         vprint(' making seqfil : {}'.format(self.pd['seqfil']))
@@ -566,8 +425,7 @@ class varray():
             # check if data is really from fid
             if self.vdtype is not 'fid':
                 raise(Exception('varray data is not fid data.'))
-            self.data = np.vectorize(complex)(self.data[:,0::2],\
-                                                    self.data[:,1::2])
+            self.data = vj.core.read._fid_to_complex(self.data)
             # check for arrayed parameters, save the length for later 
             array_length = reduce(lambda x,y: x*y, \
                             [i[1] for i in self.arrayed_params])
@@ -653,6 +511,97 @@ class varray():
         
         return self
 
+    def _fft_dims(self):
+        """Return axes of spatial fourier transform, hardcoded by 'seqfil'"""
+        seqfil = str(self.pd['seqfil'])
+        ro_dim = self.sdims.index('read')  # this should be default
+        pe_dim = self.sdims.index('phase')  # this should be default
+        pe2_dim = self.sdims.index('slice')  # slice dim is also pe2 dim
+        
+        sa = (ro_dim, pe_dim, pe2_dim)
+
+        if seqfil in ['gems', 'fsems', 'mems', 'sems', 'mgems']:
+            return sa[0:2]
+        elif seqfil in ['epip','epi']:
+            return sa[0:2]
+        elif seqfil in ['ge3d','fsems3d','mge3d']:
+            return sa
+        elif seqfil in ['ge3d_elliptical']:
+            return sa
+        else:
+            raise Exception('Sequence reconstruction not implemented yet')
+
+    def _image_axes(self):
+        """Return sorted tuple of axes currently in image space"""
+        if self.vdtype == 'imagespace':
+            return tuple(sorted(self._fft_dims()))
+        elif self.vdtype == 'hybridspace':
+            dims = self.hybrid_dims if self.hybrid_dims is not None \
+                                    else ['read']
+            return tuple(sorted(self.sdims.index(d) for d in dims))
+        elif self.vdtype in ['kspace','fid']:
+            return ()
+        else:
+            raise(Exception('Unknown vdtype {}'.format(self.vdtype)))
+
+    def to_hybridspace(self, dims=None):
+        """Transform to hybrid space, where only some dims are in image space
+
+        The default is the (x, ky) readout hybrid space. Each readout position
+        is then an independent 2D (phase, phase2) or 1D phase problem, see
+        iter_slabs. Only the axes not yet in the requested state are
+        transformed, the dims in image space are tracked in hybrid_dims.
+        Hybrid space data can be transformed further with to_imagespace or
+        back with to_kspace. The transform runs on the whole volume, memory
+        is only bounded with 'out_of_core' in config.
+
+        Args:
+            dims -- list of sdims names to have in image space, default
+                    ['read']
+        Updates attributes:
+            data, vdtype, hybrid_dims
+        """
+        if dims is None:
+            dims = ['read']
+        if self.vdtype == 'fid':
+            self.to_kspace()
+        fft_dims = self._fft_dims()
+        target = tuple(sorted(self.sdims.index(d) for d in dims))
+        if not set(target) <= set(fft_dims):
+            raise(Exception('Cannot transform dims {}'.format(dims)))
+        current = self._image_axes()
+        inverse = tuple(d for d in target if d not in current)
+        forward = tuple(d for d in current if d not in target)
+        if forward:
+            self.data = vj.core.recon._fft(self.data,forward,overwrite=True)
+        if inverse:
+            self.data = vj.core.recon._ifft(self.data,inverse,overwrite=True)
+        self.vdtype = 'hybridspace'
+        self.hybrid_dims = [self.sdims[d] for d in target]
+        return self
+
+    def iter_slabs(self, axis='read', size=1):
+        """Yield slabs of data along an axis as views
+
+        In hybrid space slabs along readout are independent problems, eg.
+        the (phase, phase2) fibers of 3D compressed sensing data. The slabs
+        are not handed to ALOHA, which takes the full k-space. Writing into
+        the yielded views updates the varray data.
+
+        Args:
+            axis -- name in sdims or axis number
+            size -- number of positions in one slab
+        Yield:
+            (index, slab) -- index tuple and the view data[index]
+        """
+        ax = self.sdims.index(axis) if isinstance(axis, str) else int(axis)
+        data = self.data
+        for start in range(0, data.shape[ax], size):
+            index = [slice(None)]*data.ndim
+            index[ax] = slice(start, min(start+size, data.shape[ax]))
+            index = tuple(index)
+            yield (index, data[index])
+
     def to_imagespace(self, method='vnmrjpy'):
         """ Reconstruct MR images to real space from k-space.
 
@@ -676,35 +625,16 @@ class varray():
 
         # =========================== Vnmrjpy custom fft ======================
         elif method == 'vnmrjpy':
-            seqfil = str(self.pd['seqfil'])
-            # this is for fftshift
-            ro_dim = self.sdims.index('read')  # this should be default
-            pe_dim = self.sdims.index('phase')  # this should be default
-            pe2_dim = self.sdims.index('slice')  # slice dim is also pe2 dim
-            
-            sa = (ro_dim, pe_dim, pe2_dim)
-
-            if seqfil in ['gems', 'fsems', 'mems', 'sems', 'mgems']:
-
-                self.data = vj.core.recon._ifft(self.data,sa[0:2])
-
-            elif seqfil in ['epip','epi']:
-
-                self.data = vj.core.recon._ifft(self.data,sa[0:2])
-
-            elif seqfil in ['ge3d','fsems3d','mge3d']:
-                
-                self.data = vj.core.recon._ifft(self.data,sa)
-
-            elif seqfil in ['ge3d_elliptical']:
-
-                self.data = vj.core.recon._ifft(self.data,sa)
-
-            else:
-                raise Exception('Sequence reconstruction not implemented yet')
+            dims = self._fft_dims()
+            if self.vdtype == 'hybridspace':
+                # skip the axes already in image space
+                done = self._image_axes()
+                dims = tuple(d for d in dims if d not in done)
+            self.data = vj.core.recon._ifft(self.data,dims,overwrite=True)
 
         # wrapping up
         self.vdtype = 'imagespace'
+        self.hybrid_dims = None
 
         return self
 
@@ -26,6 +26,7 @@ def write_nifti(varr,out, save_procpar=True,\
         out          -- output path
         save_procpar -- (boolean) saves procpar json in the same directory
         save_complex -- save complex data in real-imag pairs along a dimension
+        combine_rcvrs -- 'ssos', 'adaptive' or None
         only4dim     -- compress data into 4 dimensions , if possible
         
     """
@@ -43,12 +44,7 @@ def write_nifti(varr,out, save_procpar=True,\
     #------------------ making the Nifti affine and header-----------------
 
     # main write
-    if '.nii' in out:
-        out_name = str(out)
-    elif '.nii.gz' in out:
-        out_name = str(out[:-3])
-    else:
-        out_name = str(out)+'.nii'
+    out_name = _nifti_out_name(out)
   
     data = varr.data 
     
@@ -78,9 +74,13 @@ def write_nifti(varr,out, save_procpar=True,\
 
     # OPTION : combine_rcvrs---------------------------------------------------
 
-    if combine_rcvrs == 'ssos':
+    if combine_rcvrs in ['ssos','adaptive']:
 
-        data = vj.core.recon.ssos(data,axis=4)
+        if combine_rcvrs == 'ssos':
+            data = vj.core.recon.ssos(data,axis=4)
+        else:
+            data = vj.core.recon.adaptive_combine(data,axis=4)
+            data = np.absolute(data).astype('float32')
         # cut dimensions more than 3. This is mainly for use with certain FSL calls
         if cut_to_3d:
             if len(data.shape) == 4:
@@ -109,3 +109,79 @@ def write_nifti(varr,out, save_procpar=True,\
             # TODO consider saving only in json
             #warnings.warn('Could not copy procpar. Saved dictionary as json.')
 
+def write_nifti_series(volumes, out, combine_rcvrs='ssos', save_procpar=True):
+    """Write 4D Nifti1 file incrementally, one volume at a time.
+
+    Volumes are appended to the file as they come, eg. from
+    vj.core.epitools.iter_epi, so a long time series is written in constant
+    memory. The time dimension in the header is set after the last volume.
+
+    Args:
+        volumes -- iterable of vnmrjpy.varray, or of (index, varray) pairs,
+                   k-space volumes are transformed to imagespace
+        out -- output path
+        combine_rcvrs -- 'ssos', 'adaptive' or None for single receiver data
+        save_procpar -- (boolean) saves procpar json in the same directory
+    Return:
+        count -- number of volumes written
+    """
+    out_name = _nifti_out_name(out)
+    basedir = out_name.rsplit('/',1)[0]
+    if not os.path.exists(basedir):
+        os.makedirs(basedir)
+    (count, header, varr) = (0, None, None)
+    with open(out_name,'wb') as openfile:
+        for varr in volumes:
+            if isinstance(varr, tuple):
+                varr = varr[1]
+            if varr.vdtype != 'imagespace':
+                varr.to_imagespace()
+            data = varr.data
+            if combine_rcvrs == 'ssos':
+                data = vj.core.recon.ssos(data,axis=4)
+            elif combine_rcvrs == 'adaptive':
+                data = vj.core.recon.adaptive_combine(data,axis=4)
+                data = np.absolute(data).astype('float32')
+            elif data.ndim == 5 and data.shape[4] == 1:
+                data = data[...,0]
+            if data.ndim == 4 and data.shape[3] == 1:
+                data = data[...,0]
+            if data.ndim != 3:
+                raise(Exception('Volumes should be 3D after combining '\
+                                'receivers'))
+            if header is None:
+                header = varr.nifti_header.copy()
+                header.set_data_dtype(data.dtype)
+                header.set_data_shape(data.shape+(1,))
+                # leave space for the header, written after the last volume
+                offset = int(header.single_vox_offset)
+                header['vox_offset'] = offset
+                openfile.seek(offset)
+            elif data.shape != tuple(header.get_data_shape()[:3]):
+                raise(Exception('Volume shape changed in series'))
+            # nifti data is in fortran order, time is the slowest axis
+            openfile.write(np.asarray(data,dtype=header.get_data_dtype())\
+                                .tobytes(order='F'))
+            count += 1
+        if header is None:
+            raise(Exception('No volumes to write'))
+        header.set_data_shape(header.get_data_shape()[:3]+(count,))
+        openfile.seek(0)
+        header.write_to(openfile)
+    os.system('gzip -f '+str(out_name))
+    vprint('write_nifti_series : {} volumes saved to {}'\
+            .format(count, out_name))
+
+    if save_procpar:
+        vj.core.utils.savepd(varr.pd,out_name[:-3]+'json')
+    return count
+
+def _nifti_out_name(out):
+    """Return uncompressed .nii output path"""
+    if str(out).endswith('.nii.gz'):
+        return str(out)[:-3]
+    elif '.nii' in out:
+        return str(out)
+    else:
+        return str(out)+'.nii'
+
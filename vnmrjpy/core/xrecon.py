@@ -112,11 +112,11 @@ def loadfdf(varr, data='kspace', save_files=False):
             im = vj.read_fdf(img_IM[rcvr]).data
             fullshape = list(re.shape)+[len(img_IM)]
             fulldata = np.zeros(fullshape,dtype='complex64')
-            fulldata[...,0] = np.vectorize(complex)(re,im)
+            fulldata[...,0] = vj.core.read.to_complex(re,im)
             continue
         re = vj.read_fdf(img_RE[rcvr]).data
         im = vj.read_fdf(img_IM[rcvr]).data
-        fulldata[...,rcvr] = np.vectorize(complex)(re,im)
+        fulldata[...,rcvr] = vj.core.read.to_complex(re,im)
 
     # TODO fix this maybe?? 
     # changing read and phase dims for consistency with others
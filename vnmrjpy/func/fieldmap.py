@@ -40,7 +40,7 @@ def make_fieldmap(varr, mask=None, selfmask=True, combine_receivers=True, \
         # checking for echos
         time_dim = varr.data.shape[3]
         # calcin milliseconds
-        te = [float(i)*1000 for i in varr.pd['te']]
+        te = varr.pd.getarray('te')*1000
         phasedata = np.arctan2(np.imag(varr.data),np.real(varr.data))
         magnitudedata = np.abs(varr.data)
         phasedata.astype('float32')
@@ -58,7 +58,7 @@ def WASABI(varr, norm, mask='none'):
 
 
     # checking whether data is actually used for wasabi
-    if len(varr.pd['mtfrq']) == 1:
+    if varr.pd.getarray('mtfrq').size == 1:
         raise(Exception('Only one MT frequence is found. Cannot use WASABI'))
     # checking for imagespace
     if varr.vdtype != 'imagespace':
@@ -69,14 +69,12 @@ def WASABI(varr, norm, mask='none'):
     #-------------------------- actual satart----------------------------------
 
     gamma = 42.57747  # giromagnetic ratio in Hz/T
-    tp = float(varr.pd['pmt'])/10**6  # is in microsec initially, set to sec
-    flip1 = float(varr.pd['flip1'])*2*np.pi/360  #flip angle set to rad
-    flipmt = float(varr.pd['flipmt'])*2*np.pi/360  #mt flip angle set to rad
+    tp = varr.pd.getfloat('pmt')/10**6  # is in microsec initially, set to sec
+    flip1 = varr.pd.getfloat('flip1')*2*np.pi/360  #flip angle set to rad
+    flipmt = varr.pd.getfloat('flipmt')*2*np.pi/360  #mt flip angle set to rad
     B1 = flipmt / (2*np.pi*gamma*tp) # B1 in microT
     eps_data = 1 #TODO estimated uncertainty of data. get from noise
-    delta_w = []  # freq offsets
-    for item in varr.pd['mtfrq']:
-        delta_w.append(float(item))
+    delta_w = list(varr.pd.getarray('mtfrq'))  # freq offsets
     f_scale = 400  # frequency scaling, jsut for parameter estimation help
 
     print('flip1 {}'.format(flip1))
@@ -89,53 +89,17 @@ class FidReader():
     
         """
 
-        def chunks(l, n):
-            for i in range(0, len(l), n):
-                yield l[i:i + n]
-
-        chunk_size = int(self.header_dict['bbytes'])
-        block_list = list(chunks(self.bdata,chunk_size))
-
-        if self.header_dict['bbytes'] == len(block_list[0]):
-            #print('blocksize check OK')
-            pass
-
-        def decode_blockhead(blockheader):
-            bh_dict = {}
-            bhk_list = ['scale','status','index','mode','ctcount','lpval'\
-                        'rpval','lvl','tlt']
-            bhv_list = []
-            bhv_list.append(int.from_bytes(blockheader[0:2],byteorder='big'))
-            bhv_list.append(int.from_bytes(blockheader[2:4],byteorder='big'))
-            bhv_list.append(int.from_bytes(blockheader[4:6],byteorder='big'))
-            bhv_list.append(int.from_bytes(blockheader[6:8],byteorder='big'))
-            bhv_list.append(int.from_bytes(blockheader[8:12],byteorder='big'))
-            bhv_list.append(int.from_bytes(blockheader[12:16],byteorder='big'))
-            bhv_list.append(int.from_bytes(blockheader[16:20],byteorder='big'))
-            bhv_list.append(int.from_bytes(blockheader[20:24],byteorder='big'))
-            bhv_list.append(int.from_bytes(blockheader[24:28],byteorder='big'))
-
-            for num, i in enumerate(bhk_list):
-                bh_dict[i] = bhv_list[num]        
-            self.blockhead_dict = bh_dict
-
-        #------------main iteration through bytearray -----------------
-
-        dim = (int(self.header_dict['nblocks']),\
-                int((self.header_dict['ntraces'])*int(self.header_dict['np'])))
-        DATA = np.empty(dim)
-        if self.header_dict['ebytes'] == 4:
-            dt = '>f'
-        if self.header_dict['ebytes'] == 2:
-            dt = '>i2'
-        for k,block in enumerate(block_list): # for each block
-            block_header = block[:28] # separate block header
-            bh = decode_blockhead(block_header)
-            self.print_blockheader()
-            block_data = block[28:]
-            DATA[k,:] = np.frombuffer(bytearray(block_data),dt)
-
-        #self.blockhead_dict = decode_blockhead(block_header)
+        # decode all blocks at once
+        block_dt = vj.core.read._fid_block_dtype(self.header_dict)
+        nblocks = min(int(self.header_dict['nblocks']),\
+                        len(self.bdata) // block_dt.itemsize)
+        blocks = np.frombuffer(self.bdata, dtype=block_dt, count=nblocks)
+        self.blockheads = vj.core.read._decode_blockheads(blocks['blockhead'])
+        if self.blockheads is not None:
+            self.blockhead_dict = {key : self.blockheads[key][-1].item() \
+                                    for key in self.blockheads.dtype.names}
+        DATA = blocks['data'].astype('float64')
+
         return DATA, self.header_dict
 
     def print_header(self):
@@ -61,9 +61,7 @@ class KspaceMaker():
                             vj.config['ro_dim'],\
                             vj.config['slc_dim'],\
                             vj.config['et_dim'])
-        self.pre_kspace = np.vectorize(complex)(fid_data[:,0::2],\
-                                                fid_data[:,1::2])
-        self.pre_kspace = np.array(self.pre_kspace,dtype='complex64')
+        self.pre_kspace = vj.core.read.to_complex(fid_data)
         # check for arrayed parameters, save the length for later 
         self.array_length = vj.util.calc_array_length(fid_data.shape,procpar)
         self.blocks = fid_data.shape[0] // self.array_length
@@ -71,8 +71,8 @@ class AlohaTest():
         real = np.asarray(real)
         imag_orig = np.asarray(imag_orig)
         real_orig = np.asarray(real_orig)
-        kspace_cs = np.vectorize(complex)(real,imag)
-        kspace_orig = np.vectorize(complex)(real_orig,imag_orig)
+        kspace_cs = vj.core.read.to_complex(real,imag)
+        kspace_orig = vj.core.read.to_complex(real_orig,imag_orig)
         #
         
         # slicing k-space based on recontype
@@ -166,8 +166,8 @@ class AlohaTest():
         real = np.asarray(real)
         imag_orig = np.asarray(imag_orig)
         real_orig = np.asarray(real_orig)
-        kspace_cs = np.vectorize(complex)(real,imag)
-        kspace_orig = np.vectorize(complex)(real_orig,imag_orig)
+        kspace_cs = vj.core.read.to_complex(real,imag)
+        kspace_orig = vj.core.read.to_complex(real_orig,imag_orig)
 
         if SLC == 'all':
             return (kspace_orig,\